@@ -0,0 +1,55 @@
+"""
+Admin routes - captured request profiles. Every route requires the
+``X-Admin-Token`` header to match ``PROFILE_TOKEN``.
+"""
+import hmac
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from app.api.schemas import MessageResponse, ProfileInfo
+from app.core.config import PROFILE_TOKEN
+from app.services.profiling import ProfileStore, SortKey, get_profile_store, stats_text
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, PROFILE_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/profiles", response_model=List[ProfileInfo], summary="List captured profiles")
+async def list_profiles(store: ProfileStore = Depends(get_profile_store)) -> List[ProfileInfo]:
+    return [ProfileInfo(**info) for info in store.list()]
+
+@router.get(
+    "/profiles/{profile_id}",
+    summary="Download a profile (pstats file, or a text report with format=text)",
+    responses={200: {"content": {"application/octet-stream": {}, "text/plain": {}}}},
+)
+def download_profile(
+    profile_id: str,
+    format: str = "pstats",
+    sort: SortKey = "cumulative",
+    store: ProfileStore = Depends(get_profile_store),
+) -> Response:
+    entry = store.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown profile")
+    _, data = entry
+    if not data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Only timings were captured for this request (another profile was running)",
+        )
+    if format == "text":
+        return Response(stats_text(data, sort), media_type="text/plain")
+    return Response(
+        data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
+    )
+
+@router.delete("/profiles", response_model=MessageResponse, summary="Drop captured profiles")
+async def clear_profiles(store: ProfileStore = Depends(get_profile_store)) -> MessageResponse:
+    store.clear()
+    return MessageResponse(message="Profiles cleared")
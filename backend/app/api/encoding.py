@@ -0,0 +1,173 @@
+"""
+Stack response encoding - fast JSON, MessagePack and packed float64 bodies.
+
+Stack payloads are built from the calculator's own values, so they are encoded
+directly instead of being re-validated through the Pydantic response models
+(which remain the documented schema). Float stacks arrive as a float64
+``memoryview`` and large ones are encoded from the buffer through numpy, without
+a Python float per value. The media type is negotiated from the ``Accept``
+header:
+
+- ``application/json`` (default): orjson when installed, else the stdlib
+- ``application/msgpack``: the same payload as MessagePack (needs ``msgpack``)
+- ``application/x-float64``: the values (the whole stack, or the pushed values of
+  a delta) as packed little-endian float64, with the other fields in
+  ``X-Stack-*`` headers; float mode only
+"""
+import json
+import sys
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException, Response, status
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None  # type: ignore[assignment]
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None  # type: ignore[assignment]
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+FLOAT64 = "application/x-float64"
+
+# Media types this process can produce, in order of preference for wildcards
+MEDIA_TYPES: Tuple[str, ...] = (JSON, FLOAT64) + ((MSGPACK,) if msgpack is not None else ())
+
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/octet-stream": FLOAT64}
+
+# Below this many values converting a buffer to a list is cheaper than wrapping it in numpy
+_NUMPY_MIN_VALUES = 128
+
+def _from_buffer(values: Any) -> bool:
+    return np is not None and isinstance(values, memoryview) and len(values) >= _NUMPY_MIN_VALUES
+
+def _default(value: Any) -> Any:
+    """Encode float64 buffers (``memoryview``), which the JSON encoders do not support."""
+    if isinstance(value, memoryview):
+        if orjson is not None and _from_buffer(value):
+            return np.frombuffer(value, dtype=np.float64)
+        return value.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(payload: Any) -> bytes:
+    """``payload`` as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":"), default=_default).encode()
+
+def _msgpack_floats(values: memoryview) -> bytes:
+    """MessagePack array items for float64 ``values``: each is 0xcb then big-endian float64."""
+    items = np.empty(len(values), dtype=[("tag", "u1"), ("value", ">f8")])
+    items["tag"] = 0xCB
+    items["value"] = np.frombuffer(values, dtype=np.float64)
+    return items.tobytes()
+
+def packb(payload: Dict[str, Any]) -> bytes:
+    """``payload`` as MessagePack (needs ``msgpack``)."""
+    packer = msgpack.Packer(default=_default)
+    parts = [packer.pack_map_header(len(payload))]
+    for name, value in payload.items():
+        parts.append(packer.pack(name))
+        if _from_buffer(value):
+            parts.append(packer.pack_array_header(len(value)))
+            parts.append(_msgpack_floats(value))
+        else:
+            parts.append(packer.pack(value))
+    return b"".join(parts)
+
+def pack_float64(values: Iterable[float]) -> bytes:
+    """``values`` as packed little-endian float64, copied as is from a float64 buffer."""
+    if isinstance(values, memoryview):
+        if sys.byteorder == "little":
+            return values.tobytes()
+        packed = array("d")
+        packed.frombytes(values)
+    else:
+        packed = array("d", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+def _accepted(accept: str) -> List[str]:
+    """Media types of an ``Accept`` header, most preferred first (q=0 dropped)."""
+    ranked = []
+    for index, item in enumerate(accept.split(",")):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            ranked.append((-quality, index, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(ranked)]
+
+def _is_binary(media_type: str) -> bool:
+    """Whether ``media_type`` is a binary format (not text, JSON or XML, nor a wildcard)."""
+    if media_type.startswith("text/") or "*" in media_type:
+        return False
+    return "json" not in media_type and "xml" not in media_type
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    The response media type for an ``Accept`` header. Types we cannot produce
+    fall back to JSON (browsers and tools send text/html or text/plain), unless
+    the header lists only binary formats: then the client could not read JSON
+    and gets a 406.
+    """
+    if not accept:
+        return JSON
+    accepted = _accepted(accept)
+    for media_type in accepted:
+        media_type = _ALIASES.get(media_type, media_type)
+        if media_type in MEDIA_TYPES:
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return JSON
+    if accepted and all(map(_is_binary, accepted)):
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"Acceptable stack encodings: {', '.join(MEDIA_TYPES)}",
+        )
+    return JSON
+
+def encode(
+    payload: Dict[str, Any],
+    media_type: str = JSON,
+    values: str = "stack",
+    status_code: int = status.HTTP_200_OK,
+) -> Response:
+    """
+    Response carrying ``payload`` in ``media_type``. For packed float64 the
+    ``values`` field is the body and the other fields become ``X-Stack-<Field>``
+    headers; its values must be floats.
+    """
+    if media_type == FLOAT64:
+        headers = {
+            f"X-Stack-{name.capitalize()}": str(value)
+            for name, value in payload.items()
+            if name != values
+        }
+        try:
+            body = pack_float64(payload[values])
+        except TypeError:
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=f"{FLOAT64} responses are only available in float mode",
+            ) from None
+        return Response(body, status_code, headers, media_type)
+    if media_type == MSGPACK:
+        return Response(packb(payload), status_code, media_type=media_type)
+    return Response(dumps(payload), status_code, media_type=JSON)
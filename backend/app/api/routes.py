@@ -1,137 +1,612 @@
 """
 REST API routes for the RPN Calculator.
+
+Session handlers are ``async``: they run on the event loop instead of the
+threadpool, and ``async_stack_session`` serializes requests per session.
+CPU-heavy endpoints that touch no session (vectorized eval) stay sync.
 """
-from fastapi import APIRouter, HTTPException, status, Depends
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    status,
+    Depends,
+    Header,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import StreamingResponse
+from app.api import encoding
 from app.api.schemas import (
     PushValueRequest,
     StackResponse,
+    StackDeltaResponse,
+    OperationResponse,
+    EvalRequest,
+    EvalResponse,
+    JobRequest,
+    JobResults,
+    JobStatus,
+    NumericMode,
+    OperatorInfo,
+    ReduceRequest,
+    ProgramCacheStats,
+    ResultCacheStats,
+    HistoryItem,
+    HistoryResponse,
+    SessionStats,
+    VectorEvalRequest,
+    VectorEvalResponse,
     MessageResponse,
     ErrorResponse,
 )
-from app.services.stack_service import StackService, get_stack_service
-from app.core.exceptions import (
-    InsufficientOperandsError,
-    DivisionByZeroError,
-    InvalidOperationError,
-    RPNCalculatorError,
+from app.services.jobs import Job, JobQueueFullError, JobRunner, get_job_runner, result_dict
+from app.services.metrics import ROUTE_KEY, get_metrics
+from app.services.profiling import phase
+from app.services.result_cache import ResultCache, current_result_cache
+from app.services.session_store import SessionStore
+from app.services.stack_service import (
+    StackService,
+    async_stack_session,
+    current_program_cache,
+    current_session_store,
+    get_session_locks,
 )
+from app.domain.compiler import ProgramCache
+from app.domain.numeric import FLOAT
+from app.domain.operators import OPERATIONS, OPERATORS
+from app.domain.vectorized import NUMPY_AVAILABLE, evaluate_vectorized
+from app.core.config import BULK_PUSH_MAX_BYTES, BULK_PUSH_MAX_VALUES
+from app.core.exceptions import RPNCalculatorError
 
 router = APIRouter()
 
+StackResponseModel = Union[StackResponse, StackDeltaResponse]
+OperationResponseModel = Union[OperationResponse, StackDeltaResponse]
+
+def operator_route(name: str) -> str:
+    """Metrics route label of an operator applied through ``POST /op/{name}``."""
+    return f"op_{name}"
+
+_OPERATOR_INFO = [
+    OperatorInfo(
+        name=op.name,
+        aliases=list(op.aliases),
+        operands=op.consumed,
+        variadic=op.variadic,
+        summary=op.summary,
+    )
+    for op in OPERATORS.values()
+]
+
 # ---------- Helpers ----------
-def _stack_response(service: StackService) -> StackResponse:
-    calc = service.calculator
-    return StackResponse(stack=calc.stack, size=calc.size())
+def _stack_response(
+    service: StackService,
+    delta: bool = False,
+    media_type: str = encoding.JSON,
+    status_code: int = status.HTTP_200_OK,
+    result: bool = False,
+) -> Response:
+    """
+    A ``StackResponse`` (or ``StackDeltaResponse``) encoded straight from the
+    session's values, skipping response model validation. With ``result`` it
+    is an ``OperationResponse``, which adds the top of the stack.
+    """
+    with phase("response"):
+        if delta:
+            payload = service.last_delta()
+            return encoding.encode(payload, media_type, "pushed", status_code)
+        with service.view() as stack:
+            payload = {"stack": stack, "size": len(stack), "revision": service.operation_count}
+            if result:
+                payload["result"] = stack[-1] if len(stack) else None
+            return encoding.encode(payload, media_type, "stack", status_code)
+
+async def wants_delta(
+    delta: bool = Query(False, description="Return only what changed on the stack"),
+    x_stack_response: Optional[str] = Header(None, description='"delta" for delta responses'),
+) -> bool:
+    return delta or x_stack_response == "delta"
+
+async def stack_media_type(
+    accept: Optional[str] = Header(
+        None,
+        description="application/json (default), application/msgpack or application/x-float64",
+    ),
+    service: StackService = Depends(async_stack_session),
+) -> str:
+    """Negotiated stack encoding, checked before the request changes the session."""
+    media_type = encoding.negotiate(accept)
+    if media_type == encoding.FLOAT64 and service.numeric is not FLOAT:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"{encoding.FLOAT64} responses are only available in float mode",
+        )
+    return media_type
 
 def _raise_400(exc: Exception):
+    get_metrics().count_error(exc)
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
 # ---------- Stack ----------
 @router.post(
     "/stack",
-    response_model=StackResponse,
+    response_model=StackResponseModel,
     status_code=status.HTTP_201_CREATED,
     summary="Push a value onto the stack",
 )
-def push_value(
+async def push_value(
     request: PushValueRequest,
-    service: StackService = Depends(get_stack_service),
-) -> StackResponse:
-    service.calculator.push(request.value)
-    return _stack_response(service)
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    try:
+        service.perform("push", request.value)
+    except (RPNCalculatorError, ValueError) as e:
+        _raise_400(e)
+    return _stack_response(service, delta, media_type, status.HTTP_201_CREATED)
+
+_BULK_MEDIA_TYPES = ("application/octet-stream", "application/json", "text/csv", "text/plain")
+
+def _bulk_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {BULK_PUSH_MAX_VALUES} values per request",
+    )
+
+async def _bulk_body(request: Request, media_type: str) -> bytes:
+    """
+    The body of a bulk push, refused with a 413 as soon as it is known to be
+    too large: from its Content-Length, else while it streams in.
+    """
+    if media_type not in _BULK_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content type: {media_type or 'none'}",
+        )
+    limit = BULK_PUSH_MAX_BYTES
+    if media_type == "application/octet-stream":
+        limit = 8 * BULK_PUSH_MAX_VALUES
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise _bulk_too_large()
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise _bulk_too_large()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def _bulk_values(media_type: str, body: bytes) -> Union[List[Any], bytes]:
+    """The values of a bulk push body: a list, or packed float64 bytes."""
+    if media_type == "application/octet-stream":
+        return body
+    if media_type == "application/json":
+        values = json.loads(body)
+        # Numbers only: not booleans (an int subclass) nor numeric strings
+        if not isinstance(values, list) or not all(type(v) in (int, float) for v in values):
+            raise ValueError("Expected a JSON array of numbers")
+        return values
+    return body.decode().replace(",", " ").split()
+
+@router.post(
+    "/stack/bulk",
+    response_model=StackResponseModel,
+    status_code=status.HTTP_201_CREATED,
+    summary="Push many values: a JSON array, CSV text or little-endian float64 bytes",
+    responses={413: {"model": ErrorResponse}, 415: {"model": ErrorResponse}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": {}}},
+                "text/csv": {"schema": {"type": "string"}},
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def push_values(
+    request: Request,
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await _bulk_body(request, content_type)
+    try:
+        values = _bulk_values(content_type, body)
+    except ValueError as e:
+        _raise_400(e)
+    count = len(values) // 8 if isinstance(values, bytes) else len(values)
+    if count > BULK_PUSH_MAX_VALUES:
+        raise _bulk_too_large()
+    try:
+        service.push_many(values)
+    except RPNCalculatorError as e:
+        _raise_400(e)
+    return _stack_response(service, delta, media_type, status.HTTP_201_CREATED)
 
 @router.get(
     "/stack",
     response_model=StackResponse,
-    summary="Get the current stack",
+    summary="Get the current stack (full resync, including its revision)",
 )
-def get_stack(
-    service: StackService = Depends(get_stack_service),
-) -> StackResponse:
-    return _stack_response(service)
+async def get_stack(
+    service: StackService = Depends(async_stack_session),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    return _stack_response(service, media_type=media_type)
 
 @router.delete(
     "/stack",
     response_model=MessageResponse,
     summary="Clear the stack",
 )
-def clear_stack(
-    service: StackService = Depends(get_stack_service),
+async def clear_stack(
+    service: StackService = Depends(async_stack_session),
 ) -> MessageResponse:
-    service.calculator.clear()
+    service.perform("clear")
     return MessageResponse(message="Stack cleared successfully")
 
-# ---------- Basic operations (+, -, *, /) ----------
-@router.post("/op/add", response_model=StackResponse, summary="Addition (+)")
-def op_add(service: StackService = Depends(get_stack_service)) -> StackResponse:
+# ---------- Operators ----------
+@router.get("/ops", response_model=List[OperatorInfo], summary="List the available operators")
+async def list_operators() -> List[OperatorInfo]:
+    return _OPERATOR_INFO
+
+@router.post(
+    "/op/{name}",
+    response_model=OperationResponseModel,
+    summary="Apply an operator by name or alias (add, +, sub, sqrt, pow, rot, sum, ...)",
+    responses={404: {"model": ErrorResponse}},
+)
+async def apply_operator(
+    name: str,
+    request: Request,
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    operation = OPERATIONS.get(name.lower())
+    if operation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown operator: {name}"
+        )
+    request.scope[ROUTE_KEY] = operator_route(operation)
     try:
-        service.calculator.add()
-        return _stack_response(service)
-    except InsufficientOperandsError as e:
+        service.perform(operation)
+    except RPNCalculatorError as e:
         _raise_400(e)
+    return _stack_response(service, delta, media_type, result=True)
 
-@router.post("/op/sub", response_model=StackResponse, summary="Subtraction (-)")
-def op_sub(service: StackService = Depends(get_stack_service)) -> StackResponse:
+@router.post(
+    "/stack/reduce",
+    response_model=StackResponseModel,
+    summary="Fold the top n values (or the whole stack) with sum, product, mean or stddev",
+)
+async def reduce_stack(
+    request: ReduceRequest,
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
     try:
-        service.calculator.subtract()
-        return _stack_response(service)
-    except InsufficientOperandsError as e:
+        service.reduce(request.op, request.count)
+    except RPNCalculatorError as e:
         _raise_400(e)
+    return _stack_response(service, delta, media_type)
 
-@router.post("/op/mul", response_model=StackResponse, summary="Multiplication (*)")
-def op_mul(service: StackService = Depends(get_stack_service)) -> StackResponse:
+# ---------- Batch evaluation ----------
+@router.post("/eval", response_model=EvalResponse, summary="Evaluate a whole RPN program")
+async def eval_program(
+    request: EvalRequest,
+    service: StackService = Depends(async_stack_session),
+    cache: ProgramCache = Depends(current_program_cache),
+    results: ResultCache = Depends(current_result_cache),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    if request.trace and media_type == encoding.FLOAT64:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"Traces are not available as {encoding.FLOAT64}",
+        )
     try:
-        service.calculator.multiply()
-        return _stack_response(service)
-    except InsufficientOperandsError as e:
+        program = cache.get(request.program)
+        steps = service.evaluate(program, trace=request.trace, results=results)
+    except RPNCalculatorError as e:
         _raise_400(e)
+    with phase("response"):
+        trace = None
+        if request.trace:
+            trace = [{"token": t, "stack": s} for t, s in zip(program.tokens, steps)]
+        with service.view() as stack:
+            payload: Dict[str, Any] = {"stack": stack, "size": len(stack)}
+            if media_type != encoding.FLOAT64:
+                payload["trace"] = trace
+            return encoding.encode(payload, media_type)
 
-@router.post("/op/div", response_model=StackResponse, summary="Division (/)")
-def op_div(service: StackService = Depends(get_stack_service)) -> StackResponse:
+@router.post(
+    "/eval/stream",
+    response_model=StackResponseModel,
+    summary="Evaluate an RPN program streamed in the request body (any size)",
+    responses={400: {"model": ErrorResponse}},
+    openapi_extra={
+        "requestBody": {"required": True, "content": {"text/plain": {"schema": {"type": "string"}}}}
+    },
+)
+async def eval_stream(
+    request: Request,
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    """
+    Tokens run as the body arrives, so the program is never held in memory.
+    The evaluation is atomic and logged as one history entry.
+    """
     try:
-        service.calculator.divide()
-        return _stack_response(service)
-    except (InsufficientOperandsError, DivisionByZeroError, RPNCalculatorError) as e:
+        with service.streaming() as evaluator:
+            async for chunk in request.stream():
+                evaluator.feed(chunk)
+    except RPNCalculatorError as e:
         _raise_400(e)
+    return _stack_response(service, delta, media_type)
 
-# ---------- Advanced operations (sqrt, pow, power, swap, dup, drop) ----------
-@router.post("/op/sqrt", response_model=StackResponse, summary="Square root (√)")
-def op_sqrt(service: StackService = Depends(get_stack_service)) -> StackResponse:
+@router.post(
+    "/eval/vector",
+    response_model=VectorEvalResponse,
+    summary="Evaluate a program over columns of inputs",
+)
+def eval_vector(
+    request: VectorEvalRequest,
+    cache: ProgramCache = Depends(current_program_cache),
+) -> VectorEvalResponse:
+    if not NUMPY_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Vectorized evaluation requires numpy",
+        )
     try:
-        service.calculator.sqrt()
-        return _stack_response(service)
-    except (InsufficientOperandsError, InvalidOperationError) as e:
+        result = evaluate_vectorized(cache.get(request.program), request.columns)
+    except RPNCalculatorError as e:
         _raise_400(e)
+    return VectorEvalResponse(
+        stack=result.columns(),
+        size=len(result.stack),
+        rows=result.rows,
+        division_by_zero=result.division_by_zero.nonzero()[0].tolist(),
+        invalid_operation=result.invalid_operation.nonzero()[0].tolist(),
+    )
 
-@router.post("/op/pow", response_model=StackResponse, summary="Power (x^y)")
-@router.post("/op/power", response_model=StackResponse, summary="Power (x^y) [alias]")
-def op_power(service: StackService = Depends(get_stack_service)) -> StackResponse:
+@router.get(
+    "/eval/cache", response_model=ProgramCacheStats, summary="Program and result cache stats"
+)
+async def eval_cache_stats(
+    cache: ProgramCache = Depends(current_program_cache),
+    results: ResultCache = Depends(current_result_cache),
+) -> ProgramCacheStats:
+    return ProgramCacheStats(**cache.stats(), results=ResultCacheStats(**results.stats()))
+
+# ---------- Batch jobs ----------
+def _job(runner: JobRunner, job_id: str) -> Job:
+    job = runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job")
+    return job
+
+@router.post(
+    "/jobs",
+    response_model=JobStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Evaluate many independent programs in worker processes",
+    responses={503: {"model": ErrorResponse}},
+)
+def submit_job(request: JobRequest, runner: JobRunner = Depends(get_job_runner)) -> JobStatus:
+    numeric = request.numeric or NumericMode(mode="float")
+    tasks = [(task.program, task.stack) for task in request.tasks]
     try:
-        service.calculator.power()
-        return _stack_response(service)
-    except (InsufficientOperandsError, InvalidOperationError) as e:
+        job = runner.submit(tasks, numeric.mode, numeric.precision, request.chunk_size)
+    except ValueError as e:
         _raise_400(e)
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
+    return JobStatus(**job.status())
+
+@router.get("/jobs/{job_id}", response_model=JobStatus, summary="Progress of a job")
+async def get_job(job_id: str, runner: JobRunner = Depends(get_job_runner)) -> JobStatus:
+    return JobStatus(**_job(runner, job_id).status())
+
+@router.get(
+    "/jobs/{job_id}/results",
+    response_model=JobResults,
+    summary="Results of a job in task order (null for tasks still pending)",
+)
+async def get_job_results(job_id: str, runner: JobRunner = Depends(get_job_runner)) -> Response:
+    return encoding.encode(_job(runner, job_id).snapshot())
+
+@router.get(
+    "/jobs/{job_id}/stream",
+    summary="Results of a job as they complete, one JSON object per line",
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def stream_job_results(
+    job_id: str, runner: JobRunner = Depends(get_job_runner)
+) -> StreamingResponse:
+    job = _job(runner, job_id)
+
+    async def lines() -> AsyncIterator[bytes]:
+        async for start, results in job.completed_chunks():
+            yield b"".join(
+                encoding.dumps({"index": index, **result_dict(result)}) + b"\n"
+                for index, result in enumerate(results, start)
+            )
 
-@router.post("/op/swap", response_model=StackResponse, summary="Swap top 2")
-def op_swap(service: StackService = Depends(get_stack_service)) -> StackResponse:
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.delete("/jobs/{job_id}", response_model=MessageResponse, summary="Cancel and forget a job")
+async def delete_job(job_id: str, runner: JobRunner = Depends(get_job_runner)) -> MessageResponse:
+    if not runner.cancel(job_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job")
+    return MessageResponse(message=f"Job {job_id} cancelled")
+
+# ---------- History ----------
+@router.get("/history", response_model=HistoryResponse, summary="List stack versions")
+async def get_history(
+    service: StackService = Depends(async_stack_session),
+) -> HistoryResponse:
+    items = [HistoryItem(**item) for item in service.history()]
+    return HistoryResponse(version=service.version, items=items)
+
+@router.post(
+    "/history/{version}/restore",
+    response_model=StackResponseModel,
+    summary="Jump to a stack version",
+)
+async def restore_version(
+    version: int,
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
+    try:
+        service.jump(version)
+        return _stack_response(service, delta, media_type)
+    except ValueError as e:
+        get_metrics().count_error(e)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@router.post("/undo", response_model=StackResponseModel, summary="Undo the last operation")
+async def undo(
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
     try:
-        service.calculator.swap()
-        return _stack_response(service)
-    except InsufficientOperandsError as e:
+        service.perform("undo")
+        return _stack_response(service, delta, media_type)
+    except ValueError as e:
         _raise_400(e)
 
-@router.post("/op/dup", response_model=StackResponse, summary="Duplicate top")
-def op_dup(service: StackService = Depends(get_stack_service)) -> StackResponse:
+@router.post("/redo", response_model=StackResponseModel, summary="Redo the last undone operation")
+async def redo(
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
     try:
-        service.calculator.dup()
-        return _stack_response(service)
-    except InsufficientOperandsError as e:
+        service.perform("redo")
+        return _stack_response(service, delta, media_type)
+    except ValueError as e:
         _raise_400(e)
 
-@router.post("/op/drop", response_model=StackResponse, summary="Drop top")
-def op_drop(service: StackService = Depends(get_stack_service)) -> StackResponse:
+# ---------- Sessions ----------
+@router.delete("/session", response_model=MessageResponse, summary="End a session")
+async def delete_session(
+    session_id: str = "default",
+    store: SessionStore = Depends(current_session_store),
+) -> MessageResponse:
+    if not await store.adelete(session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown session")
+    return MessageResponse(message=f"Session {session_id} deleted")
+
+@router.get("/session/numeric", response_model=NumericMode, summary="Numeric mode of a session")
+async def get_numeric_mode(
+    service: StackService = Depends(async_stack_session),
+) -> NumericMode:
+    return NumericMode(mode=service.numeric.name, precision=service.numeric.precision)
+
+@router.put(
+    "/session/numeric",
+    response_model=StackResponseModel,
+    summary="Switch a session to float, decimal, fraction or integer arithmetic",
+)
+async def set_numeric_mode(
+    request: NumericMode,
+    service: StackService = Depends(async_stack_session),
+    delta: bool = Depends(wants_delta),
+    media_type: str = Depends(stack_media_type),
+) -> Response:
     try:
-        service.calculator.drop()
-        return _stack_response(service)
+        service.set_numeric(request.mode, request.precision)
     except RPNCalculatorError as e:
         _raise_400(e)
+    return _stack_response(service, delta, media_type)
+
+@router.get("/sessions/stats", response_model=SessionStats, summary="Session registry metrics")
+def session_stats(store: SessionStore = Depends(current_session_store)) -> SessionStats:
+    return SessionStats(**store.stats())
+
+# ---------- WebSocket ----------
+_WS_COMMANDS = {"push", "clear", "undo", "redo"}
+
+def _ws_handle(message: Dict[str, Any], service: StackService, cache: ProgramCache) -> Dict[str, Any]:
+    if "program" in message:
+        service.evaluate(cache.get(message["program"]))
+        return service.last_delta()
+    op = str(message.get("op", ""))
+    if op == "sync":
+        stack = service.values()
+        return {"stack": stack, "size": len(stack), "revision": service.operation_count}
+    if op == "push":
+        if "value" not in message:
+            raise ValueError("push requires a value")
+        service.perform("push", message["value"])
+    elif op in _WS_COMMANDS:
+        service.perform(op)
+    elif op.lower() in OPERATIONS:
+        service.perform(OPERATIONS[op.lower()])
+    else:
+        raise ValueError(f"Unknown operation: {op!r}")
+    return service.last_delta()
+
+@router.websocket("/ws")
+async def stack_websocket(
+    websocket: WebSocket,
+    session_id: str = "default",
+    store: SessionStore = Depends(current_session_store),
+    cache: ProgramCache = Depends(current_program_cache),
+) -> None:
+    """
+    Interactive session over one connection. Each JSON message is either
+    ``{"op": "push", "value": 3}``, ``{"op": "add"}`` (any operator name, or
+    clear/undo/redo), ``{"program": "1 2 +"}`` or ``{"op": "sync"}``. Replies are
+    stack deltas (see StackDeltaResponse), the full stack for ``sync``, or
+    ``{"error": ...}``; an ``id`` field is echoed back.
+    """
+    await websocket.accept()
+    lock = get_session_locks().get(session_id)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"error": "Expected a JSON object"})
+                continue
+            async with lock, store.alock(session_id):
+                service = await store.aload(session_id)
+                revision = service.operation_count
+                try:
+                    reply = _ws_handle(message, service, cache)
+                except (RPNCalculatorError, ArithmeticError, ValueError, TypeError) as e:
+                    get_metrics().count_error(e)
+                    reply = {"error": str(e), "revision": service.operation_count}
+                if service.operation_count != revision:
+                    await store.asave(service)
+            if "id" in message:
+                reply["id"] = message["id"]
+            await websocket.send_text(encoding.dumps(reply).decode())
+    except WebSocketDisconnect:
+        pass
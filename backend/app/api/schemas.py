@@ -1,19 +1,180 @@
 """
 Pydantic models for request/response validation and OpenAPI documentation.
 """
-from typing import List
+from typing import Dict, List, Literal, Optional, Union
 from pydantic import BaseModel, Field
+from app.core.config import JOBS_MAX_TASKS
+from app.domain.numeric import MAX_DECIMAL_PRECISION
+from app.services.jobs import MAX_CHUNK_SIZE
+
+# Stack values: floats, or strings in the decimal, fraction and integer modes
+Number = Union[float, str]
 
 class PushValueRequest(BaseModel):
-    value: float = Field(..., description="Numeric value to push onto the stack")
+    value: Number = Field(
+        ...,
+        description='Numeric value to push; strings ("0.1", "1/3") keep their exact digits '
+        "in the decimal, fraction and integer modes",
+    )
 
 class StackResponse(BaseModel):
-    stack: List[float]
+    stack: List[Number]
+    size: int
+    revision: int = Field(0, description="Session operation counter, increases on every change")
+
+class OperationResponse(StackResponse):
+    result: Optional[Number] = Field(
+        ..., description="Top of the stack after the operation (null if it left the stack empty)"
+    )
+
+class StackDeltaResponse(BaseModel):
+    revision: int = Field(..., description="Revision after the change; resync with GET /stack on a gap")
+    popped: int = Field(..., description="Number of values removed from the top")
+    pushed: List[Number] = Field(..., description="Values then appended, bottom first")
+    size: int
+
+class EvalRequest(BaseModel):
+    program: Union[str, List[Union[float, str]]] = Field(
+        ..., description='RPN program, as a string ("5 3 + 2 *") or a list of tokens'
+    )
+    trace: bool = Field(False, description="Include the stack after each token")
+
+class EvalStep(BaseModel):
+    token: Union[float, str]
+    stack: List[Number]
+
+class EvalResponse(BaseModel):
+    stack: List[Number]
     size: int
+    trace: Optional[List[EvalStep]] = None
+
+class NumericMode(BaseModel):
+    mode: Literal["float", "decimal", "fraction", "integer"] = Field(
+        ..., description="Value type of the session's stack"
+    )
+    precision: Optional[int] = Field(
+        None,
+        ge=1,
+        le=MAX_DECIMAL_PRECISION,
+        description="Significant digits in decimal mode (server default when omitted)",
+    )
+
+class OperatorInfo(BaseModel):
+    name: str
+    aliases: List[str]
+    operands: int = Field(..., description="Values taken from the stack (besides n if variadic)")
+    variadic: bool = Field(..., description="Takes a count n from the top of the stack")
+    summary: str = Field(..., description="Stack effect, before -- after")
+
+class ReduceRequest(BaseModel):
+    op: Literal["sum", "product", "mean", "stddev"] = Field(
+        ..., description="Reduction folding the values into one (stddev is the sample one)"
+    )
+    count: Optional[int] = Field(
+        None, ge=0, description="Number of values from the top (the whole stack when omitted)"
+    )
+
+class JobTask(BaseModel):
+    program: Union[str, List[Union[float, str]]] = Field(..., description="RPN program")
+    stack: List[Number] = Field(
+        default_factory=list, description="Initial stack of this task, bottom first"
+    )
+
+class JobRequest(BaseModel):
+    tasks: List[JobTask] = Field(..., min_length=1, max_length=JOBS_MAX_TASKS)
+    numeric: Optional[NumericMode] = Field(None, description="Numeric mode (float by default)")
+    chunk_size: Optional[int] = Field(
+        None, ge=1, le=MAX_CHUNK_SIZE, description="Tasks per worker round trip (auto by default)"
+    )
+
+class JobStatus(BaseModel):
+    id: str
+    status: Literal["running", "done"]
+    total: int
+    completed: int
+    failed: int = Field(..., description="Completed tasks that raised an error")
+
+class JobResult(BaseModel):
+    stack: Optional[List[Number]] = Field(None, description="Final stack of a successful task")
+    error: Optional[str] = None
+
+class JobResults(JobStatus):
+    results: List[Optional[JobResult]] = Field(
+        ..., description="One entry per task, in task order; null while pending"
+    )
+
+class VectorEvalRequest(BaseModel):
+    program: Union[str, List[Union[float, str]]] = Field(
+        ..., description="RPN program applied to every input row"
+    )
+    columns: List[List[float]] = Field(
+        default_factory=list,
+        description="Input columns pushed as the initial stack (bottom first), one value per row",
+    )
+
+class VectorEvalResponse(BaseModel):
+    stack: List[List[Optional[float]]] = Field(
+        ..., description="Final stack slots as columns; null where the row failed"
+    )
+    size: int
+    rows: int
+    division_by_zero: List[int] = Field(..., description="Rows that divided by zero")
+    invalid_operation: List[int] = Field(..., description="Rows with an invalid sqrt/power")
+
+class ResultCacheStats(BaseModel):
+    size: int
+    maxsize: int
+    bytes: int = Field(..., description="Approximate memory held by cached results")
+    max_bytes: Optional[int] = None
+    ttl: Optional[float] = Field(None, description="Seconds a result stays cached")
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    expirations: int
+
+class ProgramCacheStats(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    results: Optional[ResultCacheStats] = Field(
+        None, description="Memoized /eval results per (program, inputs)"
+    )
+
+class HistoryItem(BaseModel):
+    version: int
+    operation: str
+    size: int
+    current: bool
+
+class HistoryResponse(BaseModel):
+    version: int = Field(..., description="Version the stack is currently at")
+    items: List[HistoryItem]
+
+class SessionStats(BaseModel):
+    backend: str
+    live_sessions: int
+    bytes: Optional[int] = Field(None, description="Approximate memory held by live sessions")
+    evictions: Optional[int] = None
+    expirations: Optional[int] = None
+    max_sessions: Optional[int] = None
+    max_bytes: Optional[int] = None
+    fsync: Optional[str] = Field(None, description="Journal fsync policy")
+    syncs: Optional[int] = None
+    replayed: Optional[int] = Field(None, description="Journal records replayed since startup")
+    faults: Optional[int] = Field(None, description="Sessions paged in from disk")
+    spills: Optional[int] = Field(None, description="Evicted sessions compacted to disk")
 
-class OperationResponse(BaseModel):
-    result: float
-    stack: List[float]
+class ProfileInfo(BaseModel):
+    id: str
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    phases_ms: Dict[str, float] = Field(..., description="Time spent per request phase")
+    profiled: bool = Field(..., description="False when only timings were captured")
+    created_at: str
 
 class MessageResponse(BaseModel):
     message: str
@@ -1,4 +1,73 @@
+import os
+
 APP_NAME = "RPN Calculator API"
 APP_VERSION = "1.0.0"
 APP_DESCRIPTION = "Reverse Polish Notation calculator (stack-based) with REST API"
 API_PREFIX = "/api/v1"
+
+# Number of compiled RPN programs kept by the /eval LRU cache (0 disables caching)
+PROGRAM_CACHE_SIZE = int(os.getenv("PROGRAM_CACHE_SIZE", "4096"))
+
+# Results of /eval memoized per (program, inputs): entries (0 disables the cache), approximate
+# memory, and seconds an entry stays valid (0: until evicted)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300")) or None
+
+# Most values accepted by one bulk push (POST /stack/bulk), and the largest JSON or CSV
+# body read for one (float64 bodies are capped at 8 bytes per value); bigger bodies are
+# refused before they are read
+BULK_PUSH_MAX_VALUES = int(os.getenv("BULK_PUSH_MAX_VALUES", "1000000"))
+BULK_PUSH_MAX_BYTES = int(os.getenv("BULK_PUSH_MAX_BYTES", str(32 * BULK_PUSH_MAX_VALUES)))
+
+# Web worker processes of the server (gunicorn reads the same variable); each one has its
+# own job pool
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Batch jobs (POST /jobs): worker processes per web worker (0: the cores divided among the
+# WEB_CONCURRENCY web workers), finished jobs kept for polling, jobs queued or running at
+# once per web worker (more are refused with a 503), and most tasks per job
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "0")) or max(
+    1, (os.cpu_count() or 1) // max(1, WEB_CONCURRENCY)
+)
+JOBS_KEEP = int(os.getenv("JOBS_KEEP", "100"))
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "16"))
+JOBS_MAX_TASKS = int(os.getenv("JOBS_MAX_TASKS", "100000"))
+
+# Significant digits of sessions switched to decimal mode without an explicit precision
+DECIMAL_PRECISION = int(os.getenv("DECIMAL_PRECISION", "28"))
+
+# Session storage: "memory" (per process), "journal" (per process, persisted to JOURNAL_DIR),
+# "manager" (multiprocessing manager shared by the workers of one host) or "redis"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_MANAGER_ADDRESS = os.getenv("SESSION_MANAGER_ADDRESS", "127.0.0.1:50055")
+# Shared secret of the manager server; required by the "manager" backend
+SESSION_MANAGER_AUTHKEY = os.getenv("SESSION_MANAGER_AUTHKEY", "")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Shared backends lease a session to one request at a time; a lease left by a worker
+# that died is freed after SESSION_LOCK_TTL seconds
+SESSION_LOCK_TTL = float(os.getenv("SESSION_LOCK_TTL", "30"))
+# Journal backend: fsync policy "always" (every operation), "batch" (group commit every
+# JOURNAL_FSYNC_BATCH records) or "interval" (at most every JOURNAL_FSYNC_INTERVAL seconds);
+# sessions are compacted into a snapshot every JOURNAL_COMPACT_EVERY records
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "data/sessions")
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "batch")
+JOURNAL_FSYNC_BATCH = int(os.getenv("JOURNAL_FSYNC_BATCH", "64"))
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1"))
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "1000"))
+# Idle sessions expire after SESSION_TTL seconds (0 disables expiry)
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600")) or None
+# Bounds of the in-process session registry; least recently used sessions are evicted first
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# Directory for per-worker metric files when running several worker processes
+# (empty: metrics are kept in process memory)
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+# Request profiling: requests carrying "X-Profile: <PROFILE_TOKEN>" are profiled, plus a
+# random PROFILE_SAMPLE_RATE fraction of all requests; the token also guards the admin
+# endpoints (empty: header profiling and admin endpoints disabled)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Number of captured profiles kept for download
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
@@ -21,3 +21,7 @@ class EmptyStackError(RPNCalculatorError):
 class InvalidOperationError(RPNCalculatorError):
     """Raised when an operation produces an invalid result."""
     pass
+
+class InvalidTokenError(RPNCalculatorError):
+    """Raised when a program contains a token that is neither a number nor an operator."""
+    pass
@@ -0,0 +1,343 @@
+"""
+RPN program compiler - tokenize and validate once, execute many times.
+
+A program is compiled into a flat array of (handler, argument) pairs: operator
+dispatch is resolved up front, literals are parsed to float (or, for the other
+numeric backends, to their type on first use), and the stack depth each operator
+needs is checked statically so it is verified once per run instead of once per
+operator. Compiling only rejects tokens that are neither operators nor numbers;
+whether a literal is valid ("1/3" is a fraction, not a float) is up to the
+backend that runs it.
+
+Programs run more than once use code rewritten by ``app.domain.optimizer``
+(constant folding, reuse of values already on the stack), built per numeric
+backend on the second run: optimizing costs about as much as compiling, which a
+single run would not recoup. Traced runs execute every token as written.
+"""
+import math
+from collections import OrderedDict
+from fractions import Fraction
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from app.core.exceptions import RPNCalculatorError, InvalidTokenError
+from app.domain.numeric import FLOAT, NumericBackend
+from app.domain.operators import (
+    OPERATIONS,
+    OPERATORS,
+    Handler,
+    Operator,
+    Stack,
+    depth_error,
+)
+from app.domain.optimizer import Instruction, optimize
+
+Token = Union[str, float]
+Program = Union[str, Sequence[Token]]
+ProgramKey = Union[str, Tuple[Token, ...]]
+Code = Tuple[Tuple[Handler, Any], ...]
+
+def tokenize(program: Program) -> List[Token]:
+    """Split an RPN program ("5 3 + 2 *" or a token list) into tokens."""
+    if isinstance(program, str):
+        return list(program.split())
+    return list(program)
+
+def _push(s: Stack, value: Any) -> None:
+    s.append(value)
+
+def _checked(s: Stack, instruction: Tuple[Handler, Operator]) -> None:
+    """Run an operator whose operands could not be counted at compile time."""
+    handler, op = instruction
+    if len(s) < op.consumed:
+        raise depth_error(op.name, op.consumed, len(s))
+    handler(s, None)
+
+class CompiledProgram:
+    """Pre-resolved RPN program, safe to share and run many times."""
+
+    __slots__ = (
+        "source",
+        "tokens",
+        "names",
+        "required",
+        "dynamic",
+        "reads_depth",
+        "optimize",
+        "_needs",
+        "_code",
+        "_float_error",
+        "_checked",
+        "_static",
+        "_codes",
+        "_optimized",
+        "_normalized",
+    )
+
+    def __init__(self, source: Program, optimize: bool = True) -> None:
+        self.source = source
+        self.optimize = optimize
+        self.tokens = tokenize(source)
+        literals: Dict[int, float] = {}
+        float_error: Optional[str] = None  # the first literal that is not a finite float
+        names: List[str] = []
+        needs: List[Tuple[int, str, int, int]] = []  # (index, name, consumed, depth before)
+        checked: List[int] = []  # operators checked at run time
+        depth = 0
+        required = 0
+        dynamic = False
+        static = len(self.tokens)  # index of the first variadic operator
+        for index, token in enumerate(self.tokens):
+            name, value = _resolve(token, index)
+            if name is None:
+                if value is None:
+                    float_error = float_error or _float_error(token, index)
+                else:
+                    literals[index] = value
+                names.append("push")
+                depth += 1
+                continue
+            op = OPERATORS[name]
+            names.append(name)
+            # Past a variadic operator the depth is only known at run time
+            if op.variadic and not dynamic:
+                dynamic = True
+                static = index
+            if dynamic:
+                if not op.variadic:
+                    checked.append(index)
+                continue
+            needs.append((index, name, op.consumed, depth))
+            required = max(required, op.consumed - depth)
+            depth += op.produced - op.consumed
+        self.names = tuple(names)
+        self.required = required
+        self.dynamic = dynamic
+        # Results of programs using depth depend on the stack size, not just their operands
+        self.reads_depth = "depth" in self.names
+        self._needs = needs
+        self._checked = frozenset(checked)
+        self._static = static
+        self._codes: Dict[str, Code] = {}
+        # None once run unoptimized, until the second run builds the optimized code
+        self._optimized: Dict[str, Optional[Tuple[Code, Tuple[int, ...]]]] = {}
+        self._float_error = float_error
+        self._code: Optional[Code] = None
+        if float_error is None:
+            self._code = self._assemble(FLOAT, self._instructions(literals.__getitem__))
+        self._normalized: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def code(self) -> Code:
+        """The float code; raises ``InvalidTokenError`` if a literal is not a finite float."""
+        if self._code is None:
+            raise InvalidTokenError(self._float_error)
+        return self._code
+
+    @property
+    def normalized(self) -> str:
+        """The program text with operators by canonical name ("2 3 +" -> "2 3 add")."""
+        if self._normalized is None:
+            self._normalized = " ".join(
+                str(token) if name == "push" else name
+                for token, name in zip(self.tokens, self.names)
+            )
+        return self._normalized
+
+    def _instructions(self, literal: Any) -> List[Instruction]:
+        return [
+            (name, literal(index) if name == "push" else None, index)
+            for index, name in enumerate(self.names)
+        ]
+
+    def _assemble(self, numeric: NumericBackend, instructions: List[Instruction]) -> Code:
+        code: List[Tuple[Handler, Any]] = []
+        handlers = numeric.handlers
+        for name, value, index in instructions:
+            if name == "push":
+                code.append((_push, value))
+            elif index in self._checked:
+                code.append((_checked, (handlers[name], OPERATORS[name])))
+            else:
+                code.append((handlers[name], None))
+        return tuple(code)
+
+    def check_depth(self, size: int) -> None:
+        """
+        Raise the error the first under-supplied operator would raise (up to the
+        first variadic operator; later ones are checked as they run).
+        """
+        if size >= self.required:
+            return
+        for index, name, consumed, offset in self._needs:
+            available = size + offset
+            if available < consumed:
+                error = depth_error(name, consumed, available)
+                raise type(error)(f"{error} (token {index}: {self.tokens[index]!r})")
+
+    def code_for(self, numeric: NumericBackend) -> Code:
+        """
+        The code with ``numeric``'s handlers and its literals parsed by it, built
+        on first use per backend (``code`` is the float one).
+        """
+        if numeric is FLOAT:
+            return self.code
+        code = self._codes.get(numeric.key)
+        if code is None:
+            def literal(index: int) -> Any:
+                try:
+                    return numeric.parse(self.tokens[index])
+                except RPNCalculatorError as e:
+                    raise type(e)(f"{e} (token {index})") from None
+
+            code = self._assemble(numeric, self._instructions(literal))
+            self._codes[numeric.key] = code
+        return code
+
+    def optimized_for(self, numeric: NumericBackend = FLOAT) -> Tuple[Code, Tuple[int, ...]]:
+        """
+        The optimized code for ``numeric`` and, per instruction, the index of the
+        token it came from (for error messages); built on first use per backend.
+        """
+        optimized = self._optimized.get(numeric.key)
+        if optimized is None:
+            code = self.code_for(numeric)
+            instructions = optimize(
+                self._instructions(lambda index: code[index][1]),
+                numeric.handlers,
+                self._static,
+                self.required,
+            )
+            optimized = self._assemble(numeric, instructions), tuple(i for _, _, i in instructions)
+            self._optimized[numeric.key] = optimized
+        return optimized
+
+    def run(
+        self, stack: Stack, trace: bool = False, numeric: Optional["NumericBackend"] = None
+    ) -> List[List[Any]]:
+        """
+        Execute against ``stack`` in place (float values, or ``numeric``'s). Not
+        atomic: on error the stack is left as it was after the last successful
+        token (see ``RPNCalculator.run``). ``trace`` runs the unoptimized code and
+        returns the stack after each token; other runs after the first use
+        ``optimized_for``.
+        """
+        numeric = numeric or FLOAT
+        positions: Optional[Tuple[int, ...]] = None
+        if trace or not self.optimize:
+            code = self.code_for(numeric)
+        elif numeric.key in self._optimized:
+            code, positions = self.optimized_for(numeric)
+        else:
+            self._optimized[numeric.key] = None
+            code = self.code_for(numeric)
+        self.check_depth(len(stack))
+        steps: List[List[Any]] = []
+        index = 0
+        try:
+            if trace:
+                for index, (handler, arg) in enumerate(code):
+                    handler(stack, arg)
+                    steps.append(list(stack))
+            else:
+                for index, (handler, arg) in enumerate(code):
+                    handler(stack, arg)
+        except RPNCalculatorError as e:
+            if positions is not None:
+                index = positions[index]
+            raise type(e)(f"{e} (token {index}: {self.tokens[index]!r})") from e
+        return steps
+
+def _resolve(token: Token, index: int) -> Tuple[Optional[str], Optional[float]]:
+    """
+    (operator name, None), or (None, the literal as a float) with None for
+    literals that are numbers but not finite floats, like "1/3" or "1e400".
+    """
+    if not isinstance(token, (int, float)):
+        name = OPERATIONS.get(token.lower())
+        if name is not None:
+            return name, None
+    try:
+        value = float(token)
+    except OverflowError:
+        return None, None
+    except ValueError:
+        if not _is_number(token):
+            raise InvalidTokenError(f"Unknown token: {token!r} (token {index})") from None
+        return None, None
+    return None, (value if math.isfinite(value) else None)
+
+def _is_number(token: Token) -> bool:
+    """Whether ``token`` is written like a number of some backend (e.g. "1/3")."""
+    try:
+        Fraction(token)
+    except ZeroDivisionError:
+        return True
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def _float_error(token: Token, index: int) -> str:
+    try:
+        float(token)
+    except ValueError:
+        return f"{token!r} is not a float (token {index})"
+    except OverflowError:
+        pass
+    return f"{token!r} is not a finite number (token {index})"
+
+def compile_program(program: Program, optimize: bool = True) -> CompiledProgram:
+    return CompiledProgram(program, optimize)
+
+class ProgramCache:
+    """
+    Thread-safe LRU cache of compiled programs keyed by program text, or by the
+    tuple of tokens of a token list (joining them would let ``["1 2", "add"]``
+    hit the entry of ``"1 2 add"``).
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self._programs: "OrderedDict[ProgramKey, CompiledProgram]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(program: Program) -> "ProgramKey":
+        if isinstance(program, str):
+            return program
+        return tuple(program)
+
+    def get(self, program: Program) -> CompiledProgram:
+        key = self.key(program)
+        with self._lock:
+            compiled = self._programs.get(key)
+            if compiled is not None:
+                self._programs.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = compile_program(program)
+        if self._maxsize > 0:
+            with self._lock:
+                self._programs[key] = compiled
+                if len(self._programs) > self._maxsize:
+                    self._programs.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._programs.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._programs),
+            "maxsize": self._maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
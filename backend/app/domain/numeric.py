@@ -0,0 +1,416 @@
+"""
+Numeric backends - the value type of a calculator stack and its operators.
+
+``float`` is the fast path (unboxed float64 in an ``array``). The exact and
+arbitrary-precision backends keep Python objects in a list:
+
+- ``decimal``: ``decimal.Decimal`` rounded to a configurable number of digits
+- ``fraction``: ``fractions.Fraction``, exact; ``sqrt`` and ``power`` only when
+  the result is rational
+- ``integer``: unbounded ``int``; ``divide`` is floor division and ``sqrt`` the
+  integer square root
+
+Values are converted once, when they enter the stack (``parse``); operator
+handlers then work on the backend's own type with no per-operation conversion.
+Operators without an exact counterpart (trigonometry; logarithms outside
+decimal) are rejected in the exact backends.
+Literals given as floats are parsed from their shortest repr, so ``0.1`` is
+exactly one tenth in the decimal and fraction backends.
+"""
+import math
+import operator
+from array import array
+from decimal import Context, Decimal, DecimalException
+from fractions import Fraction
+from functools import lru_cache, reduce
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+from app.core.exceptions import DivisionByZeroError, InvalidOperationError, InvalidTokenError
+from app.domain.operators import OPERATORS, Handler, Stack, reduction
+
+MODES = ("float", "decimal", "fraction", "integer")
+DEFAULT_DECIMAL_PRECISION = 28
+MAX_DECIMAL_PRECISION = 1000
+# Integer and fraction parts are capped so results stay printable (Python refuses to
+# convert ints above 4300 digits to text) and a single power cannot exhaust memory
+MAX_BITS = 14_000
+# Largest decimal exponent accepted when parsing a literal into an exact backend
+_MAX_EXPONENT = 4_000
+
+class NumericBackend:
+    """
+    A stack value type: ``parse`` converts pushed values and literals, ``format``
+    turns values into JSON-safe output (``None`` when they already are) and
+    ``handlers`` implements every operator on the native type.
+    """
+
+    __slots__ = ("name", "precision", "key", "parse", "format", "handlers")
+
+    def __init__(
+        self,
+        name: str,
+        parse: Callable[[Any], Any],
+        format: Optional[Callable[[Any], Any]],
+        handlers: Dict[str, Handler],
+        precision: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.precision = precision
+        self.key = name if precision is None else f"{name}:{precision}"
+        self.parse = parse
+        self.format = format
+        self.handlers = handlers
+
+    def __repr__(self) -> str:
+        return f"NumericBackend({self.key!r})"
+
+    def new_stack(self, values: Iterable[Any] = ()) -> Stack:
+        """Stack storage holding ``values`` converted to this backend."""
+        if self.name == "float":
+            return array("d", values)
+        return [self.parse(value) for value in values]
+
+    def convert(self, values: Iterable[Any]) -> List[Any]:
+        """``values`` (of any backend, or as formatted) converted to this backend."""
+        try:
+            return [self.parse(value) for value in values]
+        except (ArithmeticError, TypeError, ValueError) as e:
+            raise InvalidOperationError(f"Cannot convert to {self.name}: {e}") from None
+
+    def export(self, values: Sequence[Any]) -> List[Any]:
+        """JSON-safe copy of ``values`` (exact values are formatted as strings)."""
+        if self.format is None:
+            return values if isinstance(values, list) else list(values)
+        fmt = self.format
+        return [fmt(value) for value in values]
+
+# ---------- Handlers ----------
+# Built like the float handlers of the operator registry: in-place, operand counts
+# checked by the caller, stack untouched when they raise.
+def _binary(name: str, fn: Callable[[Any, Any], Any], mode: str) -> Handler:
+    def handler(s: Stack, _: Any) -> None:
+        try:
+            result = fn(s[-2], s[-1])
+        except (ArithmeticError, ValueError) as e:
+            raise InvalidOperationError(f"Invalid {name} in {mode} mode ({type(e).__name__})")
+        s.pop()
+        s[-1] = result
+
+    return handler
+
+def _unary(name: str, fn: Callable[[Any], Any], mode: str) -> Handler:
+    def handler(s: Stack, _: Any) -> None:
+        try:
+            s[-1] = fn(s[-1])
+        except (ArithmeticError, ValueError) as e:
+            raise InvalidOperationError(f"Invalid {name} in {mode} mode ({type(e).__name__})")
+
+    return handler
+
+def _unsupported(name: str, mode: str) -> Handler:
+    def handler(s: Stack, _: Any) -> None:
+        raise InvalidOperationError(f"{name} is not available in {mode} mode")
+
+    return handler
+
+def _handlers(
+    mode: str,
+    parse: Callable[[Any], Any],
+    reductions: Dict[str, Callable[[Sequence[Any]], Any]],
+    **ops: Callable[..., Any],
+) -> Dict[str, Handler]:
+    """
+    Handler table of an exact backend: the registry's generic handlers, ``ops``
+    (plain functions of the operands) and ``reductions`` (functions of the
+    reduced values); other operators raise.
+    """
+    handlers = {op.name: op.handler for op in OPERATORS.values() if op.generic}
+
+    def depth(s: Stack, _: Any) -> None:
+        s.append(parse(len(s)))
+
+    handlers["depth"] = depth
+    for name, fn in reductions.items():
+        handlers[name] = reduction(name, fn, _REDUCTION_MINIMUM.get(name, 0))
+    for name, fn in ops.items():
+        wrap = _unary if OPERATORS[name].consumed == 1 else _binary
+        handlers[name] = wrap(name, fn, mode)
+    for name in OPERATORS:
+        handlers.setdefault(name, _unsupported(name, mode))
+    return handlers
+
+def _nonzero_divisor(divide: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    def checked(a: Any, b: Any) -> Any:
+        if not b:
+            raise DivisionByZeroError("Cannot divide by zero")
+        return divide(a, b)
+
+    return checked
+
+def _non_negative(sqrt: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def checked(a: Any) -> Any:
+        if a < 0:
+            raise InvalidOperationError("Cannot compute square root of negative number")
+        return sqrt(a)
+
+    return checked
+
+def _positive(name: str, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def checked(a: Any) -> Any:
+        if a <= 0:
+            raise InvalidOperationError(f"{name} is only defined for positive numbers")
+        return fn(a)
+
+    return checked
+
+def _decimal_mod(context: Context) -> Callable[[Decimal, Decimal], Decimal]:
+    """Remainder with the sign of the divisor, like ``%`` on floats and ints."""
+    def mod(a: Decimal, b: Decimal) -> Decimal:
+        remainder = context.remainder(a, b)
+        if remainder and (remainder < 0) != (b < 0):
+            remainder = context.add(remainder, b)
+        return remainder
+
+    return _nonzero_divisor(mod)
+
+# Fewest values each reduction accepts
+_REDUCTION_MINIMUM = {"mean": 1, "stddev": 2}
+
+def _accumulate(
+    step: Callable[[Any, Any], Any], start: Any, bits: Callable[[Any], int]
+) -> Callable[[Sequence[Any]], Any]:
+    """Fold checking the size cap at every step, so a long fold cannot grow unbounded."""
+    def total(values: Sequence[Any]) -> Any:
+        result = start
+        for value in values:
+            result = step(result, value)
+            if bits(result) > MAX_BITS:
+                raise _too_large()
+        return result
+
+    return total
+
+def _fraction_bits(value: Fraction) -> int:
+    return max(value.numerator.bit_length(), value.denominator.bit_length())
+
+def _too_large() -> InvalidOperationError:
+    return InvalidOperationError(f"Result exceeds {MAX_BITS} bits")
+
+def _bounded_int(fn: Callable[..., int]) -> Callable[..., int]:
+    def checked(*args: Any) -> int:
+        result = fn(*args)
+        if result.bit_length() > MAX_BITS:
+            raise _too_large()
+        return result
+
+    return checked
+
+def _bounded_fraction(fn: Callable[..., Fraction]) -> Callable[..., Fraction]:
+    def checked(*args: Any) -> Fraction:
+        result = fn(*args)
+        if max(result.numerator.bit_length(), result.denominator.bit_length()) > MAX_BITS:
+            raise _too_large()
+        return result
+
+    return checked
+
+def _integer_power(a: int, b: int) -> int:
+    if b < 0:
+        raise InvalidOperationError("Integer mode only supports non-negative exponents")
+    # 2**(bits - 1) <= |a|, so this rejects results known to exceed the cap up front
+    if abs(a) > 1 and (abs(a).bit_length() - 1) * b > MAX_BITS:
+        raise _too_large()
+    return a ** b
+
+def _fraction_power(a: Fraction, b: Fraction) -> Fraction:
+    if b.denominator != 1:
+        raise InvalidOperationError("Fraction mode only supports integer exponents")
+    exponent = abs(b.numerator)
+    bits = max(a.numerator.bit_length(), a.denominator.bit_length()) - 1
+    if bits > 0 and bits * exponent > MAX_BITS:
+        raise _too_large()
+    return a ** b.numerator
+
+def _fraction_sqrt(a: Fraction) -> Fraction:
+    numerator, denominator = math.isqrt(a.numerator), math.isqrt(a.denominator)
+    if numerator * numerator != a.numerator or denominator * denominator != a.denominator:
+        raise InvalidOperationError("Square root is not exact in fraction mode")
+    return Fraction(numerator, denominator)
+
+# ---------- Parsing ----------
+def _invalid(value: Any, reason: str) -> InvalidTokenError:
+    return InvalidTokenError(f"{value!r} {reason}")
+
+def _literal(value: Any) -> Decimal:
+    """A float or numeric string as an exact, finite, reasonably sized Decimal."""
+    try:
+        number = Decimal(repr(value) if isinstance(value, float) else value)
+    except (ArithmeticError, TypeError, ValueError):
+        raise _invalid(value, "is not a number") from None
+    if not number.is_finite():
+        raise _invalid(value, "is not a finite number")
+    if number and abs(number.adjusted()) > _MAX_EXPONENT:
+        raise _invalid(value, "is out of range")
+    return number
+
+def _parse_fraction(value: Any) -> Fraction:
+    if isinstance(value, Fraction):
+        return value
+    if isinstance(value, int):
+        result = Fraction(value)
+    elif isinstance(value, str) and "/" in value:
+        try:
+            result = Fraction(value)
+        except (ValueError, ZeroDivisionError):
+            raise _invalid(value, "is not a fraction") from None
+    else:
+        result = Fraction(_literal(value))
+    if max(result.numerator.bit_length(), result.denominator.bit_length()) > MAX_BITS:
+        raise _invalid(value, "is out of range")
+    return result
+
+def _parse_integer(value: Any) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        result = value
+    elif isinstance(value, Fraction):
+        if value.denominator != 1:
+            raise _invalid(value, "is not an integer")
+        result = value.numerator
+    else:
+        number = _literal(value)
+        if number != number.to_integral_value():
+            raise _invalid(value, "is not an integer")
+        result = int(number)
+    if result.bit_length() > MAX_BITS:
+        raise _invalid(value, "is out of range")
+    return result
+
+def _decimal_parser(context: Context) -> Callable[[Any], Decimal]:
+    def parse(value: Any) -> Decimal:
+        if isinstance(value, Fraction):
+            return context.divide(Decimal(value.numerator), Decimal(value.denominator))
+        if isinstance(value, Decimal):
+            return context.plus(value)
+        try:
+            return context.create_decimal(_literal(value))
+        except DecimalException:
+            raise _invalid(value, "is out of range") from None
+
+    return parse
+
+# ---------- Backends ----------
+def _float_backend() -> NumericBackend:
+    return NumericBackend("float", float, None, {op.name: op.handler for op in OPERATORS.values()})
+
+def _decimal_backend(precision: int) -> NumericBackend:
+    context = Context(prec=precision)
+    parse = _decimal_parser(context)
+
+    def total(values: Sequence[Decimal]) -> Decimal:
+        return reduce(context.add, values, Decimal(0))
+
+    def mean(values: Sequence[Decimal]) -> Decimal:
+        return context.divide(total(values), len(values))
+
+    def stddev(values: Sequence[Decimal]) -> Decimal:
+        center = mean(values)
+        squares = [context.power(context.subtract(x, center), 2) for x in values]
+        return context.sqrt(context.divide(total(squares), len(values) - 1))
+
+    handlers = _handlers(
+        "decimal",
+        parse,
+        {
+            "sum": total,
+            "product": lambda values: reduce(context.multiply, values, Decimal(1)),
+            "mean": mean,
+            "stddev": stddev,
+        },
+        add=context.add,
+        subtract=context.subtract,
+        multiply=context.multiply,
+        divide=_nonzero_divisor(context.divide),
+        sqrt=_non_negative(context.sqrt),
+        power=context.power,
+        mod=_decimal_mod(context),
+        abs=Decimal.copy_abs,
+        neg=Decimal.copy_negate,
+        exp=context.exp,
+        ln=_positive("ln", context.ln),
+        log=_positive("log", context.log10),
+    )
+    return NumericBackend("decimal", parse, str, handlers, precision)
+
+def _fraction_backend() -> NumericBackend:
+    total = _accumulate(operator.add, Fraction(0), _fraction_bits)
+
+    def mean(values: Sequence[Fraction]) -> Fraction:
+        return total(values) / len(values)
+
+    def stddev(values: Sequence[Fraction]) -> Fraction:
+        center = mean(values)
+        squares = total([(x - center) ** 2 for x in values])
+        return _fraction_sqrt(squares / (len(values) - 1))
+
+    handlers = _handlers(
+        "fraction",
+        _parse_fraction,
+        {
+            "sum": total,
+            "product": _accumulate(operator.mul, Fraction(1), _fraction_bits),
+            "mean": mean,
+            "stddev": stddev,
+        },
+        add=_bounded_fraction(operator.add),
+        subtract=_bounded_fraction(operator.sub),
+        multiply=_bounded_fraction(operator.mul),
+        divide=_nonzero_divisor(_bounded_fraction(operator.truediv)),
+        sqrt=_non_negative(_fraction_sqrt),
+        power=_bounded_fraction(_fraction_power),
+    )
+    return NumericBackend("fraction", _parse_fraction, str, handlers)
+
+def _integer_backend() -> NumericBackend:
+    total = _accumulate(operator.add, 0, int.bit_length)
+    handlers = _handlers(
+        "integer",
+        _parse_integer,
+        {
+            "sum": total,
+            "product": _accumulate(operator.mul, 1, int.bit_length),
+            "mean": lambda values: total(values) // len(values),
+        },
+        add=_bounded_int(operator.add),
+        subtract=_bounded_int(operator.sub),
+        multiply=_bounded_int(operator.mul),
+        divide=_nonzero_divisor(operator.floordiv),
+        sqrt=_non_negative(math.isqrt),
+        power=_bounded_int(_integer_power),
+    )
+    return NumericBackend("integer", _parse_integer, str, handlers)
+
+def get_backend(mode: str = "float", precision: Optional[int] = None) -> NumericBackend:
+    """
+    The shared backend for ``mode`` (one of ``MODES``). ``precision``
+    (significant digits) only applies to ``decimal``.
+    """
+    if mode != "decimal":
+        precision = None
+    elif precision is None:
+        precision = DEFAULT_DECIMAL_PRECISION
+    elif not 1 <= precision <= MAX_DECIMAL_PRECISION:
+        raise ValueError(f"Decimal precision must be between 1 and {MAX_DECIMAL_PRECISION}")
+    return _backend(mode, precision)
+
+@lru_cache(maxsize=None)
+def _backend(mode: str, precision: Optional[int]) -> NumericBackend:
+    if mode == "float":
+        return _float_backend()
+    if mode == "decimal":
+        return _decimal_backend(precision)  # type: ignore[arg-type]
+    if mode == "fraction":
+        return _fraction_backend()
+    if mode == "integer":
+        return _integer_backend()
+    raise ValueError(f"Unknown numeric mode: {mode!r}")
+
+FLOAT = get_backend("float")
@@ -0,0 +1,298 @@
+"""
+Operator registry - every RPN operator with its arity and float implementation.
+
+The registry is the single source of operators for the compiler, the
+calculator, the service layer and the API: a token or route name is resolved
+to an ``Operator`` once and then dispatched through its handler.
+
+Handlers mutate the stack in place and leave it untouched when they raise.
+Fixed-arity operators rely on the caller to check the stack depth (statically
+in the compiler, or with ``Operator.operands``). Variadic operators take a
+count ``n`` from the top of the stack and check their own operands.
+"""
+import math
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    MutableSequence,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from app.core.exceptions import (
+    DivisionByZeroError,
+    EmptyStackError,
+    InsufficientOperandsError,
+    InvalidOperationError,
+    RPNCalculatorError,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# Products and standard deviations over at least this many values use NumPy when
+# it is installed; sums and means always use math.fsum (correctly rounded)
+NUMPY_MIN_VALUES = 10_000
+
+Stack = MutableSequence[Any]
+Handler = Callable[[Stack, Any], None]
+
+class Operator(NamedTuple):
+    """
+    A registered operator. ``consumed`` values are taken from the top of the
+    stack and ``produced`` pushed back. For a variadic operator ``consumed`` is
+    what it needs besides the ``n`` counted values (the count included) and
+    ``produced`` is unused. ``generic`` handlers work on every numeric backend.
+    """
+    name: str
+    consumed: int
+    produced: int
+    handler: Handler
+    aliases: Tuple[str, ...] = ()
+    summary: str = ""
+    generic: bool = False
+    variadic: bool = False
+
+    def operands(self, stack: Sequence[Any]) -> int:
+        """Values this operator takes from the top of ``stack``; raises if it is too shallow."""
+        if self.variadic:
+            return count_operands(stack, self.consumed) + self.consumed
+        if len(stack) < self.consumed:
+            raise depth_error(self.name, self.consumed, len(stack))
+        return self.consumed
+
+def depth_error(name: str, required: int, available: int) -> RPNCalculatorError:
+    """The error an operator raises when fewer than ``required`` values are available."""
+    if name == "drop":
+        return EmptyStackError("Cannot drop from an empty stack")
+    return InsufficientOperandsError(
+        f"Operation requires {required} operands, but only {available} available"
+    )
+
+def count_operands(s: Sequence[Any], extra: int) -> int:
+    """
+    The count ``n`` on top of ``s``, checked to be a non-negative integer with
+    ``n + extra`` values available.
+    """
+    if not s:
+        raise depth_error("", extra, 0)
+    value = s[-1]
+    try:
+        count = int(value)
+    except (ValueError, OverflowError):
+        count = -1
+    if count < 0 or count != value:
+        raise InvalidOperationError(f"Count must be a non-negative integer, got {value}")
+    if len(s) < count + extra:
+        raise depth_error("", count + extra, len(s))
+    return count
+
+# ---------- Arithmetic ----------
+def _add(s: Stack, _: Any) -> None:
+    b = s.pop()
+    s[-1] = s[-1] + b
+
+def _subtract(s: Stack, _: Any) -> None:
+    b = s.pop()
+    s[-1] = s[-1] - b
+
+def _multiply(s: Stack, _: Any) -> None:
+    b = s.pop()
+    s[-1] = s[-1] * b
+
+def _divide(s: Stack, _: Any) -> None:
+    if s[-1] == 0:
+        raise DivisionByZeroError("Cannot divide by zero")
+    b = s.pop()
+    s[-1] = s[-1] / b
+
+def _mod(s: Stack, _: Any) -> None:
+    if s[-1] == 0:
+        raise DivisionByZeroError("Cannot divide by zero")
+    b = s.pop()
+    s[-1] = s[-1] % b
+
+def _sqrt(s: Stack, _: Any) -> None:
+    if s[-1] < 0:
+        raise InvalidOperationError("Cannot compute square root of negative number")
+    s[-1] = math.sqrt(s[-1])
+
+def _power(s: Stack, _: Any) -> None:
+    try:
+        result = math.pow(s[-2], s[-1])
+    except (ValueError, OverflowError) as e:
+        raise InvalidOperationError(f"Invalid power operation: {e}")
+    if math.isinf(result) or math.isnan(result):
+        raise InvalidOperationError("Power operation resulted in invalid number")
+    s.pop()
+    s[-1] = result
+
+def _abs(s: Stack, _: Any) -> None:
+    s[-1] = abs(s[-1])
+
+def _neg(s: Stack, _: Any) -> None:
+    s[-1] = -s[-1]
+
+def _min(s: Stack, _: Any) -> None:
+    b = s.pop()
+    s[-1] = min(s[-1], b)
+
+def _max(s: Stack, _: Any) -> None:
+    b = s.pop()
+    s[-1] = max(s[-1], b)
+
+def _function(name: str, fn: Callable[[float], float]) -> Handler:
+    """Handler applying a ``math`` function to the top value."""
+    def handler(s: Stack, _: Any) -> None:
+        try:
+            s[-1] = fn(s[-1])
+        except (ValueError, OverflowError) as e:
+            raise InvalidOperationError(f"Invalid {name} operation: {e}") from None
+
+    return handler
+
+# ---------- Reductions ----------
+def reduction(name: str, fn: Callable[[Sequence[Any]], Any], minimum: int = 0) -> Handler:
+    """
+    Variadic handler replacing ``n`` values and their count with ``fn`` of the
+    values (a slice of the stack, bottom first); ``n`` must be at least ``minimum``.
+    """
+    def handler(s: Stack, _: Any) -> None:
+        count = count_operands(s, 1)
+        if count < minimum:
+            raise InvalidOperationError(f"{name} needs at least {minimum} values, got {count}")
+        try:
+            result = fn(s[-1 - count:-1])
+        except (ArithmeticError, ValueError) as e:
+            raise InvalidOperationError(f"Invalid {name}: {e}") from None
+        del s[-1 - count:]
+        s.append(result)
+
+    return handler
+
+def _use_numpy(values: Sequence[float]) -> bool:
+    return np is not None and len(values) >= NUMPY_MIN_VALUES
+
+def _mean(values: Sequence[float]) -> float:
+    return math.fsum(values) / len(values)
+
+def _product(values: Sequence[float]) -> float:
+    if _use_numpy(values):
+        with np.errstate(over="ignore"):
+            return float(np.prod(np.asarray(values, dtype=np.float64)))
+    return math.prod(values)
+
+def _stddev(values: Sequence[float]) -> float:
+    """Sample standard deviation (n - 1 degrees of freedom), two passes."""
+    if _use_numpy(values):
+        return float(np.std(np.asarray(values, dtype=np.float64), ddof=1))
+    mean = math.fsum(values) / len(values)
+    return math.sqrt(math.fsum((x - mean) ** 2 for x in values) / (len(values) - 1))
+
+def _depth(s: Stack, _: Any) -> None:
+    s.append(float(len(s)))
+
+# ---------- Stack manipulation ----------
+def _swap(s: Stack, _: Any) -> None:
+    s[-1], s[-2] = s[-2], s[-1]
+
+def _dup(s: Stack, _: Any) -> None:
+    s.append(s[-1])
+
+def _drop(s: Stack, _: Any) -> None:
+    s.pop()
+
+def _over(s: Stack, _: Any) -> None:
+    s.append(s[-2])
+
+def _rot(s: Stack, _: Any) -> None:
+    s[-3], s[-2], s[-1] = s[-2], s[-1], s[-3]
+
+def _pick(s: Stack, _: Any) -> None:
+    count = count_operands(s, 2)
+    s[-1] = s[-2 - count]
+
+def _roll(s: Stack, _: Any) -> None:
+    count = count_operands(s, 2)
+    s.pop()
+    s.append(s.pop(-1 - count))
+
+_REGISTRY: List[Operator] = [
+    Operator("add", 2, 1, _add, ("+",), "a b -- a+b"),
+    Operator("subtract", 2, 1, _subtract, ("-", "sub"), "a b -- a-b"),
+    Operator("multiply", 2, 1, _multiply, ("*", "mul"), "a b -- a*b"),
+    Operator("divide", 2, 1, _divide, ("/", "div"), "a b -- a/b"),
+    Operator("mod", 2, 1, _mod, ("%",), "a b -- a mod b (sign of b)", generic=True),
+    Operator("sqrt", 1, 1, _sqrt, (), "a -- sqrt(a)"),
+    Operator("power", 2, 1, _power, ("^", "pow"), "a b -- a^b"),
+    Operator("abs", 1, 1, _abs, (), "a -- |a|", generic=True),
+    Operator("neg", 1, 1, _neg, ("negate",), "a -- -a", generic=True),
+    Operator("min", 2, 1, _min, (), "a b -- min(a, b)", generic=True),
+    Operator("max", 2, 1, _max, (), "a b -- max(a, b)", generic=True),
+    Operator("exp", 1, 1, _function("exp", math.exp), (), "a -- e^a"),
+    Operator("ln", 1, 1, _function("ln", math.log), (), "a -- natural log of a"),
+    Operator("log", 1, 1, _function("log", math.log10), ("log10",), "a -- log10(a)"),
+    Operator("sin", 1, 1, _function("sin", math.sin), (), "a -- sin(a), radians"),
+    Operator("cos", 1, 1, _function("cos", math.cos), (), "a -- cos(a), radians"),
+    Operator("tan", 1, 1, _function("tan", math.tan), (), "a -- tan(a), radians"),
+    Operator("asin", 1, 1, _function("asin", math.asin), (), "a -- asin(a)"),
+    Operator("acos", 1, 1, _function("acos", math.acos), (), "a -- acos(a)"),
+    Operator("atan", 1, 1, _function("atan", math.atan), (), "a -- atan(a)"),
+    Operator(
+        "sum", 1, 1, reduction("sum", math.fsum), (), "x1..xn n -- x1+..+xn", variadic=True
+    ),
+    Operator(
+        "product",
+        1,
+        1,
+        reduction("product", _product),
+        ("prod",),
+        "x1..xn n -- x1*..*xn",
+        variadic=True,
+    ),
+    Operator(
+        "mean", 1, 1, reduction("mean", _mean, 1), ("avg",), "x1..xn n -- mean", variadic=True
+    ),
+    Operator(
+        "stddev",
+        1,
+        1,
+        reduction("stddev", _stddev, 2),
+        ("std",),
+        "x1..xn n -- sample standard deviation",
+        variadic=True,
+    ),
+    Operator("depth", 0, 1, _depth, (), "-- number of values on the stack"),
+    Operator("swap", 2, 2, _swap, (), "a b -- b a", generic=True),
+    Operator("dup", 1, 2, _dup, (), "a -- a a", generic=True),
+    Operator("drop", 1, 0, _drop, (), "a --", generic=True),
+    Operator("over", 2, 3, _over, (), "a b -- a b a", generic=True),
+    Operator("rot", 3, 3, _rot, (), "a b c -- b c a", generic=True),
+    Operator(
+        "pick", 2, 2, _pick, (), "xn..x0 n -- xn..x0 xn", generic=True, variadic=True
+    ),
+    Operator(
+        "roll", 2, 1, _roll, (), "xn..x0 n -- xn-1..x0 xn", generic=True, variadic=True
+    ),
+]
+
+# Canonical name -> operator
+OPERATORS: Dict[str, Operator] = {op.name: op for op in _REGISTRY}
+
+# Program token or route name (lower case) -> canonical operator name
+OPERATIONS: Dict[str, str] = {
+    alias: op.name for op in _REGISTRY for alias in (op.name, *op.aliases)
+}
+
+# Variadic operators folding their n values into one (see RPNCalculator.reduce)
+REDUCTIONS = ("sum", "product", "mean", "stddev")
+
+def resolve(name: str) -> Optional[Operator]:
+    """The operator for a name or alias (case-insensitive), or None."""
+    canonical = OPERATIONS.get(name.lower())
+    return None if canonical is None else OPERATORS[canonical]
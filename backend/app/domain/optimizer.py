@@ -0,0 +1,229 @@
+"""
+Program optimizer - rewrite compiled RPN code so each run does less work.
+
+The optimizer works on the instructions of a ``CompiledProgram`` for one numeric
+backend (literals already parsed) and applies two passes:
+
+- constant folding: an operator whose operands are all literals is evaluated
+  once with the backend's own handler and replaced by the values it leaves
+  (``2 3 add`` -> ``5``, ``3 dup *`` -> ``9``, ``5 drop`` -> nothing)
+- recomputation: a stretch of code that only shuffles values and recomputes
+  values already computed in this run is replaced by the shortest stack
+  shuffle with the same effect, so ``dup 2 * 1 + over 2 * 1 + *`` becomes
+  ``dup 2 * 1 + dup *``; shuffles that cancel out (``swap swap``,
+  ``dup drop``) become nothing
+
+Values are identified by value numbering: a literal by its repr, a computed
+value by its operator and operand numbers, the program's inputs by position.
+
+Error semantics are unchanged. An operator that raises while folding is kept
+and raises at run time, from its own token. Recomputations are only rewritten
+before the first variadic operator, where the static depth check already
+guarantees every shuffle's operands, and only when every value they compute
+was computed (successfully) earlier in the same run. Operators that read the
+stack itself (``depth``) or a depth given at run time (variadic ones) are
+never folded or reused.
+"""
+from itertools import count
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.exceptions import RPNCalculatorError
+from app.domain.operators import OPERATORS, Handler
+
+# (operator name or "push", literal, index of the source token)
+Instruction = Tuple[str, Any, int]
+
+# Operators that only move values: the vocabulary of rewritten recomputations
+SHUFFLES = ("dup", "swap", "over", "drop", "rot")
+# Longest stretch of instructions considered for one rewrite
+MAX_SPAN = 64
+# Values of the top of the stack a rewrite may copy or reorder, and operators in it
+_REACH = 3
+_MAX_SHUFFLES = 3
+# Values a stretch may reach below its start before it is abandoned
+_WINDOW = 8
+
+def _shuffle_table() -> Dict[Tuple[int, Tuple[int, ...]], Tuple[str, ...]]:
+    """
+    The shortest shuffle for each rearrangement of the top ``reach`` values:
+    (reach, the stack after it as positions in the top ``reach``) -> operator names.
+    """
+    table: Dict[Tuple[int, Tuple[int, ...]], Tuple[str, ...]] = {}
+    for reach in range(1, _REACH + 1):
+        start = tuple(range(reach))
+        table[(reach, start)] = ()
+        frontier = [(start, ())]
+        for _ in range(_MAX_SHUFFLES):
+            found = []
+            for stack, names in frontier:
+                for name in SHUFFLES:
+                    op = OPERATORS[name]
+                    if len(stack) < op.consumed:
+                        continue
+                    after = list(stack)
+                    op.handler(after, None)
+                    if (reach, tuple(after)) not in table:
+                        table[(reach, tuple(after))] = names + (name,)
+                        found.append((tuple(after), names + (name,)))
+            frontier = found
+    return table
+
+_SHUFFLE_TABLE = _shuffle_table()
+
+def optimize(
+    instructions: Sequence[Instruction],
+    handlers: Dict[str, Handler],
+    static: int,
+    required: int,
+) -> List[Instruction]:
+    """
+    Optimized ``instructions``. ``handlers`` are the numeric backend's, ``static``
+    the index of the first token past which the stack depth is only known at run
+    time and ``required`` the depth the program needs (``CompiledProgram``).
+    """
+    return _reuse(_fold(instructions, handlers), static, required)
+
+def _fold(instructions: Sequence[Instruction], handlers: Dict[str, Handler]) -> List[Instruction]:
+    out: List[Instruction] = []
+    literals: List[int] = []  # literals on top of ``out`` after each instruction
+    for instruction in instructions:
+        name, _, index = instruction
+        trailing = literals[-1] if literals else 0
+        if name == "push":
+            out.append(instruction)
+            literals.append(trailing + 1)
+            continue
+        op = OPERATORS[name]
+        if not op.variadic and 0 < op.consumed <= trailing:
+            values = [value for _, value, _ in out[-op.consumed:]]
+            try:
+                handlers[name](values, None)
+            except (RPNCalculatorError, ArithmeticError, ValueError):
+                pass  # left for run time, which raises the same error
+            else:
+                del out[-op.consumed:]
+                del literals[-op.consumed:]
+                trailing = literals[-1] if literals else 0
+                for value in values:
+                    out.append(("push", value, index))
+                    trailing += 1
+                    literals.append(trailing)
+                continue
+        out.append(instruction)
+        literals.append(0)
+    return out
+
+def _reuse(instructions: Sequence[Instruction], static: int, required: int) -> List[Instruction]:
+    ids = count()
+    numbers: Dict[Tuple[Any, ...], int] = {}
+    stack = [next(ids) for _ in range(required)]
+    out: List[Instruction] = []
+    position = 0
+    while position < len(instructions) and instructions[position][2] < static:
+        rewrite = _rewrite(instructions, position, static, stack, numbers, ids)
+        if rewrite is None:
+            out.append(instructions[position])
+            _execute(instructions[position], stack, numbers, ids)
+            position += 1
+            continue
+        end, names, window, reach = rewrite
+        index = instructions[end - 1][2]
+        out.extend((name, None, index) for name in names)
+        stack[len(stack) - reach:] = window
+        position = end
+    out.extend(instructions[position:])
+    return out
+
+def _literal(value: Any, numbers: Dict[Tuple[Any, ...], int], ids: Iterator[int]) -> int:
+    # repr tells apart values that compare equal but compute differently (0.0, -0.0)
+    key = ("push", repr(value))
+    number = numbers.get(key)
+    if number is None:
+        number = numbers[key] = next(ids)
+    return number
+
+def _execute(
+    instruction: Instruction,
+    stack: List[int],
+    numbers: Dict[Tuple[Any, ...], int],
+    ids: Iterator[int],
+) -> None:
+    """Apply ``instruction`` to the value numbers on ``stack``."""
+    name, value, _ = instruction
+    if name == "push":
+        stack.append(_literal(value, numbers, ids))
+        return
+    op = OPERATORS[name]
+    if name in SHUFFLES:
+        op.handler(stack, None)
+        return
+    operands = tuple(stack[len(stack) - op.consumed:])
+    del stack[len(stack) - op.consumed:]
+    if op.consumed and op.produced == 1:
+        key = (name,) + operands
+        number = numbers.get(key)
+        if number is None:
+            number = numbers[key] = next(ids)
+        stack.append(number)
+    else:
+        stack.extend(next(ids) for _ in range(op.produced))
+
+def _rewrite(
+    instructions: Sequence[Instruction],
+    position: int,
+    static: int,
+    stack: List[int],
+    numbers: Dict[Tuple[Any, ...], int],
+    ids: Iterator[int],
+) -> Optional[Tuple[int, Tuple[str, ...], List[int], int]]:
+    """
+    The longest stretch from ``position`` that recomputes nothing new and has a
+    shorter shuffle equivalent: (end, shuffle, top of the stack after, values replaced).
+    """
+    reach = min(_WINDOW, len(stack))
+    start = stack[len(stack) - reach:]
+    window = list(start)
+    best = None
+    for end in range(position, min(len(instructions), position + MAX_SPAN)):
+        name, value, index = instructions[end]
+        if index >= static:
+            break
+        if name == "push":
+            window.append(_literal(value, numbers, ids))
+        else:
+            op = OPERATORS[name]
+            if len(window) < op.consumed:
+                break
+            if name in SHUFFLES:
+                op.handler(window, None)
+            else:
+                if not op.consumed or op.produced != 1:
+                    break
+                number = numbers.get((name,) + tuple(window[len(window) - op.consumed:]))
+                if number is None:
+                    break  # a new value: computing it is not redundant
+                del window[len(window) - op.consumed:]
+                window.append(number)
+        names = _shuffle(start, window)
+        if names is not None and len(names) < end + 1 - position:
+            best = (end + 1, names, list(window), reach)
+    return best
+
+def _shuffle(before: List[int], after: List[int]) -> Optional[Tuple[str, ...]]:
+    """The shortest shuffle turning ``before`` into ``after``, if one is known."""
+    if after == before:
+        return ()
+    best = None
+    for reach in range(1, min(_REACH, len(before)) + 1):
+        kept = len(before) - reach
+        if len(after) < kept or after[:kept] != before[:kept]:
+            continue
+        top = before[kept:]
+        positions = {number: i for i, number in reversed(list(enumerate(top)))}
+        try:
+            key = (reach, tuple(positions[number] for number in after[kept:]))
+        except KeyError:
+            continue
+        names = _SHUFFLE_TABLE.get(key)
+        if names is not None and (best is None or len(names) < len(best)):
+            best = names
+    return best
@@ -0,0 +1,100 @@
+"""
+Persistent (immutable, structurally shared) stack.
+
+A version is a chain of segments: each ``replace_top`` adds one node holding
+the values it pushed (as given, e.g. an ``array('d')`` slice) on top of the
+rest of the stack, so deriving a new version costs only the values that changed
+and all versions share their common tail. Values are stored once per change
+rather than once per value: a segment of a million floats is one node and 8MB.
+Dropping values from the top of a segment shares the segment and only lowers
+how much of it the new node uses.
+"""
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+# (values, number of them in use, rest) segments; None is the empty stack
+_Node = Optional[Tuple[Sequence[Any], int, "_Node"]]
+
+class PersistentStack:
+    __slots__ = ("_node", "_size", "_nodes")
+
+    def __init__(self, node: _Node = None, size: int = 0, nodes: int = 0) -> None:
+        self._node = node
+        self._size = size
+        self._nodes = nodes
+
+    @classmethod
+    def from_values(cls, values: Sequence[Any]) -> "PersistentStack":
+        """Build a stack from values listed bottom first (kept as is, not copied)."""
+        return cls().replace_top(0, values)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nodes(self) -> int:
+        """Segments in the chain."""
+        return self._nodes
+
+    def __iter__(self) -> Iterator[Any]:
+        """Iterate from the top of the stack down."""
+        node = self._node
+        while node is not None:
+            values, used, node = node
+            for index in range(used - 1, -1, -1):
+                yield values[index]
+
+    def top(self, count: int) -> Tuple[Any, ...]:
+        """The ``count`` topmost values, bottom first."""
+        count = min(count, self._size)
+        if count <= 0:
+            return ()
+        values, used, node = self._node  # type: ignore[misc]
+        if count <= used:
+            return tuple(values[used - count:used])
+        segments = [values[:used]]
+        count -= used
+        while count > 0:
+            values, used, node = node  # type: ignore[misc]
+            taken = min(count, used)
+            segments.append(values[used - taken:used])
+            count -= taken
+        segments.reverse()
+        return tuple(value for segment in segments for value in segment)
+
+    def replace_top(self, count: int, values: Sequence[Any]) -> "PersistentStack":
+        """
+        New version with the ``count`` topmost values replaced by ``values``,
+        which become one segment of it and must not be modified afterwards.
+        """
+        node = self._node
+        size = self._size
+        nodes = self._nodes
+        if count >= size:
+            node, size, nodes = None, 0, 0
+        else:
+            size -= count
+            while count > 0:
+                segment, used, rest = node  # type: ignore[misc]
+                if count < used:
+                    node = (segment, used - count, rest)
+                    break
+                count -= used
+                node = rest
+                nodes -= 1
+        if len(values):
+            node = (values, len(values), node)
+            size += len(values)
+            nodes += 1
+        return PersistentStack(node, size, nodes)
+
+    def to_list(self) -> List[Any]:
+        """All values, bottom first."""
+        segments = []
+        node = self._node
+        while node is not None:
+            values, used, node = node
+            segments.append(values if used == len(values) else values[:used])
+        stack: List[Any] = []
+        for segment in reversed(segments):
+            stack.extend(segment)
+        return stack
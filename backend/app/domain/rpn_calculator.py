@@ -1,25 +1,76 @@
 """
 RPN Calculator domain logic - Pure Python, framework-agnostic.
 """
+import argparse
 import math
-from typing import List, Optional
+import sys
+from array import array
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
 from app.core.exceptions import (
+    RPNCalculatorError,
     InsufficientOperandsError,
     DivisionByZeroError,
     EmptyStackError,
     InvalidOperationError,
+    InvalidTokenError,
 )
+from app.domain.compiler import CompiledProgram, Program, Token, compile_program
+from app.domain.numeric import FLOAT, MODES, NumericBackend, get_backend
+from app.domain.operators import OPERATIONS, OPERATORS, REDUCTIONS
+from app.domain.streaming import CHUNK_SIZE, StreamEvaluator, read_chunks
 
 class RPNCalculator:
+    numeric: NumericBackend = FLOAT
+    _handlers = FLOAT.handlers
+
     def __init__(self) -> None:
-        self._stack: List[float] = []
+        # Unboxed float64 storage: 8 bytes per value instead of a pointer plus a float object
+        self._stack = array("d")
 
     @property
     def stack(self) -> List[float]:
-        return self._stack.copy()
+        return self._stack.tolist()
+
+    def view(self) -> memoryview:
+        """
+        Read-only, zero-copy view of the stack (bottom first). The calculator
+        cannot grow or shrink while a view is alive, so release it first
+        (``with calc.view() as values: ...``).
+        """
+        return memoryview(self._stack).toreadonly()
 
     def push(self, value: float) -> None:
-        self._stack.append(float(value))
+        number = float(value)
+        if not math.isfinite(number):
+            raise InvalidTokenError(f"{value!r} is not a finite number")
+        self._stack.append(number)
+
+    def extend(self, values: Iterable[Any]) -> int:
+        """
+        Push many values at once (bottom first) and return how many; nothing is
+        pushed if one of them is not a finite number.
+        """
+        if isinstance(values, array) and values.typecode == "d":
+            new = values
+        else:
+            try:
+                new = array("d", map(float, values))
+            except (ArithmeticError, TypeError, ValueError) as e:
+                raise InvalidTokenError(f"Invalid value: {e}") from None
+        if not all(map(math.isfinite, new)):
+            raise InvalidTokenError("Values must be finite numbers")
+        self._stack.extend(new)
+        return len(new)
+
+    def extend_bytes(self, data: bytes) -> int:
+        """Push packed little-endian float64 values (see ``extend``)."""
+        if len(data) % 8:
+            raise InvalidTokenError(f"Expected a multiple of 8 bytes, got {len(data)}")
+        values = array("d")
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        return self.extend(values)
 
     def pop(self) -> float:
         if not self._stack:
@@ -27,11 +78,19 @@ class RPNCalculator:
         return self._stack.pop()
 
     def clear(self) -> None:
-        self._stack.clear()
+        del self._stack[:]
+
+    def load(self, values: Sequence[float]) -> None:
+        """Replace the whole stack with ``values`` (bottom first)."""
+        self._stack = array("d", values)
 
     def size(self) -> int:
         return len(self._stack)
 
+    def memory_bytes(self) -> int:
+        """Memory held by the stack buffer."""
+        return sys.getsizeof(self._stack)
+
     def _ensure_operands(self, count: int = 2) -> None:
         if len(self._stack) < count:
             raise InsufficientOperandsError(
@@ -119,3 +178,198 @@ class RPNCalculator:
 
     def peek(self) -> Optional[float]:
         return self._stack[-1] if self._stack else None
+
+    def top(self, count: int) -> Sequence[float]:
+        """A copy of the ``count`` topmost values, bottom first (a float64 array)."""
+        if count <= 0:
+            return ()
+        return self._stack[-count:]
+
+    def replace_top(self, count: int, values: Sequence[float]) -> None:
+        """Remove the ``count`` topmost values and push ``values`` in their place."""
+        if count > 0:
+            del self._stack[-count:]
+        self._stack.extend(values)
+
+    def operands(self, name: str) -> int:
+        """
+        How many values operator ``name`` takes from the top of the stack;
+        raises the operator's error if the stack is too shallow.
+        """
+        return OPERATORS[name].operands(self._stack)
+
+    def apply(self, name: str) -> None:
+        """Apply any registered operator by canonical name (see ``app.domain.operators``)."""
+        op = OPERATORS[name]
+        if not op.variadic and len(self._stack) < op.consumed:
+            op.operands(self._stack)
+        self._handlers[name](self._stack, None)
+
+    def reduce(self, name: str, count: Optional[int] = None) -> Any:
+        """
+        Fold the top ``count`` values (default: the whole stack) into one with a
+        reduction from ``REDUCTIONS`` and return it; on error the stack is unchanged.
+        """
+        if name not in REDUCTIONS:
+            raise InvalidOperationError(f"Unknown reduction: {name!r}")
+        stack = self._stack
+        stack.append(self.numeric.parse(len(stack) if count is None else count))
+        try:
+            self._handlers[name](stack, None)
+        except RPNCalculatorError:
+            stack.pop()
+            raise
+        return stack[-1]
+
+    def execute(self, token: Token) -> None:
+        """Execute a single program token: push a number or apply an operator."""
+        if isinstance(token, (int, float)):
+            self.push(token)
+            return
+        name = OPERATIONS.get(token.lower())
+        if name is not None:
+            self.apply(name)
+            return
+        try:
+            value = float(token)
+        except ValueError:
+            raise InvalidTokenError(f"Unknown token: {token!r}") from None
+        self.push(value)
+
+    def run(self, program: CompiledProgram, trace: bool = False) -> List[List[float]]:
+        """
+        Run a compiled program atomically: on the first error the stack is
+        restored to its state before the call and the error is re-raised. A
+        float program leaving a non-finite value (overflow) fails the same way.
+        Returns the stack after each token when ``trace`` is set.
+        """
+        snapshot = self._stack[:]
+        try:
+            steps = program.run(self._stack, trace, self.numeric)
+            if self.numeric is FLOAT:
+                # Values below the ones a static program reads are untouched
+                start = 0 if program.dynamic else max(0, len(snapshot) - program.required)
+                if not all(map(math.isfinite, self._stack[start:])):
+                    raise InvalidOperationError("Result is not a finite number")
+        except RPNCalculatorError:
+            self._stack = snapshot
+            raise
+        return steps
+
+    def evaluate(self, program: Program, trace: bool = False) -> List[List[float]]:
+        return self.run(compile_program(program), trace)
+
+    def streaming(self) -> StreamEvaluator:
+        """
+        Evaluator running a program fed in chunks against this stack; not atomic
+        (see ``app.domain.streaming``).
+        """
+        return StreamEvaluator(self._stack, self.numeric)
+
+class NumericCalculator(RPNCalculator):
+    """
+    Calculator over a non-float numeric backend (see ``app.domain.numeric``).
+    Values are converted once on push and stay in the backend's type; operators
+    dispatch to the backend's handlers.
+    """
+
+    def __init__(self, numeric: NumericBackend) -> None:
+        self.numeric = numeric
+        self._stack: List[Any] = []  # type: ignore[assignment]
+        self._handlers = numeric.handlers
+        self._parse = numeric.parse
+
+    @property
+    def stack(self) -> List[Any]:
+        return list(self._stack)
+
+    def view(self) -> memoryview:
+        raise TypeError(f"{self.numeric.name} stacks have no float64 buffer to view")
+
+    def push(self, value: Any) -> None:
+        self._stack.append(self._parse(value))
+
+    def load(self, values: Sequence[Any]) -> None:
+        self._stack = self.numeric.new_stack(values)
+
+    def extend(self, values: Iterable[Any]) -> int:
+        new = self.numeric.convert(values)
+        self._stack.extend(new)
+        return len(new)
+
+    def memory_bytes(self) -> int:
+        return sys.getsizeof(self._stack) + sum(map(sys.getsizeof, self._stack))
+
+    def _operate(self, name: str) -> Any:
+        self.apply(name)
+        return self._stack[-1]
+
+    def add(self) -> Any:
+        return self._operate("add")
+
+    def subtract(self) -> Any:
+        return self._operate("subtract")
+
+    def multiply(self) -> Any:
+        return self._operate("multiply")
+
+    def divide(self) -> Any:
+        return self._operate("divide")
+
+    def sqrt(self) -> Any:
+        return self._operate("sqrt")
+
+    def power(self) -> Any:
+        return self._operate("power")
+
+    def execute(self, token: Token) -> None:
+        if isinstance(token, str):
+            name = OPERATIONS.get(token.lower())
+            if name is not None:
+                self.apply(name)
+                return
+        self.push(token)
+
+def create_calculator(numeric: NumericBackend = FLOAT) -> RPNCalculator:
+    """A calculator storing ``numeric`` values (the float64 one by default)."""
+    if numeric.name == "float":
+        return RPNCalculator()
+    return NumericCalculator(numeric)
+
+def _stdin_chunks(chunk_size: int) -> Iterator[bytes]:
+    return iter(lambda: sys.stdin.buffer.read(chunk_size), b"")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line: ``python -m app.domain.rpn_calculator run program.rpn``
+    streams the program (``-`` for stdin) and prints the final stack, one value
+    per line, bottom first.
+    """
+    parser = argparse.ArgumentParser(prog="python -m app.domain.rpn_calculator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Evaluate an RPN program file, streaming it")
+    run_parser.add_argument("program", help="Program file, or - for stdin")
+    run_parser.add_argument("--numeric", choices=MODES, default="float", help="Numeric mode")
+    run_parser.add_argument("--precision", type=int, help="Significant digits in decimal mode")
+    run_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Bytes per read")
+    args = parser.parse_args(argv)
+
+    try:
+        calc = create_calculator(get_backend(args.numeric, args.precision))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.program == "-":
+        chunks = _stdin_chunks(args.chunk_size)
+    else:
+        chunks = read_chunks(args.program, args.chunk_size)
+    try:
+        calc.streaming().run(chunks)
+    except (RPNCalculatorError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    for value in calc.numeric.export(calc.stack):
+        print(value)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Streaming RPN evaluation - run programs far larger than memory.
+
+A ``StreamEvaluator`` is fed a program in chunks (a request body, a
+memory-mapped file, stdin) and executes each token as soon as it is complete,
+so only the live stack and one partial token are ever held. Operator tokens
+are resolved once and cached; literals are parsed as they arrive.
+
+Unlike ``CompiledProgram`` there is no static depth check: every fixed-arity
+operator checks its operands as it runs. In float mode literals and results
+must be finite, with the errors ``RPNCalculator.run`` raises for programs run
+whole. Evaluation is not atomic; on error
+the stack is left as it was after the last successful token, and callers that
+need atomicity snapshot the stack first (see ``StackService.streaming``).
+"""
+import codecs
+import math
+import mmap
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from app.core.exceptions import InvalidOperationError, InvalidTokenError, RPNCalculatorError
+from app.domain.compiler import _checked
+from app.domain.numeric import FLOAT, NumericBackend
+from app.domain.operators import OPERATIONS, OPERATORS, Handler, Stack
+
+Chunk = Union[str, bytes, bytearray, memoryview]
+
+# Bytes read per chunk from files and stdin
+CHUNK_SIZE = 1 << 20
+# Longest token accepted; guards against unbounded buffering of input without spaces
+MAX_TOKEN_LENGTH = 4096
+# Distinct operator spellings cached ("add", "ADD", "+", ...)
+_MAX_CACHED = 1024
+
+class StreamEvaluator:
+    """Incremental evaluator of one program against ``stack``."""
+
+    def __init__(self, stack: Stack, numeric: NumericBackend = FLOAT) -> None:
+        self.stack = stack
+        self.numeric = numeric
+        self.tokens = 0
+        self._partial = ""
+        # Invalid UTF-8 becomes U+FFFD and so an unknown token, not a decode error
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._operators: Dict[str, Tuple[Handler, Any]] = {}
+
+    def feed(self, chunk: Chunk) -> None:
+        """Execute the complete tokens of ``chunk``; a trailing partial token waits for more."""
+        text = chunk if isinstance(chunk, str) else self._decoder.decode(chunk)
+        if self._partial:
+            text = self._partial + text
+        tokens = text.split()
+        if text and not text[-1].isspace():
+            self._partial = tokens.pop()
+            if len(self._partial) > MAX_TOKEN_LENGTH:
+                index = self.tokens + len(tokens)
+                raise InvalidTokenError(
+                    f"Token longer than {MAX_TOKEN_LENGTH} characters (token {index})"
+                )
+        else:
+            self._partial = ""
+        self._execute(tokens)
+
+    def close(self) -> None:
+        """Execute the last token (the program need not end with whitespace)."""
+        tail = self._decoder.decode(b"", final=True)
+        self.feed(tail + " ")
+
+    def run(self, chunks: Iterable[Chunk]) -> int:
+        """Feed every chunk, close, and return the number of tokens executed."""
+        for chunk in chunks:
+            self.feed(chunk)
+        self.close()
+        return self.tokens
+
+    def _execute(self, tokens: List[str]) -> None:
+        s = self.stack
+        parse = self.numeric.parse
+        finite = math.isfinite if self.numeric is FLOAT else None
+        operators = self._operators
+        count = self.tokens
+        token = ""
+        error: Optional[RPNCalculatorError] = None
+        try:
+            for token in tokens:
+                instruction = operators.get(token)
+                if instruction is None:
+                    try:
+                        value = parse(token)
+                    except (ValueError, RPNCalculatorError) as e:
+                        instruction = self._operator(token, e)
+                    else:
+                        if finite is not None and not finite(value):
+                            error = InvalidTokenError(
+                                f"{token!r} is not a finite number (token {count})"
+                            )
+                            break
+                        s.append(value)
+                        count += 1
+                        continue
+                handler, arg = instruction
+                handler(s, arg)
+                # Operators leave what they compute on top of the stack
+                if finite is not None and s and not finite(s[-1]):
+                    error = InvalidOperationError("Result is not a finite number")
+                    break
+                count += 1
+        except RPNCalculatorError as e:
+            raise type(e)(f"{e} (token {count}: {token!r})") from e
+        finally:
+            self.tokens = count
+        if error is not None:
+            raise error
+
+    def _operator(self, token: str, error: Exception) -> Tuple[Handler, Any]:
+        """The cached instruction of an operator token; re-raises ``error`` for other tokens."""
+        name = OPERATIONS.get(token.lower())
+        if name is None:
+            if isinstance(error, RPNCalculatorError):
+                raise error
+            raise InvalidTokenError(f"Unknown token: {token!r}") from None
+        op = OPERATORS[name]
+        handler = self.numeric.handlers[name]
+        # Variadic operators check their own operands; the others are checked here
+        instruction = (handler, None) if op.variadic else (_checked, (handler, op))
+        if len(self._operators) < _MAX_CACHED:
+            self._operators[token] = instruction
+        return instruction
+
+def read_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """The bytes of the file at ``path``, memory-mapped and sliced into chunks."""
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files cannot be mapped
+            return
+        with mapped:
+            for offset in range(0, len(mapped), chunk_size):
+                yield mapped[offset:offset + chunk_size]
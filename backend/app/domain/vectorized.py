@@ -0,0 +1,191 @@
+"""
+Vectorized RPN evaluation - run one program over columns of inputs with NumPy.
+
+Each stack slot holds an array with one element per input row. Errors that the
+scalar calculator raises per value (division by zero, domain errors) are
+recorded per row in masks instead of aborting the whole batch; a failed row
+keeps failing and its results are reported as missing.
+"""
+from typing import Any, Callable, Dict, List, Sequence, Union
+from app.core.exceptions import InvalidOperationError
+from app.domain.compiler import CompiledProgram, Program, compile_program
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+NUMPY_AVAILABLE = np is not None
+
+# Per-row error codes; a row keeps the first error it hits
+OK = 0
+DIVISION_BY_ZERO = 1
+INVALID_OPERATION = 2
+
+class VectorResult:
+    """Final stack of a vectorized run plus per-row error masks."""
+
+    def __init__(self, stack: List[Any], errors: Any) -> None:
+        self.stack = stack
+        self.errors = errors
+
+    @property
+    def rows(self) -> int:
+        return int(self.errors.shape[0])
+
+    @property
+    def failed(self) -> Any:
+        return self.errors != OK
+
+    @property
+    def division_by_zero(self) -> Any:
+        return self.errors == DIVISION_BY_ZERO
+
+    @property
+    def invalid_operation(self) -> Any:
+        return self.errors == INVALID_OPERATION
+
+    def columns(self) -> List[List[Any]]:
+        """Stack slots as lists, with ``None`` for failed rows."""
+        failed = self.failed
+        if not failed.any():
+            return [column.tolist() for column in self.stack]
+        result = []
+        for column in self.stack:
+            values = column.astype(object)
+            values[failed] = None
+            result.append(values.tolist())
+        return result
+
+class _VectorRun:
+    def __init__(self, rows: int) -> None:
+        self.errors = np.zeros(rows, dtype=np.int8)
+
+    def fail(self, mask: Any, code: int) -> None:
+        self.errors[mask & (self.errors == OK)] = code
+
+def _add(run: _VectorRun, s: List[Any]) -> None:
+    b = s.pop()
+    s[-1] = s[-1] + b
+
+def _subtract(run: _VectorRun, s: List[Any]) -> None:
+    b = s.pop()
+    s[-1] = s[-1] - b
+
+def _multiply(run: _VectorRun, s: List[Any]) -> None:
+    b = s.pop()
+    s[-1] = s[-1] * b
+
+def _divide(run: _VectorRun, s: List[Any]) -> None:
+    b = s.pop()
+    zero = b == 0
+    run.fail(zero, DIVISION_BY_ZERO)
+    s[-1] = np.divide(s[-1], np.where(zero, np.nan, b))
+
+def _sqrt(run: _VectorRun, s: List[Any]) -> None:
+    a = s[-1]
+    negative = a < 0
+    run.fail(negative, INVALID_OPERATION)
+    s[-1] = np.sqrt(np.where(negative, np.nan, a))
+
+def _power(run: _VectorRun, s: List[Any]) -> None:
+    b = s.pop()
+    result = np.power(s[-1], b)
+    run.fail(~np.isfinite(result), INVALID_OPERATION)
+    s[-1] = result
+
+def _mod(run: _VectorRun, s: List[Any]) -> None:
+    b = s.pop()
+    zero = b == 0
+    run.fail(zero, DIVISION_BY_ZERO)
+    s[-1] = np.mod(s[-1], np.where(zero, np.nan, b))
+
+def _elementwise(fn: Callable[[Any], Any]) -> Callable[[_VectorRun, List[Any]], None]:
+    """Unary NumPy function; rows where it leaves the real domain fail."""
+    def op(run: _VectorRun, s: List[Any]) -> None:
+        result = fn(s[-1])
+        run.fail(~np.isfinite(result) & np.isfinite(s[-1]), INVALID_OPERATION)
+        s[-1] = result
+
+    return op
+
+def _binary(fn: Callable[[Any, Any], Any]) -> Callable[[_VectorRun, List[Any]], None]:
+    def op(run: _VectorRun, s: List[Any]) -> None:
+        b = s.pop()
+        s[-1] = fn(s[-1], b)
+
+    return op
+
+def _swap(run: _VectorRun, s: List[Any]) -> None:
+    s[-1], s[-2] = s[-2], s[-1]
+
+def _dup(run: _VectorRun, s: List[Any]) -> None:
+    s.append(s[-1])
+
+def _drop(run: _VectorRun, s: List[Any]) -> None:
+    s.pop()
+
+def _over(run: _VectorRun, s: List[Any]) -> None:
+    s.append(s[-2])
+
+def _rot(run: _VectorRun, s: List[Any]) -> None:
+    s[-3], s[-2], s[-1] = s[-2], s[-1], s[-3]
+
+# Variadic operators (count taken from the stack) have no per-row equivalent
+VECTOR_OPS: Dict[str, Callable[[_VectorRun, List[Any]], None]] = {
+    "add": _add,
+    "subtract": _subtract,
+    "multiply": _multiply,
+    "divide": _divide,
+    "mod": _mod,
+    "sqrt": _sqrt,
+    "power": _power,
+    "abs": _elementwise(lambda a: np.abs(a)),
+    "neg": _elementwise(lambda a: -a),
+    "min": _binary(lambda a, b: np.minimum(a, b)),
+    "max": _binary(lambda a, b: np.maximum(a, b)),
+    "exp": _elementwise(lambda a: np.exp(a)),
+    "ln": _elementwise(lambda a: np.log(a)),
+    "log": _elementwise(lambda a: np.log10(a)),
+    "sin": _elementwise(lambda a: np.sin(a)),
+    "cos": _elementwise(lambda a: np.cos(a)),
+    "tan": _elementwise(lambda a: np.tan(a)),
+    "asin": _elementwise(lambda a: np.arcsin(a)),
+    "acos": _elementwise(lambda a: np.arccos(a)),
+    "atan": _elementwise(lambda a: np.arctan(a)),
+    "swap": _swap,
+    "dup": _dup,
+    "drop": _drop,
+    "over": _over,
+    "rot": _rot,
+}
+
+def evaluate_vectorized(
+    program: Union[CompiledProgram, Program], columns: Sequence[Sequence[float]]
+) -> VectorResult:
+    """
+    Evaluate ``program`` once per input row. ``columns`` is the initial stack,
+    bottom first; every column must have the same number of rows.
+    """
+    if np is None:
+        raise RuntimeError("Vectorized evaluation requires numpy")
+    if not isinstance(program, CompiledProgram):
+        program = compile_program(program)
+    unsupported = [name for name in program.names if name != "push" and name not in VECTOR_OPS]
+    if unsupported:
+        raise InvalidOperationError(f"{unsupported[0]} is not supported in vectorized evaluation")
+    stack = [np.asarray(column, dtype=np.float64) for column in columns]
+    lengths = {column.shape for column in stack}
+    if len(lengths) > 1 or any(len(shape) != 1 for shape in lengths):
+        raise InvalidOperationError("Input columns must be one-dimensional and of equal length")
+    rows = stack[0].shape[0] if stack else 1
+    program.check_depth(len(stack))
+
+    run = _VectorRun(rows)
+    with np.errstate(all="ignore"):
+        for name, (_, value) in zip(program.names, program.code):
+            if name == "push":
+                stack.append(np.full(rows, value))
+            else:
+                VECTOR_OPS[name](run, stack)
+    return VectorResult(stack, run.errors)
@@ -1,7 +1,42 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import routes
-from app.core.config import APP_NAME, APP_VERSION, APP_DESCRIPTION, API_PREFIX
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api import admin, routes
+from app.core.config import (
+    APP_NAME,
+    APP_VERSION,
+    APP_DESCRIPTION,
+    API_PREFIX,
+    SESSION_SWEEP_INTERVAL,
+    METRICS_MULTIPROC_DIR,
+    PROFILE_TOKEN,
+    PROFILE_SAMPLE_RATE,
+)
+from app.domain.operators import OPERATORS
+from app.services.jobs import get_job_runner
+from app.services.metrics import (
+    CONTENT_TYPE,
+    Metrics,
+    MetricsMiddleware,
+    get_metrics,
+    set_metrics,
+)
+from app.services.profiling import ProfilingMiddleware, get_profile_store
+from app.services.result_cache import get_result_cache
+from app.services.session_store import SessionLeaseLostError, SessionSweeper
+from app.services.stack_service import get_session_store
+
+session_sweeper = SessionSweeper(get_session_store, SESSION_SWEEP_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    session_sweeper.start()
+    yield
+    session_sweeper.stop()
+    get_session_store().close()
+    get_job_runner().shutdown()
 
 app = FastAPI(
     title=APP_NAME,
@@ -10,6 +45,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
 ALLOWED_ORIGINS = [
@@ -25,8 +61,21 @@ app.add_middleware(
     allow_headers=["*"],
     max_age=600,
 )
+app.add_middleware(MetricsMiddleware, get_metrics=get_metrics)
+app.add_middleware(
+    ProfilingMiddleware,
+    store=get_profile_store(),
+    token=PROFILE_TOKEN,
+    sample_rate=PROFILE_SAMPLE_RATE,
+)
 
 app.include_router(routes.router, prefix=API_PREFIX)
+app.include_router(admin.router, prefix=f"{API_PREFIX}/admin", tags=["Admin"])
+
+@app.exception_handler(SessionLeaseLostError)
+async def session_lease_lost(request: Request, exc: SessionLeaseLostError) -> JSONResponse:
+    # Another request may have changed the session meanwhile; this one was not saved
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 @app.get("/", tags=["Health"])
 def root():
@@ -35,3 +84,18 @@ def root():
 @app.get("/health", tags=["Health"])
 def health():
     return {"status": "ok"}
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def metrics():
+    results = get_result_cache().stats()
+    gauges = {
+        "rpn_live_sessions": get_session_store().stats()["live_sessions"],
+        "rpn_result_cache_entries": results["size"],
+        "rpn_result_cache_bytes": results["bytes"],
+        "rpn_result_cache_hit_ratio": results["hit_ratio"],
+    }
+    return PlainTextResponse(get_metrics().render(gauges), media_type=CONTENT_TYPE)
+
+_routes = [route.name for route in app.routes]
+_routes += [routes.operator_route(name) for name in OPERATORS]
+set_metrics(Metrics(_routes, directory=METRICS_MULTIPROC_DIR or None))
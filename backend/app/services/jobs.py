@@ -0,0 +1,328 @@
+"""
+Batch jobs - evaluate many independent RPN programs on every core.
+
+A job is a list of tasks, each a program and the initial stack it runs on. The
+tasks are split into chunks and every chunk is evaluated by a
+``ProcessPoolExecutor`` worker, so one IPC round trip covers many programs.
+Each worker keeps its own compiled program cache, so tasks repeating a
+program compile it once per worker.
+
+Results are kept in task order for polling (``Job.snapshot``) and can also be
+consumed chunk by chunk as workers finish (``Job.completed_chunks``). Finished
+jobs are dropped, oldest first, once more than ``keep`` jobs are held; at most
+``max_pending`` jobs may be queued or running at once.
+
+Workers are started with the ``spawn`` method: forking a server process that
+runs an event loop and other threads is unsafe. The pool starts on the first
+job.
+
+    python -m app.services.jobs run tasks.jsonl [-o results.jsonl] [--workers 8]
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import sys
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from threading import Lock
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+)
+from app.core.config import JOBS_KEEP, JOBS_MAX_PENDING, JOBS_WORKERS, PROGRAM_CACHE_SIZE
+from app.core.exceptions import RPNCalculatorError
+from app.domain.compiler import Program, ProgramCache
+from app.domain.numeric import MODES, get_backend
+from app.domain.rpn_calculator import create_calculator
+
+# (program, initial stack bottom first)
+Task = Tuple[Program, Sequence[Any]]
+# (final stack, None) or (None, error message)
+Result = Tuple[Optional[List[Any]], Optional[str]]
+
+# Chunks per worker when the chunk size is not given: enough to balance uneven
+# programs across workers, few enough to amortize the IPC of each chunk
+_CHUNKS_PER_WORKER = 4
+MAX_CHUNK_SIZE = 1_000
+
+# Compiled programs of the current worker process
+_programs: Optional[ProgramCache] = None
+
+class JobQueueFullError(RuntimeError):
+    """Raised by ``JobRunner.submit`` when ``max_pending`` jobs are already queued or running."""
+
+def run_tasks(
+    tasks: Sequence[Task], mode: str = "float", precision: Optional[int] = None
+) -> List[Result]:
+    """Evaluate ``tasks`` one after the other (the work of one chunk in a worker)."""
+    global _programs
+    if _programs is None:
+        _programs = ProgramCache(PROGRAM_CACHE_SIZE)
+    numeric = get_backend(mode, precision)
+    calc = create_calculator(numeric)
+    results: List[Result] = []
+    for program, stack in tasks:
+        calc.clear()
+        try:
+            calc.extend(stack)
+            calc.run(_programs.get(program))
+        except RPNCalculatorError as e:
+            results.append((None, str(e)))
+        else:
+            results.append((numeric.export(calc.stack), None))
+    return results
+
+def _outcome(future: "Future[List[Result]]", count: int) -> List[Result]:
+    """The results of a finished chunk; a chunk whose worker failed fails every task."""
+    try:
+        return future.result()
+    except Exception as e:
+        return [(None, f"Worker failed: {e!r}")] * count
+
+class Job:
+    """Progress and ordered results of one batch of tasks."""
+
+    def __init__(self, job_id: str, total: int) -> None:
+        self.id = job_id
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.results: List[Optional[Result]] = [None] * total
+        # (index of the first task, task count, future) per chunk
+        self._chunks: List[Tuple[int, int, "Future[List[Result]]"]] = []
+        self._lock = Lock()
+
+    def add_chunk(self, start: int, count: int, future: "Future[List[Result]]") -> None:
+        self._chunks.append((start, count, future))
+        future.add_done_callback(partial(self._collect, start, count))
+
+    def _collect(self, start: int, count: int, future: "Future[List[Result]]") -> None:
+        if future.cancelled():
+            return
+        results = _outcome(future, count)
+        failed = sum(error is not None for _, error in results)
+        with self._lock:
+            self.results[start:start + count] = results
+            self.completed += count
+            self.failed += failed
+
+    @property
+    def done(self) -> bool:
+        return self.completed >= self.total
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": "done" if self.done else "running",
+                "total": self.total,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Status plus every result in task order (None while pending)."""
+        with self._lock:
+            results = [None if r is None else result_dict(r) for r in self.results]
+        return {**self.status(), "results": results}
+
+    def chunks(self, ordered: bool = True) -> Iterator[Tuple[int, List[Result]]]:
+        """Block for each chunk, in task order or as they complete: (first index, results)."""
+        counts = {future: (start, count) for start, count, future in self._chunks}
+        futures = [future for _, _, future in self._chunks]
+        for future in futures if ordered else as_completed(futures):
+            start, count = counts[future]
+            if not future.cancelled():
+                yield start, _outcome(future, count)
+
+    async def completed_chunks(self) -> AsyncIterator[Tuple[int, List[Result]]]:
+        """``chunks(ordered=False)`` without blocking the event loop."""
+        async def wait(start: int, count: int, future: "Future[List[Result]]") -> Any:
+            await asyncio.wait([asyncio.wrap_future(future)])
+            return start, _outcome(future, count)
+
+        pending = [wait(*chunk) for chunk in self._chunks if not chunk[2].cancelled()]
+        for next_chunk in asyncio.as_completed(pending):
+            yield await next_chunk
+
+    def cancel(self) -> None:
+        for _, _, future in self._chunks:
+            future.cancel()
+
+def result_dict(result: Result) -> Dict[str, Any]:
+    """JSON form of a task result: ``{"stack": [...]}`` or ``{"error": "..."}``."""
+    stack, error = result
+    return {"stack": stack} if error is None else {"error": error}
+
+class JobRunner:
+    """Process pool plus the jobs it is running or has finished."""
+
+    def __init__(
+        self, workers: Optional[int] = None, keep: int = 100, max_pending: Optional[int] = None
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self._keep = keep
+        self._max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = Lock()
+
+    def _pool(self, restart: bool = False) -> ProcessPoolExecutor:
+        with self._lock:
+            if restart and self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def chunk_size(self, total: int) -> int:
+        """Default chunk size: a few chunks per worker, at most MAX_CHUNK_SIZE tasks."""
+        size = math.ceil(total / (self.workers * _CHUNKS_PER_WORKER))
+        return max(1, min(MAX_CHUNK_SIZE, size))
+
+    def submit(
+        self,
+        tasks: Sequence[Task],
+        mode: str = "float",
+        precision: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+    ) -> Job:
+        """
+        Start evaluating ``tasks``; raises ValueError for an unknown numeric mode
+        and JobQueueFullError when ``max_pending`` jobs are unfinished.
+        """
+        get_backend(mode, precision)
+        size = chunk_size or self.chunk_size(len(tasks))
+        job = Job(uuid.uuid4().hex, len(tasks))
+        with self._lock:
+            # Registered before its chunks are submitted, so that it holds its slot
+            pending = sum(not held.done for held in self._jobs.values())
+            if self._max_pending is not None and pending >= self._max_pending:
+                raise JobQueueFullError(f"{pending} jobs are already pending; retry later")
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            pool = self._pool()
+            for start in range(0, len(tasks), size):
+                chunk = list(tasks[start:start + size])
+                try:
+                    future = pool.submit(run_tasks, chunk, mode, precision)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); later jobs get a fresh pool
+                    pool = self._pool(restart=True)
+                    future = pool.submit(run_tasks, chunk, mode, precision)
+                job.add_chunk(start, len(chunk), future)
+        except BaseException:
+            self.cancel(job.id)
+            raise
+        return job
+
+    def _prune(self) -> None:
+        excess = len(self._jobs) - self._keep
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel the job's pending chunks and forget it."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+_job_runner = JobRunner(JOBS_WORKERS, JOBS_KEEP, JOBS_MAX_PENDING)
+
+def get_job_runner() -> JobRunner:
+    return _job_runner
+
+# ---------- Command line ----------
+def _read_tasks(stream: TextIO) -> List[Task]:
+    """JSON lines: ``{"program": ..., "stack": [...]}`` or a bare program string."""
+    tasks: List[Task] = []
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from None
+        if isinstance(item, str):
+            tasks.append((item, ()))
+        elif isinstance(item, dict) and "program" in item:
+            tasks.append((item["program"], item.get("stack", ())))
+        else:
+            raise ValueError(f'line {number}: expected a program or {{"program": ...}}')
+    return tasks
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.services.jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Evaluate a JSON-lines file of tasks")
+    run_parser.add_argument("tasks", help="Tasks file, or - for stdin")
+    run_parser.add_argument("-o", "--output", help="Write JSON-lines results here (default stdout)")
+    run_parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    run_parser.add_argument("--chunk-size", type=int, help="Tasks per worker round trip")
+    run_parser.add_argument("--numeric", choices=MODES, default="float", help="Numeric mode")
+    run_parser.add_argument("--precision", type=int, help="Significant digits in decimal mode")
+    run_parser.add_argument(
+        "--unordered", action="store_true", help="Write results as they complete"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        if args.tasks == "-":
+            tasks = _read_tasks(sys.stdin)
+        else:
+            with open(args.tasks, encoding="utf-8") as f:
+                tasks = _read_tasks(f)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    runner = JobRunner(args.workers)
+    try:
+        job = runner.submit(tasks, args.numeric, args.precision, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    try:
+        for start, results in job.chunks(ordered=not args.unordered):
+            for index, result in enumerate(results, start):
+                failed += result[1] is not None
+                out.write(json.dumps({"index": index, **result_dict(result)}) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        runner.shutdown()
+    print(f"{len(tasks)} tasks, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
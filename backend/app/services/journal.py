@@ -0,0 +1,528 @@
+"""
+Durable session journal - an append-only binary log per session plus snapshots.
+
+Every saved mutation appends one record to ``<session>.log``. Records are
+8-byte aligned so the float64 operands can be read straight from an mmap:
+
+    offset  size  field
+    0       1     kind (OP, UNDO, REDO, RESTORE, EXACT)
+    1       1     opcode (index in OPCODES + 1; 0 = name stored inline)
+    2       2     inline name length
+    4       4     crc32 of the rest of the record
+    8       8     sequence (session operation count after the change)
+    16      4     arg (values popped; target version for RESTORE)
+    20      4     number of pushed values (EXACT: length of their text)
+    24      ...   inline name (padded to 8 bytes), then pushed float64 values
+                  (EXACT: the values as formatted, space separated, padded)
+
+EXACT records are OP records of sessions in an exact numeric mode, whose values
+are logged as text and parsed by the session's backend on replay.
+
+Every ``compact_every`` records the session is compacted: its full state is
+written to ``<session>.snap`` (JSON, atomically) and the log truncated. Replay
+loads the snapshot and applies the records whose sequence follows it, stopping
+at the first torn or corrupt record.
+
+``JournalSessionStore`` keeps sessions in process like the memory store and
+journals every save. Like the memory store it serves a single worker process.
+
+Durability follows the fsync policy: ``always`` (every record), ``batch``
+(group commit every ``batch_size`` records) or ``interval`` (at most every
+``interval`` seconds); ``flush`` syncs whatever is pending. The store writes
+under its lock, which keeps each session's records in order, and syncs after
+releasing it, so one session's fsync does not hold up the others.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+from app.services.session_store import InMemorySessionStore, SessionStore
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.services.stack_service import StackService
+
+KIND_OP = 1
+KIND_UNDO = 2
+KIND_REDO = 3
+KIND_RESTORE = 4
+KIND_EXACT = 5
+
+# Append only: a record stores the index of its operation name
+OPCODES = (
+    "push", "clear", "eval",
+    "add", "subtract", "multiply", "divide", "sqrt", "power", "swap", "dup", "drop",
+    "mod", "abs", "neg", "min", "max", "exp", "ln", "log", "sin", "cos", "tan",
+    "asin", "acos", "atan", "sum", "mean", "over", "rot", "pick", "roll",
+    "product", "stddev", "depth", "push_many",
+)
+_OPCODE_BY_NAME = {name: code for code, name in enumerate(OPCODES, start=1)}
+
+FSYNC_POLICIES = ("always", "batch", "interval")
+
+_HEADER = struct.Struct("<BBHIQII")
+
+# Sessions are spread over 256 directories named by the first byte of sha1(id)
+SHARDS = 256
+
+class JournalRecord(NamedTuple):
+    kind: int
+    operation: str
+    sequence: int
+    arg: int
+    values: Tuple[Any, ...]  # float64 values, or the formatted text of EXACT ones
+
+def _padded(length: int) -> int:
+    return (length + 7) & ~7
+
+def encode_record(
+    kind: int, operation: str, sequence: int, arg: int = 0, values: Sequence[Any] = ()
+) -> bytes:
+    """``values`` are floats, or formatted strings for ``KIND_EXACT``."""
+    name = b""
+    opcode = 0
+    if kind in (KIND_OP, KIND_EXACT):
+        if len(values) == 1 and operation == f"push({values[0]})":
+            opcode = _OPCODE_BY_NAME["push"]
+        elif operation != "push":
+            opcode = _OPCODE_BY_NAME.get(operation, 0)
+        if opcode == 0:
+            name = operation.encode()
+    values_at = _HEADER.size + _padded(len(name))
+    if kind == KIND_EXACT:
+        text = " ".join(values).encode()
+        count = len(text)
+        body = bytearray(values_at + _padded(count))
+        body[values_at:values_at + count] = text
+    else:
+        count = len(values)
+        body = bytearray(values_at + 8 * count)
+        struct.pack_into(f"<{count}d", body, values_at, *values)
+    _HEADER.pack_into(body, 0, kind, opcode, len(name), 0, sequence, arg, count)
+    body[_HEADER.size:_HEADER.size + len(name)] = name
+    crc = zlib.crc32(memoryview(body)[8:], zlib.crc32(memoryview(body)[:4]))
+    struct.pack_into("<I", body, 4, crc)
+    return bytes(body)
+
+def iter_records(buffer: Any) -> Iterator[Tuple[JournalRecord, int]]:
+    """Decode records from ``buffer``, yielding each with its end offset."""
+    offset = 0
+    end = len(buffer)
+    while offset + _HEADER.size <= end:
+        kind, opcode, name_len, crc, sequence, arg, count = _HEADER.unpack_from(buffer, offset)
+        name_at = offset + _HEADER.size
+        values_at = name_at + _padded(name_len)
+        record_end = values_at + (_padded(count) if kind == KIND_EXACT else 8 * count)
+        if record_end > end or not KIND_OP <= kind <= KIND_EXACT or opcode > len(OPCODES):
+            return
+        if zlib.crc32(buffer[offset + 8:record_end], zlib.crc32(buffer[offset:offset + 4])) != crc:
+            return
+        values: Tuple[Any, ...]
+        if kind == KIND_EXACT:
+            values = tuple(bytes(buffer[values_at:values_at + count]).decode().split())
+        else:
+            values = struct.unpack_from(f"<{count}d", buffer, values_at)
+        if kind not in (KIND_OP, KIND_EXACT):
+            operation = ""
+        elif opcode == 0:
+            operation = bytes(buffer[name_at:name_at + name_len]).decode()
+        elif OPCODES[opcode - 1] == "push":
+            operation = f"push({values[0]})"
+        else:
+            operation = OPCODES[opcode - 1]
+        yield JournalRecord(kind, operation, sequence, arg, values), record_end
+        offset = record_end
+
+class SessionJournal:
+    """Snapshot and log files of every session under one directory."""
+
+    def __init__(
+        self,
+        directory: str,
+        fsync: str = "batch",
+        batch_size: int = 64,
+        interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync!r}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self._batch_size = batch_size
+        self._interval = interval
+        self._clock = clock
+        self._dirty: Set[Path] = set()
+        self._unsynced = 0
+        self._due = False
+        self._last_sync = clock()
+        self._lock = Lock()
+        self.syncs = 0
+
+    # ---------- layout ----------
+    def _stem(self, session_id: str) -> Path:
+        raw = session_id.encode()
+        name = raw.hex() if len(raw) <= 100 else "h-" + hashlib.sha256(raw).hexdigest()
+        return self.directory / hashlib.sha1(raw).hexdigest()[:2] / name
+
+    def paths(self, session_id: str) -> Tuple[Path, Path]:
+        stem = self._stem(session_id)
+        return stem.with_suffix(".snap"), stem.with_suffix(".log")
+
+    def session_ids(self) -> Iterator[str]:
+        """Ids of all stored sessions (every session has a snapshot)."""
+        for snap in self.directory.glob("*/*.snap"):
+            yield self._session_id(snap)
+
+    @staticmethod
+    def _session_id(snap: Path) -> str:
+        if snap.stem.startswith("h-"):
+            return json.loads(snap.read_bytes())["session_id"]
+        return bytes.fromhex(snap.stem).decode()
+
+    def exists(self, session_id: str) -> bool:
+        return self.paths(session_id)[0].exists()
+
+    def last_written(self, session_id: str) -> Optional[float]:
+        """When the session's files were last written, or None if it is not stored."""
+        return self._last_written(self.paths(session_id)[0])
+
+    @staticmethod
+    def _last_written(snap: Path) -> Optional[float]:
+        log = snap.with_suffix(".log")
+        try:
+            written = snap.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        try:
+            return max(written, log.stat().st_mtime)
+        except FileNotFoundError:
+            return written
+
+    def dormant(self, shard: int, before: float) -> Iterator[str]:
+        """
+        Ids of the sessions of shard directory ``shard`` (0-255) whose files were
+        last written before the ``before`` timestamp.
+        """
+        directory = self.directory / f"{shard:02x}"
+        for snap in directory.glob("*.snap"):
+            written = self._last_written(snap)
+            if written is None or written >= before:
+                continue
+            try:
+                yield self._session_id(snap)
+            except (FileNotFoundError, ValueError):
+                continue
+
+    # ---------- writing ----------
+    def append(self, session_id: str, record: bytes, sync: bool = True) -> None:
+        """
+        Append ``record`` to the session's log. With ``sync`` false, the fsync
+        the policy calls for is left to the caller's next ``sync()``.
+        """
+        _, log = self.paths(session_id)
+        fd = os.open(log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+        self._mark_dirty(log)
+        if sync:
+            self.sync()
+
+    def write_snapshot(self, session_id: str, state: Dict[str, Any], sync: bool = True) -> None:
+        """Atomically replace the snapshot and empty the log it supersedes."""
+        snap, log = self.paths(session_id)
+        snap.parent.mkdir(exist_ok=True)
+        data = json.dumps({"session_id": session_id, **state}, separators=(",", ":")).encode()
+        tmp = snap.with_suffix(".tmp")
+        log_pending = log.exists() and log.stat().st_size > 0
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if log_pending:
+                # the records about to be dropped must not outlive their snapshot
+                f.flush()
+                os.fsync(f.fileno())
+                self.syncs += 1
+        os.replace(tmp, snap)
+        if log_pending:
+            # and neither must the rename: make it durable before emptying the log
+            fd = os.open(snap.parent, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.truncate(log, 0)
+        else:
+            self._mark_dirty(snap)
+            if sync:
+                self.sync()
+
+    def delete(self, session_id: str) -> bool:
+        found = False
+        for path in self.paths(session_id):
+            try:
+                path.unlink()
+                found = True
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self._dirty.discard(path)
+        return found
+
+    def _mark_dirty(self, path: Path) -> None:
+        with self._lock:
+            self._dirty.add(path)
+            self._unsynced += 1
+            self._due = self._due or (
+                self.fsync == "always"
+                or (self.fsync == "batch" and self._unsynced >= self._batch_size)
+                or (self.fsync == "interval" and self._clock() - self._last_sync >= self._interval)
+            )
+
+    def sync(self) -> int:
+        """``flush`` if the fsync policy says the files written so far are due."""
+        with self._lock:
+            due = self._due
+        return self.flush() if due else 0
+
+    def flush(self) -> int:
+        """fsync every file written since the last sync; returns how many were synced."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._unsynced = 0
+            self._due = False
+            self._last_sync = self._clock()
+        for path in dirty:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if dirty:
+            self.syncs += 1
+        return len(dirty)
+
+    # ---------- reading ----------
+    def read(self, session_id: str) -> Optional[Tuple[Dict[str, Any], List[JournalRecord]]]:
+        """
+        Snapshot state and the valid log records after it, or None when the
+        session is not stored. A torn tail is cut off the log.
+        """
+        snap, log = self.paths(session_id)
+        try:
+            state = json.loads(snap.read_bytes())
+        except FileNotFoundError:
+            return None
+        records: List[JournalRecord] = []
+        try:
+            size = log.stat().st_size
+        except FileNotFoundError:
+            return state, records
+        if size == 0:
+            return state, records
+        valid = 0
+        with open(log, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for record, valid in iter_records(data):
+                records.append(record)
+        if valid < size:
+            os.truncate(log, valid)
+        return state, records
+
+class JournalSessionStore(InMemorySessionStore):
+    """
+    In-process session registry made durable by a ``SessionJournal``: every
+    save appends the session's last change to its log (or writes a snapshot
+    when several changes happened since the last save).
+
+    Sessions are paged in lazily: nothing is read at startup, and a session is
+    replayed from disk the first time it is loaded. Hot sessions stay resident;
+    when the count or memory bound is exceeded, the least recently used ones
+    are spilled (compacted into their snapshot so the next fault-in reads one
+    file) and dropped from memory. Deleted and expired sessions are removed
+    from disk; dormant sessions on disk expire one shard directory per sweep.
+    """
+
+    # Disk I/O: keep it off the event loop
+    asave = SessionStore.asave
+    adelete = SessionStore.adelete
+
+    def __init__(
+        self,
+        service_cls: Type["StackService"],
+        directory: str,
+        fsync: str = "batch",
+        fsync_batch: int = 64,
+        fsync_interval: float = 1.0,
+        compact_every: int = 1000,
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(service_cls, max_sessions, max_bytes, ttl, clock)
+        self.journal = SessionJournal(directory, fsync, fsync_batch, fsync_interval)
+        self._compact_every = compact_every
+        self._journaled: Dict[str, int] = {}  # session id -> operation count on disk
+        self._log_records: Dict[str, int] = {}  # session id -> records since its snapshot
+        self.replayed = 0
+        self.faults = 0
+        self.spills = 0
+        self._next_shard = 0
+
+    async def aload(self, session_id: str) -> "StackService":
+        # Resident sessions need no I/O. Faults go to a worker thread, and so does
+        # waiting for the lock while another thread holds it for disk I/O.
+        if self._lock.acquire(blocking=False):
+            try:
+                if session_id in self._sessions and not self._expired(session_id, self._clock()):
+                    return self.load(session_id)
+            finally:
+                self._lock.release()
+        return await SessionStore.aload(self, session_id)
+
+    def save(self, service: "StackService") -> None:
+        with self._lock:
+            if self._sessions.get(service.session_id) is not service:
+                return
+            super().save(service)
+            self._write(service)
+        self.journal.sync()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            removed = super().delete(session_id)
+            return self.journal.delete(session_id) or removed
+
+    def sweep(self) -> int:
+        expired = super().sweep()
+        if self._ttl is not None:
+            shard, self._next_shard = self._next_shard, (self._next_shard + 1) % SHARDS
+            before = time.time() - self._ttl
+            for session_id in self.journal.dormant(shard, before):
+                with self._lock:
+                    # Checked again under the lock: it may have been faulted in or
+                    # written since the scan
+                    if session_id in self._sessions:
+                        continue
+                    written = self.journal.last_written(session_id)
+                    if written is None or written >= before:
+                        continue
+                    if self.journal.delete(session_id):
+                        self.expirations += 1
+                        expired += 1
+        self.journal.flush()
+        return expired
+
+    def close(self) -> None:
+        self.journal.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "backend": "journal",
+            "fsync": self.journal.fsync,
+            "syncs": self.journal.syncs,
+            "replayed": self.replayed,
+            "faults": self.faults,
+            "spills": self.spills,
+        }
+
+    def _create(self, session_id: str) -> "StackService":
+        stored = self.journal.read(session_id)
+        if stored is None:
+            return self._service_cls(session_id)
+        state, records = stored
+        self.faults += 1
+        service = self._service_cls.from_state(session_id, state)
+        count = service.operation_count
+        for record in records:
+            if record.sequence <= count:
+                continue  # already in the snapshot
+            if record.sequence != count + 1:
+                break
+            _replay(service, record)
+            count += 1
+            self.replayed += 1
+        self._journaled[session_id] = count
+        self._log_records[session_id] = len(records)
+        return service
+
+    def _on_remove(self, service: "StackService", reason: str) -> None:
+        session_id = service.session_id
+        self._journaled.pop(session_id, None)
+        if self._log_records.pop(session_id, 0) and reason == "evict":
+            self.journal.write_snapshot(session_id, service.to_state(), sync=False)
+            self.spills += 1
+        if reason != "evict":
+            self.journal.delete(session_id)
+
+    def _write(self, service: "StackService") -> None:
+        session_id = service.session_id
+        count = service.operation_count
+        previous = self._journaled.get(session_id)
+        if count == previous:
+            return
+        records = self._log_records.get(session_id, 0)
+        record = None
+        if previous is not None and count == previous + 1 and records < self._compact_every:
+            record = _encode_change(service)
+        if record is None:
+            self.journal.write_snapshot(session_id, service.to_state(), sync=False)
+            self._log_records[session_id] = 0
+        else:
+            self.journal.append(session_id, record, sync=False)
+            self._log_records[session_id] = records + 1
+        self._journaled[session_id] = count
+
+def _encode_change(service: "StackService") -> Optional[bytes]:
+    """
+    Journal record for the last change of ``service``, or None when it needs a
+    snapshot (numeric mode switches, which restart history).
+    """
+    operation = service.last_operation or ""
+    sequence = service.operation_count
+    if operation.startswith("numeric("):
+        return None
+    if operation == "undo":
+        return encode_record(KIND_UNDO, operation, sequence)
+    if operation == "redo":
+        return encode_record(KIND_REDO, operation, sequence)
+    if operation.startswith("restore("):
+        return encode_record(KIND_RESTORE, operation, sequence, service.version)
+    delta = service.last_delta()
+    kind = KIND_OP if service.numeric.name == "float" else KIND_EXACT
+    return encode_record(kind, operation, sequence, delta["popped"], delta["pushed"])
+
+def _replay(service: "StackService", record: JournalRecord) -> None:
+    if record.kind == KIND_OP:
+        service.apply_change(record.operation, record.arg, record.values)
+    elif record.kind == KIND_EXACT:
+        service.apply_change(record.operation, record.arg, service.numeric.convert(record.values))
+    elif record.kind == KIND_UNDO:
+        service.perform("undo")
+    elif record.kind == KIND_REDO:
+        service.perform("redo")
+    else:
+        service.jump(record.arg)
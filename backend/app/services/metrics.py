@@ -0,0 +1,235 @@
+"""
+Prometheus metrics - request latency per route, error counts per exception type
+and stack depth distribution.
+
+Every series lives in a slot of one preallocated float array whose layout is
+fixed when the ``Metrics`` object is built (route and error names are known up
+front), so recording a request is an index lookup plus a few increments: no
+label dicts or metric objects are allocated per request.
+
+Multi-worker deployments (gunicorn) set ``METRICS_MULTIPROC_DIR``: each worker
+then keeps its array in an mmap-backed file ``rpn-metrics-<pid>.db`` in that
+directory and ``/metrics`` sums the files of all workers. Clear the directory
+before starting the server.
+"""
+import mmap
+import os
+import zlib
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+from app.core.exceptions import RPNCalculatorError
+
+# Upper bounds (le) of the histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096)
+
+OTHER = "other"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def error_names() -> List[str]:
+    """Exception types counted individually: every RPNCalculatorError subclass."""
+    names = set()
+    pending = [RPNCalculatorError]
+    while pending:
+        cls = pending.pop()
+        names.add(cls.__name__)
+        pending.extend(cls.__subclasses__())
+    return sorted(names) + ["ValueError"]
+
+class Metrics:
+    """
+    Fixed-layout metric slots. Slot 0 holds a fingerprint of the layout so that
+    files written by workers running another version are ignored.
+    """
+
+    def __init__(
+        self,
+        routes: Iterable[str],
+        errors: Optional[Iterable[str]] = None,
+        directory: Optional[str] = None,
+    ) -> None:
+        self.routes = sorted(set(routes)) + [OTHER]
+        self.errors = list(errors if errors is not None else error_names()) + [OTHER]
+        self._route_slots: Dict[str, int] = {}
+        self._error_slots: Dict[str, int] = {}
+        self._route_size = len(LATENCY_BUCKETS) + 3  # buckets, +Inf, sum, failures
+        offset = 1
+        for name in self.routes:
+            self._route_slots[name] = offset
+            offset += self._route_size
+        for name in self.errors:
+            self._error_slots[name] = offset
+            offset += 1
+        self._depth_slot = offset
+        self.size = offset + len(DEPTH_BUCKETS) + 2  # buckets, +Inf, sum
+        self.fingerprint = float(zlib.crc32("\n".join(self.routes + self.errors).encode()))
+        self.directory = directory
+        self._lock = Lock()
+        self._mmap: Optional[mmap.mmap] = None
+        self._slots: Any = None
+        self._open()
+
+    # ---------- storage ----------
+    def _open(self) -> None:
+        if self.directory is None:
+            self._slots = array("d", bytes(8 * self.size))
+        else:
+            path = Path(self.directory) / f"rpn-metrics-{os.getpid()}.db"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w+b") as f:
+                f.truncate(8 * self.size)
+                self._mmap = mmap.mmap(f.fileno(), 8 * self.size)
+            self._slots = memoryview(self._mmap).cast("d")
+        self._slots[0] = self.fingerprint
+
+    def reopen(self) -> None:
+        """Start a fresh file after ``fork`` so workers do not share the parent's."""
+        if self.directory is not None:
+            self._open()
+
+    def snapshot(self) -> Sequence[float]:
+        """Slot values, summed over all worker files in multiprocess mode."""
+        if self.directory is None:
+            return array("d", self._slots)
+        total = array("d", bytes(8 * self.size))
+        for path in Path(self.directory).glob("rpn-metrics-*.db"):
+            data = path.read_bytes()
+            if len(data) != 8 * self.size:
+                continue
+            values = array("d", data)
+            if values[0] != self.fingerprint:
+                continue
+            for i in range(1, self.size):
+                total[i] += values[i]
+        total[0] = self.fingerprint
+        return total
+
+    # ---------- recording ----------
+    def observe_request(self, route: Optional[str], seconds: float, failed: bool) -> None:
+        base = self._route_slots.get(route) if route is not None else None
+        if base is None:
+            base = self._route_slots[OTHER]
+        bucket = bisect_left(LATENCY_BUCKETS, seconds)
+        n = len(LATENCY_BUCKETS)
+        slots = self._slots
+        with self._lock:
+            slots[base + bucket] += 1
+            slots[base + n + 1] += seconds
+            if failed:
+                slots[base + n + 2] += 1
+
+    def count_error(self, exc: BaseException) -> None:
+        slot = self._error_slots.get(type(exc).__name__)
+        if slot is None:
+            slot = self._error_slots[OTHER]
+        with self._lock:
+            self._slots[slot] += 1
+
+    def observe_depth(self, depth: int) -> None:
+        base = self._depth_slot
+        bucket = bisect_left(DEPTH_BUCKETS, depth)
+        with self._lock:
+            self._slots[base + bucket] += 1
+            self._slots[base + len(DEPTH_BUCKETS) + 1] += depth
+
+    # ---------- exposition ----------
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text exposition format; ``gauges`` are added as-is."""
+        values = self.snapshot()
+        n = len(LATENCY_BUCKETS)
+        lines = [
+            "# HELP rpn_request_duration_seconds Request latency by route.",
+            "# TYPE rpn_request_duration_seconds histogram",
+        ]
+        for route in self.routes:
+            base = self._route_slots[route]
+            label = f'route="{route}"'
+            lines.extend(
+                _histogram("rpn_request_duration_seconds", label, LATENCY_BUCKETS, values, base)
+            )
+        lines.append("# HELP rpn_request_failures_total Requests answered with status >= 400.")
+        lines.append("# TYPE rpn_request_failures_total counter")
+        for route in self.routes:
+            failures = values[self._route_slots[route] + n + 2]
+            lines.append(f'rpn_request_failures_total{{route="{route}"}} {_fmt(failures)}')
+        lines.append("# HELP rpn_errors_total Calculator errors by exception type.")
+        lines.append("# TYPE rpn_errors_total counter")
+        for name in self.errors:
+            count = _fmt(values[self._error_slots[name]])
+            lines.append(f'rpn_errors_total{{type="{name}"}} {count}')
+        lines.append("# HELP rpn_stack_depth Stack depth after mutating requests.")
+        lines.append("# TYPE rpn_stack_depth histogram")
+        lines.extend(_histogram("rpn_stack_depth", "", DEPTH_BUCKETS, values, self._depth_slot))
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+def _histogram(
+    name: str, label: str, bounds: Sequence[float], values: Sequence[float], base: int
+) -> List[str]:
+    prefix = label + "," if label else ""
+    lines = []
+    cumulative = 0.0
+    for i, bound in enumerate(bounds):
+        cumulative += values[base + i]
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {_fmt(cumulative)}')
+    cumulative += values[base + len(bounds)]
+    suffix = "{" + label + "}" if label else ""
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {_fmt(cumulative)}')
+    lines.append(f"{name}_sum{suffix} {_fmt(values[base + len(bounds) + 1])}")
+    lines.append(f"{name}_count{suffix} {_fmt(cumulative)}")
+    return lines
+
+ROUTE_KEY = "rpn.route"
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request against the route that handled it."""
+
+    def __init__(self, app: Any, get_metrics: Callable[[], Metrics]) -> None:
+        self.app = app
+        self._get_metrics = get_metrics
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched endpoint in the (shared) scope; handlers
+            # serving several logical routes name the one they served under ROUTE_KEY
+            route = scope.get(ROUTE_KEY)
+            if route is None:
+                route = getattr(scope.get("endpoint"), "__name__", None)
+            self._get_metrics().observe_request(
+                route, perf_counter() - start, status_code >= 400
+            )
+
+_metrics = Metrics(routes=())
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+def set_metrics(metrics: Metrics) -> None:
+    global _metrics
+    _metrics = metrics
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: _metrics.reopen())
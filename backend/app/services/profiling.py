@@ -0,0 +1,186 @@
+"""
+Request profiling - opt-in cProfile capture and per-phase timings.
+
+A request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` or is
+picked by sampling (``PROFILE_SAMPLE_RATE``). Its cProfile stats are kept in a
+bounded ``ProfileStore`` for download, and its phase timings (session load and
+save, domain operation, response model) are returned in a ``Server-Timing``
+header. Outside profiled requests ``phase`` costs one context variable lookup.
+
+cProfile hooks the whole event loop thread, so a profile also contains other
+requests interleaved with the profiled one; only one profile runs at a time.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+from app.core.config import PROFILE_KEEP
+
+PROFILE_HEADER = b"x-profile"
+
+# Phase name -> seconds, for the request being profiled
+_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("profile_phases", default=None)
+
+class phase:
+    """Context manager adding the elapsed time of its block to the named phase."""
+
+    __slots__ = ("name", "phases", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "phase":
+        self.phases = _phases.get()
+        if self.phases is not None:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.phases is not None:
+            elapsed = perf_counter() - self.start
+            self.phases[self.name] = self.phases.get(self.name, 0.0) + elapsed
+
+def server_timing(phases: Dict[str, float], total: float) -> str:
+    """``Server-Timing`` header value (durations in milliseconds)."""
+    parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in phases.items()]
+    parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
+
+class ProfileStore:
+    """Most recent profiles (marshalled pstats data plus metadata), oldest dropped first."""
+
+    def __init__(self, maxsize: int = 50) -> None:
+        self._profiles: "OrderedDict[str, Tuple[Dict[str, Any], bytes]]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = Lock()
+
+    def add(
+        self, profile_id: str, info: Dict[str, Any], profiler: Optional[cProfile.Profile]
+    ) -> None:
+        data = b""
+        if profiler is not None:
+            data = marshal.dumps(pstats.Stats(profiler).stats)  # type: ignore[attr-defined]
+        with self._lock:
+            self._profiles[profile_id] = ({"id": profile_id, **info}, data)
+            while len(self._profiles) > self._maxsize:
+                self._profiles.popitem(last=False)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [info for info, _ in reversed(self._profiles.values())]
+
+    def get(self, profile_id: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+class _StoredStats:
+    """Adapter letting ``pstats.Stats`` load marshalled stats from memory."""
+
+    def __init__(self, data: bytes) -> None:
+        self.stats = marshal.loads(data)
+
+    def create_stats(self) -> None:
+        pass
+
+# The ``pstats.SortKey`` values
+SortKey = Literal[
+    "calls", "cumulative", "filename", "line", "name", "nfl", "pcalls", "stdname", "time"
+]
+
+def stats_text(data: bytes, sort: SortKey = "cumulative", limit: int = 40) -> str:
+    """Human-readable ``pstats`` report of a stored profile."""
+    out = io.StringIO()
+    stats = pstats.Stats(_StoredStats(data), stream=out)  # type: ignore[arg-type]
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling opted-in or sampled HTTP requests."""
+
+    def __init__(
+        self,
+        app: Any,
+        store: ProfileStore,
+        token: str = "",
+        sample_rate: float = 0.0,
+        random_fn: Callable[[], float] = random.random,
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self._random = random_fn
+        self._busy = False
+
+    def _wanted(self, scope: Dict[str, Any]) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER and value == self.token:
+                    return True
+        return self.sample_rate > 0 and self._random() < self.sample_rate
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        phases: Dict[str, float] = {}
+        token = _phases.set(phases)
+        profiler = None
+        if not self._busy:
+            self._busy = True
+            profiler = cProfile.Profile()
+        status_code = 500
+        profile_id = uuid.uuid4().hex[:12]
+        start = perf_counter()
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timing = server_timing(phases, perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing.encode()),
+                    (b"x-profile-id", profile_id.encode()),
+                ]
+            await send(message)
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            if profiler is not None:
+                self._busy = False
+            _phases.reset(token)
+            info = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": (perf_counter() - start) * 1000,
+                "phases_ms": {name: seconds * 1000 for name, seconds in phases.items()},
+                "profiled": profiler is not None,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            self.store.add(profile_id, info, profiler)
+
+_profile_store = ProfileStore(PROFILE_KEEP)
+
+def get_profile_store() -> ProfileStore:
+    return _profile_store
@@ -0,0 +1,155 @@
+"""
+Result cache - memoized results of pure program evaluations.
+
+Operators are pure, so the values a program leaves are determined by the
+program, the numeric mode and the values it reads: the top ``required`` values
+of the stack, or the whole stack past a variadic operator. Programs using
+``depth`` also depend on the stack size, which is then part of the key.
+Programs are keyed by their normalized text (``"2 3 +"`` and ``"2 3 add"`` share
+an entry) and inputs by their exact bits (``0.0`` and ``-0.0`` do not).
+
+Entries are bounded by count and approximate memory, least recently used
+first, and expire ``ttl`` seconds after they were stored (an expired entry is
+dropped when next looked up, or evicted in turn). Only successful evaluations
+are cached. The cache is per process; each worker keeps its own.
+"""
+import time
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Sequence, Tuple
+from app.core.config import RESULT_CACHE_MAX_BYTES, RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+from app.domain.compiler import CompiledProgram
+from app.domain.numeric import NumericBackend
+
+# Rough sizes for memory accounting: dict slot, key and entry tuples per entry;
+# a boxed value plus its tuple slot per cached result value
+_ENTRY_BYTES = 240
+_VALUE_BYTES = 32
+# No single entry may take more than this fraction of the memory bound
+_MAX_ENTRY_SHARE = 16
+
+Key = Tuple[str, str, Hashable, int]
+
+class _Entry(NamedTuple):
+    values: Tuple[Any, ...]
+    expires: float
+    size: int
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache of the values programs leave, bounded in entries and bytes."""
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._maxsize = maxsize
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._maxsize > 0
+
+    @staticmethod
+    def key(
+        program: CompiledProgram, numeric: NumericBackend, inputs: Sequence[Any], depth: int
+    ) -> Key:
+        """Key of ``program`` run on ``inputs`` (the values it reads) in a stack of ``depth``."""
+        if numeric.name == "float":
+            packed: Hashable = array("d", inputs).tobytes()
+        else:
+            # str keeps what equality hides (Decimal("1.0") == Decimal("1"))
+            packed = tuple(map(str, inputs))
+        return (
+            program.normalized,
+            numeric.key,
+            packed,
+            depth if program.reads_depth else -1,
+        )
+
+    def get(self, key: Key) -> Optional[Tuple[Any, ...]]:
+        """The values stored for ``key``, or None (counted as a miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < self._clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.values
+
+    def put(self, key: Key, values: Sequence[Any]) -> None:
+        if not self.enabled:
+            return
+        size = _entry_bytes(key, values)
+        if self._max_bytes is not None and size * _MAX_ENTRY_SHARE > self._max_bytes:
+            return
+        expires = self._clock() + self._ttl if self._ttl is not None else float("inf")
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(tuple(values), expires, size)
+            self._bytes += size
+            while len(self._entries) > self._maxsize or (
+                self._max_bytes is not None and self._bytes > self._max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def _remove(self, key: Key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self._maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "ttl": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+def _entry_bytes(key: Key, values: Sequence[Any]) -> int:
+    text, _, inputs, _ = key
+    if isinstance(inputs, bytes):
+        input_bytes = len(inputs)
+    else:
+        input_bytes = sum(len(value) for value in inputs) + _VALUE_BYTES * len(inputs)
+    return _ENTRY_BYTES + len(text) + input_bytes + _VALUE_BYTES * len(values)
+
+_result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+
+def get_result_cache() -> ResultCache:
+    return _result_cache
+
+async def current_result_cache() -> ResultCache:
+    """``get_result_cache`` as an async dependency (no threadpool hop)."""
+    return _result_cache
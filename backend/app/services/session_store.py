@@ -0,0 +1,625 @@
+"""
+Session stores - where StackService sessions live between requests.
+
+The in-process store keeps live ``StackService`` objects and is the default.
+The other backends hold a serialized snapshot per session so that every worker
+of a multi-process deployment sees the same stacks:
+
+- ``ManagerSessionStore``: a ``multiprocessing`` manager dict shared by the
+  workers of one host (see ``serve_session_manager``).
+- ``JournalSessionStore`` (``app.services.journal``): the in-process store made
+  durable by a per-session append-only journal on local disk.
+- ``RedisSessionStore``: any client speaking the Redis protocol (``redis-py`` or
+  a compatible fake) for multi-host deployments.
+
+Requests use one ``load`` and at most one ``save`` (see ``stack_session``),
+inside ``lock``: the shared backends take an expiring per-session lease there,
+so requests on one session in different workers cannot overwrite each other.
+Async callers use ``aload``/``asave``/``adelete``/``alock``, which run blocking
+backends in a worker thread and the in-process store inline.
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from multiprocessing.managers import BaseManager, DictProxy
+from threading import Event, Lock, RLock, Thread
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Type,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.services.stack_service import StackService
+
+# Seconds between attempts to take a held lease, doubling up to the maximum
+_LEASE_RETRY_MIN = 0.001
+_LEASE_RETRY_MAX = 0.05
+
+# Deletes a lease only if it still holds the caller's token
+_RELEASE_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Extends a lease by ARGV[2] milliseconds only if it still holds the caller's token
+_RENEW_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+class SessionLeaseLostError(RuntimeError):
+    """Raised on save when the request's lease of the session expired or was taken over."""
+
+class SessionStore:
+    """Base class for session backends."""
+
+    def __init__(self, service_cls: Type["StackService"]) -> None:
+        self._service_cls = service_cls
+
+    def load(self, session_id: str) -> "StackService":
+        """Return the session, creating an empty one if needed."""
+        raise NotImplementedError
+
+    def save(self, service: "StackService") -> None:
+        """Persist a session after it was modified."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def lock(self, session_id: str) -> ContextManager[None]:
+        """
+        Hold the session against other processes from load to save. Stores
+        living in one process need nothing beyond the per-session asyncio lock
+        (the in-process store uses it to pin the session against eviction).
+        """
+        return nullcontext()
+
+    def alock(self, session_id: str) -> AsyncContextManager[None]:
+        return nullcontext()
+
+    async def aload(self, session_id: str) -> "StackService":
+        return await asyncio.to_thread(self.load, session_id)
+
+    async def asave(self, service: "StackService") -> None:
+        await asyncio.to_thread(self.save, service)
+
+    async def adelete(self, session_id: str) -> bool:
+        return await asyncio.to_thread(self.delete, session_id)
+
+    def sweep(self) -> int:
+        """Drop expired sessions; backends with native expiry do nothing."""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, "live_sessions": len(self)}
+
+    def close(self) -> None:
+        """Release resources at shutdown."""
+
+class InMemorySessionStore(SessionStore):
+    """
+    Process-local registry of live sessions, bounded by count and approximate
+    memory. Sessions idle for longer than ``ttl`` seconds expire (on access and
+    on ``sweep``); when a bound is exceeded the least recently used sessions are
+    evicted. Sessions held by a request (``lock``/``alock``) are pinned: neither
+    evicted nor swept until released, so the request's ``save`` finds them.
+    Memory is re-measured on ``save``, i.e. after each mutating request.
+    """
+
+    def __init__(
+        self,
+        service_cls: Type["StackService"],
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(service_cls)
+        self._sessions: "OrderedDict[str, StackService]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = RLock()
+        self._pins: Dict[str, int] = {}  # session id -> requests holding it
+        self.evictions = 0
+        self.expirations = 0
+
+    def load(self, session_id: str) -> "StackService":
+        now = self._clock()
+        with self._lock:
+            service = self._sessions.get(session_id)
+            if service is not None and self._expired(session_id, now):
+                self._remove(session_id, "expire")
+                self.expirations += 1
+                service = None
+            if service is None:
+                service = self._sessions[session_id] = self._create(session_id)
+                self._account(session_id, service.memory_bytes())
+            else:
+                self._sessions.move_to_end(session_id)
+            self._last_access[session_id] = now
+            self._enforce_bounds(keep=session_id)
+            return service
+
+    def save(self, service: "StackService") -> None:
+        with self._lock:
+            if self._sessions.get(service.session_id) is service:
+                self._last_access[service.session_id] = self._clock()
+                self._account(service.session_id, service.memory_bytes())
+                self._enforce_bounds(keep=service.session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._remove(session_id, "delete") is not None
+
+    @contextmanager
+    def lock(self, session_id: str) -> Iterator[None]:
+        self._pin(session_id)
+        try:
+            yield
+        finally:
+            self._unpin(session_id)
+
+    @asynccontextmanager
+    async def alock(self, session_id: str) -> AsyncIterator[None]:
+        self._pin(session_id)
+        try:
+            yield
+        finally:
+            self._unpin(session_id)
+
+    # No I/O here: skip the worker thread
+    async def aload(self, session_id: str) -> "StackService":
+        return self.load(session_id)
+
+    async def asave(self, service: "StackService") -> None:
+        self.save(service)
+
+    async def adelete(self, session_id: str) -> bool:
+        return self.delete(session_id)
+
+    def sweep(self) -> int:
+        """Expire idle sessions; returns how many were removed."""
+        if self._ttl is None:
+            return 0
+        now = self._clock()
+        with self._lock:
+            expired = [
+                sid for sid in self._sessions if sid not in self._pins and self._expired(sid, now)
+            ]
+            for session_id in expired:
+                self._remove(session_id, "expire")
+            self.expirations += len(expired)
+            return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "live_sessions": len(self._sessions),
+            "bytes": self._total_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "max_sessions": self._max_sessions,
+            "max_bytes": self._max_bytes,
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expired(self, session_id: str, now: float) -> bool:
+        return self._ttl is not None and now - self._last_access[session_id] > self._ttl
+
+    def _account(self, session_id: str, size: int) -> None:
+        self._total_bytes += size - self._bytes.get(session_id, 0)
+        self._bytes[session_id] = size
+
+    def _create(self, session_id: str) -> "StackService":
+        """Build a session that is not resident; subclasses may restore it from storage."""
+        return self._service_cls(session_id)
+
+    def _pin(self, session_id: str) -> None:
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+
+    def _unpin(self, session_id: str) -> None:
+        with self._lock:
+            pins = self._pins.pop(session_id) - 1
+            if pins:
+                self._pins[session_id] = pins
+            # Bounds may have been left exceeded while it was pinned
+            self._enforce_bounds(keep=session_id)
+
+    def _remove(self, session_id: str, reason: str) -> Optional["StackService"]:
+        service = self._sessions.pop(session_id, None)
+        if service is not None:
+            self._last_access.pop(session_id, None)
+            self._total_bytes -= self._bytes.pop(session_id, 0)
+            self._on_remove(service, reason)
+        return service
+
+    def _on_remove(self, service: "StackService", reason: str) -> None:
+        """Hook for subclasses; ``reason`` is "delete", "expire" or "evict"."""
+
+    def _enforce_bounds(self, keep: str) -> None:
+        while (self._max_sessions is not None and len(self._sessions) > self._max_sessions) or (
+            self._max_bytes is not None and self._total_bytes > self._max_bytes
+        ):
+            # Least recently used first, skipping ``keep`` and pinned sessions
+            oldest = next(
+                (sid for sid in self._sessions if sid != keep and sid not in self._pins), None
+            )
+            if oldest is None:
+                break
+            self._remove(oldest, "evict")
+            self.evictions += 1
+
+class SerializingSessionStore(SessionStore):
+    """
+    Store keeping one encoded snapshot per session, shared by several workers.
+    A request holds the session's lease from load to save: an expiring lock
+    taken with a random token, so a request on the same session in another
+    process waits for it instead of overwriting its change. While held, the
+    lease is renewed every third of ``lock_ttl``, and ``save`` refuses to write
+    (``SessionLeaseLostError``) once it is lost. A worker that dies holding a
+    lease frees it after ``lock_ttl`` seconds.
+    """
+
+    def __init__(self, service_cls: Type["StackService"], lock_ttl: float = 30.0) -> None:
+        super().__init__(service_cls)
+        self._lock_ttl = lock_ttl
+        self._held: Dict[str, str] = {}  # session id -> token of this process's holder
+
+    def _acquire(self, session_id: str, token: str) -> bool:
+        """Take the lease of ``session_id`` for ``token`` unless another token holds it."""
+        raise NotImplementedError
+
+    def _renew(self, session_id: str, token: str) -> bool:
+        """Extend the lease by ``lock_ttl`` if ``token`` still holds it."""
+        raise NotImplementedError
+
+    def _release(self, session_id: str, token: str) -> None:
+        """Give the lease back if ``token`` still holds it."""
+        raise NotImplementedError
+
+    def _check_lease(self, session_id: str) -> None:
+        """Before a write: renew the held lease of ``session_id``, or fail if it is lost."""
+        token = self._held.get(session_id)
+        if token is not None and not self._renew(session_id, token):
+            raise SessionLeaseLostError(f"Lost the lease of session {session_id!r}")
+
+    def _heartbeat(self, session_id: str, token: str, stop: Event) -> None:
+        while not stop.wait(self._lock_ttl / 3):
+            try:
+                if not self._renew(session_id, token):
+                    return
+            except Exception:  # the lease runs out; save reports it
+                return
+
+    async def _aheartbeat(self, session_id: str, token: str) -> None:
+        while True:
+            await asyncio.sleep(self._lock_ttl / 3)
+            try:
+                if not await asyncio.to_thread(self._renew, session_id, token):
+                    return
+            except Exception:  # the lease runs out; save reports it
+                return
+
+    def _forget(self, session_id: str, token: str) -> None:
+        if self._held.get(session_id) == token:
+            del self._held[session_id]
+
+    @contextmanager
+    def lock(self, session_id: str) -> Iterator[None]:
+        token = uuid.uuid4().hex
+        delay = _LEASE_RETRY_MIN
+        while not self._acquire(session_id, token):
+            time.sleep(delay)
+            delay = min(delay * 2, _LEASE_RETRY_MAX)
+        self._held[session_id] = token
+        stop = Event()
+        heartbeat = Thread(target=self._heartbeat, args=(session_id, token, stop), daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            heartbeat.join()
+            self._forget(session_id, token)
+            self._release(session_id, token)
+
+    @asynccontextmanager
+    async def alock(self, session_id: str) -> AsyncIterator[None]:
+        token = uuid.uuid4().hex
+        delay = _LEASE_RETRY_MIN
+        while not await asyncio.to_thread(self._acquire, session_id, token):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _LEASE_RETRY_MAX)
+        self._held[session_id] = token
+        heartbeat = asyncio.create_task(self._aheartbeat(session_id, token))
+        try:
+            yield
+        finally:
+            heartbeat.cancel()
+            self._forget(session_id, token)
+            await asyncio.to_thread(self._release, session_id, token)
+
+    def _decode(self, session_id: str, data: Optional[bytes]) -> "StackService":
+        if data is None:
+            return self._service_cls(session_id)
+        return self._service_cls.from_state(session_id, json.loads(data))
+
+    def _encode(self, service: "StackService") -> bytes:
+        return json.dumps(service.to_state(), separators=(",", ":")).encode()
+
+class ManagerSessionStore(SerializingSessionStore):
+    """
+    Store backed by a ``multiprocessing`` manager dict shared across processes;
+    leases are kept by a ``SessionLeases`` table in the manager process.
+    """
+
+    def __init__(
+        self,
+        service_cls: Type["StackService"],
+        sessions: MutableMapping[str, bytes],
+        leases: "SessionLeases",
+        lock_ttl: float = 30.0,
+    ) -> None:
+        super().__init__(service_cls, lock_ttl)
+        self._shared = sessions
+        self._leases = leases
+
+    @classmethod
+    def connect(
+        cls,
+        service_cls: Type["StackService"],
+        address: Tuple[str, int],
+        authkey: bytes,
+        lock_ttl: float = 30.0,
+    ) -> "ManagerSessionStore":
+        manager = _SessionManager(address=address, authkey=authkey)
+        manager.connect()
+        return cls(
+            service_cls,
+            manager.sessions(),  # type: ignore[attr-defined]
+            manager.leases(),  # type: ignore[attr-defined]
+            lock_ttl,
+        )
+
+    def _acquire(self, session_id: str, token: str) -> bool:
+        return self._leases.acquire(session_id, token, self._lock_ttl)
+
+    def _renew(self, session_id: str, token: str) -> bool:
+        return self._leases.renew(session_id, token, self._lock_ttl)
+
+    def _release(self, session_id: str, token: str) -> None:
+        self._leases.release(session_id, token)
+
+    def load(self, session_id: str) -> "StackService":
+        return self._decode(session_id, self._shared.get(session_id))
+
+    def save(self, service: "StackService") -> None:
+        self._check_lease(service.session_id)
+        self._shared[service.session_id] = self._encode(service)
+
+    def delete(self, session_id: str) -> bool:
+        return self._shared.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._shared)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "manager", "live_sessions": len(self)}
+
+class RedisSessionStore(SerializingSessionStore):
+    """
+    Store backed by a Redis-protocol client (``get``/``set``/``delete``/
+    ``scan_iter``/``eval``). Leases are ``SET NX PX`` keys under ``lock_prefix``
+    holding the token, released by a compare-and-delete script.
+    """
+
+    def __init__(
+        self,
+        service_cls: Type["StackService"],
+        client: Any,
+        prefix: str = "rpn:session:",
+        ttl: Optional[int] = None,
+        lock_prefix: str = "rpn:lease:",
+        lock_ttl: float = 30.0,
+    ) -> None:
+        super().__init__(service_cls, lock_ttl)
+        self._client = client
+        self._prefix = prefix
+        self._ttl = ttl
+        self._lock_prefix = lock_prefix
+
+    @classmethod
+    def from_url(
+        cls,
+        service_cls: Type["StackService"],
+        url: str,
+        ttl: Optional[int] = None,
+        lock_ttl: float = 30.0,
+    ) -> "RedisSessionStore":
+        import redis  # optional dependency
+
+        return cls(service_cls, redis.Redis.from_url(url), ttl=ttl, lock_ttl=lock_ttl)
+
+    def _acquire(self, session_id: str, token: str) -> bool:
+        key = self._lock_prefix + session_id
+        return bool(self._client.set(key, token, nx=True, px=int(self._lock_ttl * 1000)))
+
+    def _renew(self, session_id: str, token: str) -> bool:
+        key = self._lock_prefix + session_id
+        return bool(self._client.eval(_RENEW_LEASE, 1, key, token, int(self._lock_ttl * 1000)))
+
+    def _release(self, session_id: str, token: str) -> None:
+        self._client.eval(_RELEASE_LEASE, 1, self._lock_prefix + session_id, token)
+
+    def load(self, session_id: str) -> "StackService":
+        return self._decode(session_id, self._client.get(self._prefix + session_id))
+
+    def save(self, service: "StackService") -> None:
+        self._check_lease(service.session_id)
+        self._client.set(self._prefix + service.session_id, self._encode(service), ex=self._ttl)
+
+    def delete(self, session_id: str) -> bool:
+        return bool(self._client.delete(self._prefix + session_id))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._client.scan_iter(match=self._prefix + "*"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "live_sessions": len(self)}
+
+# ---------- multiprocessing manager ----------
+class SessionLeases:
+    """
+    Expiring per-session locks held by token, kept in the manager process and
+    used through a proxy by the workers' ``ManagerSessionStore``.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._clock = clock
+        self._lock = Lock()
+
+    def acquire(self, session_id: str, token: str, ttl: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            held = self._leases.get(session_id)
+            if held is not None and held[0] != token and held[1] > now:
+                return False
+            self._leases[session_id] = (token, now + ttl)
+            return True
+
+    def renew(self, session_id: str, token: str, ttl: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            held = self._leases.get(session_id)
+            if held is None or held[0] != token or held[1] <= now:
+                return False
+            self._leases[session_id] = (token, now + ttl)
+            return True
+
+    def release(self, session_id: str, token: str) -> bool:
+        with self._lock:
+            held = self._leases.get(session_id)
+            if held is None or held[0] != token:
+                return False
+            del self._leases[session_id]
+            return True
+
+_shared_sessions: Dict[str, bytes] = {}
+_session_leases = SessionLeases()
+
+def _get_shared_sessions() -> Dict[str, bytes]:
+    return _shared_sessions
+
+def _get_session_leases() -> SessionLeases:
+    return _session_leases
+
+class _SessionManager(BaseManager):
+    pass
+
+_SessionManager.register("sessions", callable=_get_shared_sessions, proxytype=DictProxy)
+_SessionManager.register("leases", callable=_get_session_leases)
+
+def serve_session_manager(address: Tuple[str, int], authkey: bytes) -> None:
+    """Run the shared session dict server (blocking); start it once per host before the workers."""
+    _SessionManager(address=address, authkey=authkey).get_server().serve_forever()
+
+def start_session_manager() -> Tuple[BaseManager, MutableMapping[str, bytes], SessionLeases]:
+    """Start a manager in a child process and return it with its session dict and leases."""
+    manager = _SessionManager()
+    manager.start()
+    return manager, manager.sessions(), manager.leases()  # type: ignore[attr-defined]
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def create_session_store(
+    backend: str,
+    service_cls: Type["StackService"],
+    redis_url: str = "",
+    manager_address: str = "",
+    manager_authkey: str = "",
+    ttl: Optional[int] = None,
+    max_sessions: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    journal_dir: str = "",
+    journal_options: Optional[Dict[str, Any]] = None,
+    lock_ttl: float = 30.0,
+) -> SessionStore:
+    if backend == "memory":
+        return InMemorySessionStore(service_cls, max_sessions, max_bytes, ttl)
+    if backend == "journal":
+        from app.services.journal import JournalSessionStore
+
+        return JournalSessionStore(
+            service_cls,
+            journal_dir,
+            max_sessions=max_sessions,
+            max_bytes=max_bytes,
+            ttl=ttl,
+            **(journal_options or {}),
+        )
+    if backend == "manager":
+        if not manager_authkey:
+            raise ValueError("The manager session backend requires SESSION_MANAGER_AUTHKEY")
+        return ManagerSessionStore.connect(
+            service_cls, parse_address(manager_address), manager_authkey.encode(), lock_ttl
+        )
+    if backend == "redis":
+        return RedisSessionStore.from_url(service_cls, redis_url, ttl=ttl, lock_ttl=lock_ttl)
+    raise ValueError(f"Unknown session backend: {backend!r}")
+
+class SessionSweeper:
+    """Background thread calling ``store.sweep()`` every ``interval`` seconds."""
+
+    def __init__(self, get_store: Callable[[], SessionStore], interval: float) -> None:
+        self._get_store = get_store
+        self._interval = interval
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None and self._interval > 0:
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self._get_store().sweep()
@@ -1,66 +1,338 @@
 """
 Stack service - Service layer managing RPN calculator with history and undo.
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import weakref
+from array import array
+from contextlib import contextmanager
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 from datetime import datetime
-from app.domain.rpn_calculator import RPNCalculator
+from app.core.config import (
+    DECIMAL_PRECISION,
+    JOURNAL_COMPACT_EVERY,
+    JOURNAL_DIR,
+    JOURNAL_FSYNC,
+    JOURNAL_FSYNC_BATCH,
+    JOURNAL_FSYNC_INTERVAL,
+    PROGRAM_CACHE_SIZE,
+    SESSION_BACKEND,
+    SESSION_LOCK_TTL,
+    SESSION_MAX_COUNT,
+    SESSION_MAX_BYTES,
+    SESSION_MANAGER_ADDRESS,
+    SESSION_MANAGER_AUTHKEY,
+    REDIS_URL,
+    SESSION_TTL,
+)
+from app.domain.compiler import CompiledProgram, ProgramCache
+from app.domain.numeric import FLOAT, NumericBackend, get_backend
+from app.domain.persistent_stack import PersistentStack
+from app.domain.rpn_calculator import RPNCalculator, create_calculator
+from app.domain.streaming import StreamEvaluator
+from app.services.metrics import get_metrics
+from app.services.profiling import phase
+from app.services.result_cache import ResultCache
+from app.services.session_store import SessionStore, create_session_store
+
+# Rough per-object sizes used for session memory accounting: a history segment is a
+# node tuple plus the array (or tuple) header of its values, which then take 8 bytes
+# each; the overhead covers the service, calculator and history objects
+_HISTORY_SEGMENT_BYTES = 160
+_HISTORY_VALUE_BYTES = 8
+_SESSION_OVERHEAD_BYTES = 2048
+# The oldest version is re-stored as one segment once it is split into more than this
+# many segments and they take more memory than its values
+_COMPACT_MIN_SEGMENTS = 64
+
+class HistoryEntry(NamedTuple):
+    """
+    One stack version: the operation that produced it, how many values it
+    popped and pushed, and the resulting (structurally shared) stack.
+    """
+    operation: str
+    consumed: int
+    produced: int
+    stack: PersistentStack
 
 class StackHistory:
-    def __init__(self, max_history: int = 100) -> None:
-        self._history: List[List[float]] = []
+    """
+    Bounded, versioned stack history.
+
+    Every version is a persistent stack sharing its tail with the previous one,
+    so recording costs O(values pushed) and any retained version is addressable
+    by number in O(1). Undo and redo only replay the delta of one operation;
+    versions past the cursor stay available for redo until a new operation is
+    recorded.
+
+    Each version stores the values it pushed as one segment (float64 arrays in
+    float mode). The oldest retained version accumulates the segments of every
+    operation since it was last compacted; when they outweigh its values it is
+    re-stored as one segment, which costs O(stack) about once per stack size / 20
+    operations.
+    """
+
+    def __init__(self, max_history: int = 100, numeric: NumericBackend = FLOAT) -> None:
         self._max_history = max_history
+        self._numeric = numeric
+        self._versions: Dict[int, HistoryEntry] = {}
+        self._first = self._cursor = self._last = 0
+        self.clear()
+
+    def record(self, operation: str, consumed: int, pushed: Sequence[float]) -> int:
+        for version in range(self._cursor + 1, self._last + 1):
+            del self._versions[version]
+        stack = self._versions[self._cursor].stack.replace_top(consumed, self._segment(pushed))
+        self._cursor = self._last = self._cursor + 1
+        self._versions[self._cursor] = HistoryEntry(operation, consumed, len(pushed), stack)
+        while self._last - self._first > self._max_history:
+            del self._versions[self._first]
+            self._first += 1
+        base = self._versions[self._first].stack
+        if base.nodes > _COMPACT_MIN_SEGMENTS and (
+            base.nodes * _HISTORY_SEGMENT_BYTES > len(base) * _HISTORY_VALUE_BYTES
+        ):
+            self._compact()
+        return self._cursor
+
+    def _compact(self) -> None:
+        """Rebuild the retained versions on their oldest one stored as a single segment."""
+        versions = self._versions
+        base = versions[self._first]
+        stack = PersistentStack.from_values(self._segment(base.stack.to_list()))
+        versions[self._first] = base._replace(stack=stack)
+        for version in range(self._first + 1, self._last + 1):
+            entry = versions[version]
+            pushed = self._segment(entry.stack.top(entry.produced))
+            stack = stack.replace_top(entry.consumed, pushed)
+            versions[version] = entry._replace(stack=stack)
+
+    def _segment(self, values: Sequence[Any]) -> Sequence[Any]:
+        """``values`` as stored in one segment: unboxed float64 in float mode."""
+        if self._numeric is FLOAT and not isinstance(values, array):
+            return array("d", values)
+        return values
+
+    def undo(self, calculator: RPNCalculator) -> Optional[HistoryEntry]:
+        if self._cursor == self._first:
+            return None
+        entry = self._versions[self._cursor]
+        self._cursor -= 1
+        previous = self._versions[self._cursor].stack
+        calculator.replace_top(entry.produced, previous.top(entry.consumed))
+        return entry
 
-    def save_state(self, stack: List[float]) -> None:
-        self._history.append(stack.copy())
-        if len(self._history) > self._max_history:
-            self._history.pop(0)
+    def redo(self, calculator: RPNCalculator) -> Optional[HistoryEntry]:
+        if self._cursor == self._last:
+            return None
+        self._cursor += 1
+        entry = self._versions[self._cursor]
+        calculator.replace_top(entry.consumed, entry.stack.top(entry.produced))
+        return entry
 
-    def get_previous_state(self) -> Optional[List[float]]:
-        if len(self._history) < 2:
+    def restore(self, version: int, calculator: RPNCalculator) -> Optional[HistoryEntry]:
+        entry = self._versions.get(version)
+        if entry is None:
             return None
-        self._history.pop()
-        return self._history[-1].copy() if self._history else None
+        calculator.load(entry.stack.to_list())
+        self._cursor = version
+        return entry
+
+    def entries(self) -> List[Tuple[int, HistoryEntry]]:
+        return [(version, self._versions[version]) for version in range(self._first, self._last + 1)]
+
+    def clear(self, stack: Sequence[float] = (), numeric: Optional[NumericBackend] = None) -> None:
+        """Drop all versions and start over from ``stack`` (of ``numeric`` values, if given)."""
+        if numeric is not None:
+            self._numeric = numeric
+        self._first = self._cursor = self._last = 0
+        base = PersistentStack.from_values(self._segment(stack))
+        self._versions = {0: HistoryEntry("init", 0, len(stack), base)}
+
+    def to_state(self, numeric: NumericBackend = FLOAT) -> Dict[str, Any]:
+        base = self._versions[self._first]
+        export = numeric.export
+        return {
+            "max_history": self._max_history,
+            "first": self._first,
+            "cursor": self._cursor,
+            "base": [base.operation, export(base.stack.to_list())],
+            "entries": [
+                [entry.operation, entry.consumed, export(entry.stack.top(entry.produced))]
+                for _, entry in self.entries()[1:]
+            ],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], numeric: NumericBackend = FLOAT) -> "StackHistory":
+        history = cls(state["max_history"], numeric)
+        operation, values = state["base"]
+        first = state["first"]
+        if numeric is not FLOAT:
+            values = numeric.convert(values)
+        stack = PersistentStack.from_values(history._segment(values))
+        versions = {first: HistoryEntry(operation, 0, len(values), stack)}
+        for offset, (operation, consumed, pushed) in enumerate(state["entries"], start=1):
+            if numeric is not FLOAT:
+                pushed = numeric.convert(pushed)
+            stack = stack.replace_top(consumed, history._segment(pushed))
+            versions[first + offset] = HistoryEntry(operation, consumed, len(pushed), stack)
+        history._versions = versions
+        history._first = first
+        history._cursor = state["cursor"]
+        history._last = first + len(state["entries"])
+        return history
+
+    def memory_bytes(self) -> int:
+        """Approximate memory of the segments reachable from the retained versions."""
+        versions = self._versions
+        base = versions[self._first].stack
+        values = len(base)
+        segments = base.nodes
+        for version in range(self._first + 1, self._last + 1):
+            produced = versions[version].produced
+            values += produced
+            segments += produced > 0
+        return segments * _HISTORY_SEGMENT_BYTES + values * _HISTORY_VALUE_BYTES
+
+    @property
+    def current(self) -> PersistentStack:
+        return self._versions[self._cursor].stack
 
-    def clear(self) -> None:
-        self._history.clear()
+    @property
+    def version(self) -> int:
+        return self._cursor
 
     @property
     def size(self) -> int:
-        return len(self._history)
+        return self._cursor - self._first
 
-class StackService:
-    _instances: Dict[str, "StackService"] = {}
+    @property
+    def redo_size(self) -> int:
+        return self._last - self._cursor
 
-    def __init__(self, session_id: str = "default") -> None:
+class StackService:
+    def __init__(self, session_id: str = "default", numeric: NumericBackend = FLOAT) -> None:
         self._session_id = session_id
-        self._calculator = RPNCalculator()
-        self._history = StackHistory()
+        self._numeric = numeric
+        self._calculator = create_calculator(numeric)
+        self._history = StackHistory(numeric=numeric)
         self._operation_count = 0
         self._last_operation: Optional[str] = None
+        self._last_delta: Tuple[int, Sequence[float]] = (0, ())
         self._created_at = datetime.utcnow()
 
     @classmethod
     def get_instance(cls, session_id: str = "default") -> "StackService":
-        if session_id not in cls._instances:
-            cls._instances[session_id] = cls(session_id)
-        return cls._instances[session_id]
+        return get_session_store().load(session_id)
 
     @classmethod
     def clear_session(cls, session_id: str) -> bool:
-        if session_id in cls._instances:
-            del cls._instances[session_id]
-            return True
-        return False
+        return get_session_store().delete(session_id)
+
+    def to_state(self) -> Dict[str, Any]:
+        """Serializable snapshot of the session (stack, counters and history)."""
+        state = {
+            "operation_count": self._operation_count,
+            "last_operation": self._last_operation,
+            "created_at": self._created_at.isoformat(),
+            "history": self._history.to_state(self._numeric),
+        }
+        if self._numeric is not FLOAT:
+            state["numeric"] = [self._numeric.name, self._numeric.precision]
+        return state
+
+    @classmethod
+    def from_state(cls, session_id: str, state: Dict[str, Any]) -> "StackService":
+        numeric = get_backend(*state["numeric"]) if "numeric" in state else FLOAT
+        service = cls(session_id, numeric)
+        service._operation_count = state["operation_count"]
+        service._last_operation = state["last_operation"]
+        service._created_at = datetime.fromisoformat(state["created_at"])
+        service._history = StackHistory.from_state(state["history"], numeric)
+        service._calculator.load(service._history.current.to_list())
+        return service
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the session (stack plus history nodes)."""
+        return (
+            self._calculator.memory_bytes()
+            + self._history.memory_bytes()
+            + _SESSION_OVERHEAD_BYTES
+        )
+
+    @property
+    def session_id(self) -> str:
+        return self._session_id
+
+    @property
+    def operation_count(self) -> int:
+        return self._operation_count
 
-    def _save_state(self) -> None:
-        self._history.save_state(self._calculator.stack)
+    @property
+    def last_operation(self) -> Optional[str]:
+        return self._last_operation
 
-    def _record_operation(self, operation: str) -> None:
+    @property
+    def version(self) -> int:
+        return self._history.version
+
+    @property
+    def numeric(self) -> NumericBackend:
+        return self._numeric
+
+    def reset(self) -> None:
+        self._numeric = FLOAT
+        self._calculator = create_calculator()
+        self._history.clear(numeric=FLOAT)
+        self._operation_count = 0
+        self._last_operation = None
+        self._last_delta = (0, ())
+
+    def _apply(self, operation: str, consumed: int, action: Callable[[], Any]) -> None:
+        """Run a calculator mutation and log its delta; nothing is logged if it raises."""
+        calc = self._calculator
+        base = calc.size() - consumed
+        action()
+        pushed = calc.top(calc.size() - base)
+        self._history.record(operation, consumed, pushed)
+        self._record_operation(operation, consumed, pushed)
+
+    def _record_operation(self, operation: str, popped: int, pushed: Sequence[float]) -> None:
         self._operation_count += 1
         self._last_operation = operation
+        self._last_delta = (popped, pushed)
+
+    def values(self) -> List[Any]:
+        """The stack, bottom first, as JSON-safe values (exact numbers as strings)."""
+        return self._numeric.export(self._calculator.stack)
+
+    @contextmanager
+    def view(self) -> Iterator[Sequence[Any]]:
+        """
+        The stack for encoding, bottom first: a zero-copy float64 view in float
+        mode (the stack cannot change until the block exits), ``values()`` else.
+        """
+        if self._numeric is FLOAT:
+            with self._calculator.view() as values:
+                yield values
+        else:
+            yield self.values()
 
     def get_state(self) -> Dict[str, Any]:
-        stack = self._calculator.stack
+        stack = self.values()
         return {
             "stack": stack,
             "size": len(stack),
@@ -68,89 +340,331 @@ class StackService:
             "session_id": self._session_id,
             "operation_count": self._operation_count,
             "last_operation": self._last_operation,
+            "version": self._history.version,
             "history_size": self._history.size,
+            "redo_size": self._history.redo_size,
         }
 
+    def last_delta(self) -> Dict[str, Any]:
+        """
+        What the last mutation changed: drop ``popped`` values from the top, then
+        append ``pushed``. ``revision`` is the operation counter after the change.
+        """
+        popped, pushed = self._last_delta
+        return {
+            "revision": self._operation_count,
+            "popped": popped,
+            "pushed": self._numeric.export(pushed),
+            "size": self._calculator.size(),
+        }
+
+    def perform(self, operation: str, value: Any = None) -> None:
+        """
+        Apply a mutation by name ("push", "clear", "undo", "redo" or a registered
+        operator's canonical name) without building the state dict.
+        """
+        calc = self._calculator
+        with phase("op"):
+            if operation == "push":
+                self._apply(f"push({value})", 0, lambda: calc.push(value))  # type: ignore[arg-type]
+            elif operation == "clear":
+                self._apply("clear", calc.size(), calc.clear)
+            elif operation == "undo":
+                entry = self._history.undo(calc)
+                if entry is None:
+                    raise ValueError("No history available for undo")
+                self._record_operation("undo", entry.produced, calc.top(entry.consumed))
+            elif operation == "redo":
+                entry = self._history.redo(calc)
+                if entry is None:
+                    raise ValueError("No history available for redo")
+                self._record_operation("redo", entry.consumed, calc.top(entry.produced))
+            else:
+                consumed = calc.operands(operation)
+                self._apply(operation, consumed, lambda: calc.apply(operation))
+
+    def push_many(self, values: Union[Iterable[Any], bytes]) -> int:
+        """
+        Push many values as one change: an iterable of numbers, or ``bytes`` of
+        packed little-endian float64. Returns how many were pushed.
+        """
+        calc = self._calculator
+        count = 0
+
+        def action() -> None:
+            nonlocal count
+            if isinstance(values, (bytes, bytearray, memoryview)):
+                count = calc.extend_bytes(values)
+            else:
+                count = calc.extend(values)
+
+        with phase("op"):
+            self._apply("push_many", 0, action)
+        return count
+
+    def reduce(self, operation: str, count: Optional[int] = None) -> None:
+        """
+        Fold the top ``count`` values (default: the whole stack) into one with a
+        reduction ("sum", "product", "mean" or "stddev"), logged as one change.
+        """
+        calc = self._calculator
+        consumed = calc.size() if count is None else count
+        with phase("op"):
+            self._apply(operation, consumed, lambda: calc.reduce(operation, count))
+
+    def apply_change(self, operation: str, popped: int, pushed: Sequence[float]) -> None:
+        """Re-apply a logged change (e.g. from a journal) without re-running the operation."""
+        self._calculator.replace_top(popped, pushed)
+        self._history.record(operation, popped, pushed)
+        self._record_operation(operation, popped, pushed)
+
     # Mutations
     def push(self, value: float) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.push(value)
-        self._record_operation(f"push({value})")
+        self.perform("push", value)
         return self.get_state()
 
     def add(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.add()
-        self._record_operation("add")
+        self.perform("add")
         return self.get_state()
 
     def subtract(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.subtract()
-        self._record_operation("subtract")
+        self.perform("subtract")
         return self.get_state()
 
     def multiply(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.multiply()
-        self._record_operation("multiply")
+        self.perform("multiply")
         return self.get_state()
 
     def divide(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.divide()
-        self._record_operation("divide")
+        self.perform("divide")
         return self.get_state()
 
     def sqrt(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.sqrt()
-        self._record_operation("sqrt")
+        self.perform("sqrt")
         return self.get_state()
 
     def power(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.power()
-        self._record_operation("power")
+        self.perform("power")
         return self.get_state()
 
     def swap(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.swap()
-        self._record_operation("swap")
+        self.perform("swap")
         return self.get_state()
 
     def dup(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.dup()
-        self._record_operation("dup")
+        self.perform("dup")
         return self.get_state()
 
     def drop(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.drop()
-        self._record_operation("drop")
+        self.perform("drop")
         return self.get_state()
 
     def clear(self) -> Dict[str, Any]:
-        self._save_state()
-        self._calculator.clear()
-        self._record_operation("clear")
+        self.perform("clear")
         return self.get_state()
 
     def undo(self) -> Dict[str, Any]:
-        previous_state = self._history.get_previous_state()
-        if previous_state is None:
-            raise ValueError("No history available for undo")
-        self._calculator.clear()
-        for value in previous_state:
-            self._calculator.push(value)
-        self._record_operation("undo")
+        self.perform("undo")
         return self.get_state()
 
+    def redo(self) -> Dict[str, Any]:
+        self.perform("redo")
+        return self.get_state()
+
+    def evaluate(
+        self,
+        program: CompiledProgram,
+        trace: bool = False,
+        results: Optional[ResultCache] = None,
+    ) -> List[List[float]]:
+        """
+        Run a compiled program atomically, logged as a single history entry.
+        Untraced runs are first looked up in ``results`` and stored there.
+        """
+        calc = self._calculator
+        steps: List[List[float]] = []
+        # Variadic operators can reach any depth: log the whole stack as replaced
+        consumed = calc.size() if program.dynamic else program.required
+        key = None
+        if results is not None and results.enabled and not trace and consumed <= calc.size():
+            key = results.key(program, self._numeric, calc.top(consumed), calc.size())
+            pushed = results.get(key)
+            if pushed is not None:
+                with phase("op"):
+                    self._apply("eval", consumed, lambda: calc.replace_top(consumed, pushed))
+                return steps
+        with phase("op"):
+            self._apply("eval", consumed, lambda: steps.extend(calc.run(program, trace)))
+        if results is not None and key is not None:
+            results.put(key, self._last_delta[1])
+        if trace and self._numeric is not FLOAT:
+            return [self._numeric.export(step) for step in steps]
+        return steps
+
+    @contextmanager
+    def streaming(self) -> Iterator[StreamEvaluator]:
+        """
+        Evaluate a program fed in chunks to the yielded evaluator. On leaving the
+        block the last token runs and the whole evaluation is logged as a single
+        "eval" change; on any error the stack is restored instead.
+        """
+        calc = self._calculator
+        consumed = calc.size()
+        snapshot = calc.top(consumed)
+        with phase("op"):
+            try:
+                evaluator = calc.streaming()
+                yield evaluator
+                evaluator.close()
+            except BaseException:
+                calc.load(snapshot)
+                raise
+            pushed = calc.top(calc.size())
+            self._history.record("eval", consumed, pushed)
+            self._record_operation("eval", consumed, pushed)
+
+    def set_numeric(self, mode: str, precision: Optional[int] = None) -> None:
+        """
+        Switch the numeric backend ("float", "decimal", "fraction" or "integer";
+        ``precision`` is the decimal digits, DECIMAL_PRECISION by default). The
+        stack is converted and history restarts from it; conversions that lose
+        information (a fraction to integer) raise instead.
+        """
+        if mode == "decimal" and precision is None:
+            precision = DECIMAL_PRECISION
+        numeric = get_backend(mode, precision)
+        with phase("op"):
+            values = numeric.convert(self._calculator.top(self._calculator.size()))
+            popped = self._calculator.size()
+            self._numeric = numeric
+            self._calculator = create_calculator(numeric)
+            self._calculator.load(values)
+            self._history.clear(values, numeric)
+            self._record_operation(f"numeric({numeric.key})", popped, values)
+
+    def jump(self, version: int) -> None:
+        popped = self._calculator.size()
+        if self._history.restore(version, self._calculator) is None:
+            raise ValueError(f"History version {version} is not available")
+        calc = self._calculator
+        self._record_operation(f"restore({version})", popped, calc.top(calc.size()))
+
+    def restore(self, version: int) -> Dict[str, Any]:
+        self.jump(version)
+        return self.get_state()
+
+    def history(self) -> List[Dict[str, Any]]:
+        current = self._history.version
+        return [
+            {
+                "version": version,
+                "operation": entry.operation,
+                "size": len(entry.stack),
+                "current": version == current,
+            }
+            for version, entry in self._history.entries()
+        ]
+
     @property
     def calculator(self) -> RPNCalculator:
         return self._calculator
 
+_session_store: SessionStore = create_session_store(
+    SESSION_BACKEND,
+    StackService,
+    redis_url=REDIS_URL,
+    manager_address=SESSION_MANAGER_ADDRESS,
+    manager_authkey=SESSION_MANAGER_AUTHKEY,
+    ttl=SESSION_TTL,
+    max_sessions=SESSION_MAX_COUNT,
+    max_bytes=SESSION_MAX_BYTES,
+    journal_dir=JOURNAL_DIR,
+    journal_options={
+        "fsync": JOURNAL_FSYNC,
+        "fsync_batch": JOURNAL_FSYNC_BATCH,
+        "fsync_interval": JOURNAL_FSYNC_INTERVAL,
+        "compact_every": JOURNAL_COMPACT_EVERY,
+    },
+    lock_ttl=SESSION_LOCK_TTL,
+)
+
+def get_session_store() -> SessionStore:
+    return _session_store
+
+def set_session_store(store: SessionStore) -> None:
+    global _session_store
+    _session_store = store
+
 def get_stack_service(session_id: str = "default") -> StackService:
-    return StackService.get_instance(session_id)
+    return get_session_store().load(session_id)
+
+def stack_session(session_id: str = "default") -> Iterator[StackService]:
+    """
+    Request-scoped session dependency: one store read before the handler and
+    one write after it, only if the handler changed the session, both under
+    the store's lock of the session.
+    """
+    store = get_session_store()
+    with store.lock(session_id):
+        with phase("session_load"):
+            service = store.load(session_id)
+        operation_count = service.operation_count
+        yield service
+        if service.operation_count != operation_count:
+            with phase("session_save"):
+                store.save(service)
+            get_metrics().observe_depth(service.calculator.size())
+
+class SessionLocks:
+    """
+    Per-session ``asyncio.Lock`` registry. Locks are held weakly, so an entry
+    lives only while a request holds or waits for it.
+    """
+
+    def __init__(self) -> None:
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def get(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+_session_locks = SessionLocks()
+
+def get_session_locks() -> SessionLocks:
+    return _session_locks
+
+async def async_stack_session(session_id: str = "default") -> AsyncIterator[StackService]:
+    """
+    Async ``stack_session``: requests on one session are serialized by its lock
+    (and, across processes, the store's) from load to save, while other sessions
+    proceed concurrently on the event loop.
+    """
+    store = get_session_store()
+    async with _session_locks.get(session_id), store.alock(session_id):
+        with phase("session_load"):
+            service = await store.aload(session_id)
+        operation_count = service.operation_count
+        yield service
+        if service.operation_count != operation_count:
+            with phase("session_save"):
+                await store.asave(service)
+            get_metrics().observe_depth(service.calculator.size())
+
+async def current_session_store() -> SessionStore:
+    """``get_session_store`` as an async dependency (no threadpool hop)."""
+    return _session_store
+
+_program_cache = ProgramCache(PROGRAM_CACHE_SIZE)
+
+def get_program_cache() -> ProgramCache:
+    return _program_cache
+
+async def current_program_cache() -> ProgramCache:
+    return _program_cache
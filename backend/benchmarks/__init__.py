@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for the calculator domain and the API.
+
+Run from the backend directory with ``python -m benchmarks``.
+"""
@@ -0,0 +1,53 @@
+"""
+Benchmark command line.
+
+    python -m benchmarks run [-k NAME ...] [--quick] [-o results.json] [--baseline base.json]
+    python -m benchmarks compare base.json results.json [--threshold 0.10]
+
+``--baseline`` (and ``compare``) exit with status 1 when a benchmark got slower
+than the baseline by more than the threshold.
+"""
+import argparse
+import sys
+from typing import List, Optional
+from benchmarks import bench_api, bench_domain  # noqa: F401 - registers the benchmarks
+from benchmarks.harness import compare, load_report, run, save_report
+
+def _check(baseline_path: str, report: dict, threshold: float) -> int:
+    regressions = compare(load_report(baseline_path), report, threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        return 1
+    print(f"No regression beyond {threshold:.0%} against {baseline_path}")
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks")
+    run_parser.add_argument("-k", dest="names", action="append", help="Only names containing this")
+    run_parser.add_argument("--quick", action="store_true", help="Run 10x fewer iterations")
+    run_parser.add_argument("-o", "--output", help="Write the JSON report here")
+    run_parser.add_argument("--baseline", help="Fail on regressions against this report")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return _check(args.baseline, load_report(args.current), args.threshold)
+
+    report = run(args.names, scale=0.1 if args.quick else 1.0, log=print)
+    if args.output:
+        save_report(report, args.output)
+    if args.baseline:
+        return _check(args.baseline, report, args.threshold)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
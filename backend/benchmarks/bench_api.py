@@ -0,0 +1,144 @@
+"""
+End-to-end API benchmarks through an in-process ASGI client (no network).
+
+Sequential runs report per-request latency percentiles; the concurrent run
+spreads requests over several sessions to measure throughput.
+"""
+import asyncio
+import json
+import struct
+from time import perf_counter_ns
+from typing import Any, Awaitable, Callable, List
+import httpx
+from app.api.encoding import MEDIA_TYPES
+from app.core.config import API_PREFIX
+from app.main import app
+from benchmarks.harness import Result, benchmark, latency_summary
+
+_REQUESTS = 2_000
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+async def _sequential(
+    requests: int, call: Callable[[httpx.AsyncClient, int], Awaitable[Any]]
+) -> Result:
+    async with _client() as client:
+        for i in range(min(requests, 50)):  # warm-up
+            await call(client, i)
+        samples: List[float] = []
+        start = perf_counter_ns()
+        for i in range(requests):
+            t0 = perf_counter_ns()
+            await call(client, i)
+            samples.append(perf_counter_ns() - t0)
+        elapsed = perf_counter_ns() - start
+        await client.delete(f"{API_PREFIX}/session", params={"session_id": "bench"})
+    return latency_summary(samples, elapsed)
+
+def _requests(scale: float) -> int:
+    return max(10, int(_REQUESTS * scale))
+
+_SESSION = {"session_id": "bench"}
+
+@benchmark("api.push")
+def api_push(scale: float) -> Result:
+    async def call(client: httpx.AsyncClient, i: int) -> None:
+        await client.post(f"{API_PREFIX}/stack", json={"value": i}, params=_SESSION)
+
+    return asyncio.run(_sequential(_requests(scale), call))
+
+@benchmark("api.push_add[delta]")
+def api_push_add(scale: float) -> Result:
+    params = {"session_id": "bench", "delta": "true"}
+
+    async def call(client: httpx.AsyncClient, i: int) -> None:
+        await client.post(f"{API_PREFIX}/stack", json={"value": i}, params=params)
+        await client.post(f"{API_PREFIX}/op/add", params=params)
+
+    async def main() -> Result:
+        async with _client() as client:
+            await client.post(f"{API_PREFIX}/stack", json={"value": 0}, params=params)
+        return await _sequential(_requests(scale) // 2, call)
+
+    return asyncio.run(main())
+
+@benchmark("api.eval")
+def api_eval(scale: float) -> Result:
+    async def call(client: httpx.AsyncClient, i: int) -> None:
+        await client.post(
+            f"{API_PREFIX}/eval", json={"program": "1 2 + 3 * drop"}, params=_SESSION
+        )
+
+    return asyncio.run(_sequential(_requests(scale), call))
+
+@benchmark("api.push[concurrent sessions=16]")
+def api_concurrent(scale: float) -> Result:
+    sessions = 16
+    per_session = max(1, _requests(scale) // sessions)
+
+    async def worker(client: httpx.AsyncClient, session: int, samples: List[float]) -> None:
+        params = {"session_id": f"bench-{session}"}
+        for i in range(per_session):
+            t0 = perf_counter_ns()
+            await client.post(f"{API_PREFIX}/stack", json={"value": i}, params=params)
+            samples.append(perf_counter_ns() - t0)
+
+    async def main() -> Result:
+        samples: List[float] = []
+        async with _client() as client:
+            start = perf_counter_ns()
+            await asyncio.gather(*(worker(client, s, samples) for s in range(sessions)))
+            elapsed = perf_counter_ns() - start
+            for s in range(sessions):
+                await client.delete(f"{API_PREFIX}/session", params={"session_id": f"bench-{s}"})
+        return latency_summary(samples, elapsed)
+
+    return asyncio.run(main())
+
+def _register_bulk_push(media_type: str, encode: Callable[[List[float]], bytes]) -> None:
+    @benchmark(f"api.bulk_push[100000 values, {media_type}]")
+    def bulk_push(scale: float) -> Result:
+        """Push 100k values in one request, then clear the stack (both timed)."""
+        body = encode([i / 8 for i in range(100_000)])
+        headers = {"Content-Type": media_type}
+        params = {"session_id": "bench", "delta": "true"}
+
+        async def call(client: httpx.AsyncClient, i: int) -> None:
+            await client.post(
+                f"{API_PREFIX}/stack/bulk", content=body, headers=headers, params=params
+            )
+            await client.delete(f"{API_PREFIX}/stack", params=_SESSION)
+
+        return asyncio.run(_sequential(max(3, int(20 * scale)), call))
+
+_register_bulk_push("application/json", lambda values: json.dumps(values).encode())
+_register_bulk_push("text/csv", lambda values: "\n".join(map(repr, values)).encode())
+_register_bulk_push(
+    "application/octet-stream", lambda values: struct.pack(f"<{len(values)}d", *values)
+)
+
+def _register_get_stack(media_type: str) -> None:
+    @benchmark(f"api.get_stack[100000 values, {media_type}]")
+    def get_stack(scale: float) -> Result:
+        """Fetch a 100k-value stack in one response encoding."""
+        body = struct.pack("<100000d", *(i / 8 for i in range(100_000)))
+        headers = {"Accept": media_type}
+
+        async def call(client: httpx.AsyncClient, i: int) -> None:
+            await client.get(f"{API_PREFIX}/stack", headers=headers, params=_SESSION)
+
+        async def main() -> Result:
+            async with _client() as client:
+                await client.post(
+                    f"{API_PREFIX}/stack/bulk",
+                    content=body,
+                    headers={"Content-Type": "application/octet-stream"},
+                    params=_SESSION,
+                )
+            return await _sequential(max(3, int(50 * scale)), call)
+
+        return asyncio.run(main())
+
+for _media_type in MEDIA_TYPES:
+    _register_get_stack(_media_type)
@@ -0,0 +1,290 @@
+"""
+Domain benchmarks - calculator operations, service mutations and history.
+
+Operations are timed at several stack depths to catch costs that grow with
+the stack (copies, full snapshots) instead of with the operation.
+"""
+import os
+import tempfile
+from app.domain.compiler import compile_program
+from app.domain.numeric import MODES, get_backend
+from app.domain.operators import REDUCTIONS
+from app.domain.rpn_calculator import RPNCalculator, create_calculator
+from app.services.jobs import JobRunner, run_tasks
+from app.services.journal import JournalSessionStore
+from app.services.result_cache import ResultCache
+from app.services.stack_service import StackService
+from benchmarks.harness import Result, benchmark, time_loop
+
+DEPTHS = (10, 1_000, 100_000)
+_INNER = 10_000
+
+def _inner(scale: float) -> int:
+    return max(1, int(_INNER * scale))
+
+def _calculator(depth: int) -> RPNCalculator:
+    calc = RPNCalculator()
+    calc.load([1.0] * depth)
+    return calc
+
+def _register_calculator(depth: int) -> None:
+    @benchmark(f"calculator.push_add[depth={depth}]")
+    def push_add(scale: float) -> Result:
+        calc = _calculator(depth)
+        inner = _inner(scale)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.push(1.0)
+                calc.add()
+
+        return time_loop(loop, inner)
+
+    @benchmark(f"calculator.dup_drop[depth={depth}]")
+    def dup_drop(scale: float) -> Result:
+        calc = _calculator(depth)
+        inner = _inner(scale)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.dup()
+                calc.drop()
+
+        return time_loop(loop, inner)
+
+    @benchmark(f"calculator.swap[depth={depth}]")
+    def swap(scale: float) -> Result:
+        calc = _calculator(depth)
+        inner = _inner(scale)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.swap()
+
+        return time_loop(loop, inner)
+
+def _service(depth: int) -> StackService:
+    service = StackService("bench")
+    for _ in range(depth):
+        service.perform("push", 1.0)
+    return service
+
+def _register_service(depth: int) -> None:
+    @benchmark(f"service.push_add[depth={depth}]")
+    def push_add(scale: float) -> Result:
+        service = _service(depth)
+        inner = _inner(scale)
+
+        def loop() -> None:
+            for _ in range(inner):
+                service.perform("push", 1.0)
+                service.perform("add")
+
+        return time_loop(loop, inner)
+
+    @benchmark(f"history.undo_redo[depth={depth}]")
+    def undo_redo(scale: float) -> Result:
+        service = _service(depth)
+        for _ in range(50):
+            service.perform("dup")
+            service.perform("add")
+        inner = _inner(scale)
+
+        def loop() -> None:
+            for _ in range(inner):
+                service.perform("undo")
+                service.perform("redo")
+
+        return time_loop(loop, inner)
+
+for _depth in DEPTHS:
+    _register_calculator(_depth)
+    _register_service(_depth)
+
+def _register_evaluate(name: str, source: str) -> None:
+    @benchmark(name)
+    def evaluate(scale: float) -> Result:
+        program = compile_program(source)
+        calc = RPNCalculator()
+        inner = max(1, _inner(scale) // 10)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.run(program)
+
+        return time_loop(loop, inner)
+
+_PROGRAM = "1 2 + 3 * 4 - 2 / sqrt drop"
+_register_evaluate("calculator.run[10 tokens]", _PROGRAM)
+_register_evaluate("calculator.run[100 tokens]", " ".join([_PROGRAM] * 10))
+
+# A generated formula recomputing its terms: (2x+1) * (2x+1) * (2x+1) * (0.5 * 4 + 1)
+_REDUNDANT = "dup 2 * 1 + swap dup 2 * 1 + swap 2 * 1 + * * 0.5 4 * 1 + *"
+
+def _register_optimized(optimize: bool) -> None:
+    @benchmark(f"calculator.run[redundant formula, optimize={optimize}]")
+    def run(scale: float) -> Result:
+        program = compile_program(_REDUNDANT, optimize)
+        calc = RPNCalculator()
+        inner = max(1, _inner(scale) // 10)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.push(3.0)
+                calc.run(program)
+                calc.clear()
+
+        return time_loop(loop, inner)
+
+for _optimize in (False, True):
+    _register_optimized(_optimize)
+
+def _register_memoized(cached: bool) -> None:
+    @benchmark(f"service.evaluate[180 tokens, result cache={cached}]")
+    def evaluate(scale: float) -> Result:
+        """An /eval dashboards repeat: same formula, same inputs (undone between runs)."""
+        program = compile_program(" ".join(["dup sqrt 3 * swap 2 / + sqrt"] * 20))
+        results = ResultCache() if cached else None
+        service = StackService("bench")
+        service.push_many([9.0, 3.0, 4.0])
+        inner = max(1, _inner(scale) // 10)
+
+        def loop() -> None:
+            for _ in range(inner):
+                service.evaluate(program, results=results)
+                service.perform("undo")
+
+        return time_loop(loop, inner)
+
+for _cached in (False, True):
+    _register_memoized(_cached)
+
+@benchmark("calculator.stream[100k tokens]")
+def calculator_stream(scale: float) -> Result:
+    """Stream a 100k-token program in 64 KiB chunks (compare calculator.compile_run)."""
+    data = " ".join([_PROGRAM] * 10_000).encode()
+    chunks = [data[i:i + 65_536] for i in range(0, len(data), 65_536)]
+    inner = max(1, int(10 * scale))
+
+    def loop() -> None:
+        for _ in range(inner):
+            RPNCalculator().streaming().run(chunks)
+
+    return time_loop(loop, inner)
+
+@benchmark("calculator.compile_run[100k tokens]")
+def calculator_compile_run(scale: float) -> Result:
+    """Compile and run the same program once, as a one-off /eval would."""
+    source = " ".join([_PROGRAM] * 10_000)
+    inner = max(1, int(10 * scale))
+
+    def loop() -> None:
+        for _ in range(inner):
+            RPNCalculator().run(compile_program(source))
+
+    return time_loop(loop, inner)
+
+def _register_numeric(mode: str) -> None:
+    @benchmark(f"calculator.push_add[numeric={mode}]")
+    def push_add(scale: float) -> Result:
+        calc = create_calculator(get_backend(mode))
+        calc.load([1] * 10)
+        inner = _inner(scale)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.push(1)
+                calc.add()
+
+        return time_loop(loop, inner)
+
+    @benchmark(f"calculator.run[numeric={mode}]")
+    def run(scale: float) -> Result:
+        program = compile_program("1 2 + 3 * 4 - 2 ^ dup * 7 /")
+        calc = create_calculator(get_backend(mode))
+        inner = max(1, _inner(scale) // 10)
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.run(program)
+                calc.clear()
+
+        return time_loop(loop, inner)
+
+for _mode in MODES:
+    _register_numeric(_mode)
+
+def _register_reduce(name: str) -> None:
+    @benchmark(f"calculator.reduce[{name}, 100000 values]")
+    def reduce(scale: float) -> Result:
+        """Fold a 100k-value stack in one step (restored before each fold)."""
+        values = [1.0 + (i % 7) / 1000 for i in range(100_000)]
+        calc = RPNCalculator()
+        inner = max(1, int(20 * scale))
+
+        def loop() -> None:
+            for _ in range(inner):
+                calc.load(values)
+                calc.reduce(name)
+
+        return time_loop(loop, inner)
+
+for _name in REDUCTIONS:
+    _register_reduce(_name)
+
+_TASKS = [(f"{i} 2 * 3 + dup *", [i]) for i in range(10_000)]
+
+@benchmark("jobs.run[10000 tasks, serial]")
+def jobs_serial(scale: float) -> Result:
+    """Evaluate a batch in this process (compare jobs.run[..., pool])."""
+    inner = max(1, int(10 * scale))
+
+    def loop() -> None:
+        for _ in range(inner):
+            run_tasks(_TASKS)
+
+    result = time_loop(loop, inner, repeat=3)
+    result["tasks_per_sec"] = len(_TASKS) * result["ops_per_sec"]
+    return result
+
+@benchmark("jobs.run[10000 tasks, pool]")
+def jobs_pool(scale: float) -> Result:
+    """The same batch through a JobRunner on every core (pool startup excluded)."""
+    runner = JobRunner(os.cpu_count())
+    inner = max(1, int(10 * scale))
+
+    def loop() -> None:
+        for _ in range(inner):
+            for _chunk in runner.submit(_TASKS).chunks():
+                pass
+
+    try:
+        result = time_loop(loop, inner, repeat=3)
+    finally:
+        runner.shutdown()
+    result["tasks_per_sec"] = len(_TASKS) * result["ops_per_sec"]
+    return result
+
+@benchmark("journal.replay[1000 records]")
+def journal_replay(scale: float) -> Result:
+    """Restore one session from a snapshot plus 1000 journaled operations."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = JournalSessionStore(StackService, directory, compact_every=10_000)
+        service = store.load("bench")
+        service.perform("push", 1.0)
+        store.save(service)
+        for _ in range(500):
+            service.perform("dup")
+            store.save(service)
+            service.perform("add")
+            store.save(service)
+        store.close()
+        inner = max(1, int(10 * scale))
+
+        def loop() -> None:
+            for _ in range(inner):
+                JournalSessionStore(StackService, directory).load("bench")
+
+        result = time_loop(loop, inner, repeat=3)
+    result["records_per_sec"] = 1000 * result["ops_per_sec"]
+    return result
@@ -0,0 +1,120 @@
+"""
+Benchmark harness - registry, timing loop, JSON reports and regression checks.
+
+A benchmark is a function ``(scale) -> result`` registered with ``@benchmark``.
+Most use ``time_loop``, which times a callable doing ``inner`` operations per
+call; every result carries ``ns_per_op`` (lower is better), the figure that
+``compare`` checks against a baseline.
+"""
+import json
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+Result = Dict[str, float]
+BenchmarkFn = Callable[[float], Result]
+
+BENCHMARKS: Dict[str, BenchmarkFn] = {}
+
+def benchmark(name: str) -> Callable[[BenchmarkFn], BenchmarkFn]:
+    def register(fn: BenchmarkFn) -> BenchmarkFn:
+        if name in BENCHMARKS:
+            raise ValueError(f"Duplicate benchmark: {name}")
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+def time_loop(fn: Callable[[], Any], inner: int, repeat: int = 5) -> Result:
+    """
+    Call ``fn`` (which performs ``inner`` operations) ``repeat`` times after one
+    warm-up call; per-operation figures use the median run.
+    """
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        fn()
+        samples.append((perf_counter_ns() - start) / inner)
+    median = statistics.median(samples)
+    return {
+        "ns_per_op": median,
+        "min_ns": min(samples),
+        "ops_per_sec": 1e9 / median if median else 0.0,
+    }
+
+def latency_summary(samples_ns: Sequence[float], elapsed_ns: float) -> Result:
+    """Percentiles of per-request latencies plus throughput over ``elapsed_ns``."""
+    ordered = sorted(samples_ns)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "ns_per_op": statistics.mean(ordered),
+        "p50_ns": percentile(0.50),
+        "p95_ns": percentile(0.95),
+        "p99_ns": percentile(0.99),
+        "ops_per_sec": len(ordered) * 1e9 / elapsed_ns if elapsed_ns else 0.0,
+    }
+
+def run(
+    names: Optional[Sequence[str]] = None,
+    scale: float = 1.0,
+    log: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """Run the selected benchmarks (substring match, all by default) into a report."""
+    results: Dict[str, Result] = {}
+    for name, fn in BENCHMARKS.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        results[name] = fn(scale)
+        if log is not None:
+            log(format_result(name, results[name]))
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "scale": scale,
+        },
+        "results": results,
+    }
+
+def format_result(name: str, result: Result) -> str:
+    line = f"{name:<44} {result['ns_per_op']:>12.0f} ns/op {result['ops_per_sec']:>14,.0f} ops/s"
+    if "p99_ns" in result:
+        line += f"  p50 {result['p50_ns'] / 1e3:.0f}us p99 {result['p99_ns'] / 1e3:.0f}us"
+    return line
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10
+) -> List[str]:
+    """
+    Benchmarks present in both reports whose ``ns_per_op`` grew by more than
+    ``threshold`` (a fraction), formatted for display.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or not before["ns_per_op"]:
+            continue
+        change = result["ns_per_op"] / before["ns_per_op"] - 1
+        if change > threshold:
+            regressions.append(
+                f"{name}: {before['ns_per_op']:.0f} -> {result['ns_per_op']:.0f} ns/op "
+                f"(+{change:.0%})"
+            )
+    return regressions
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+def save_report(report: Dict[str, Any], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
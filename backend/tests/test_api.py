@@ -3,9 +3,12 @@ Integration tests for the RPN Calculator REST API.
 
 These tests validate the API endpoints and their HTTP behavior.
 """
+import struct
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.api.encoding import MEDIA_TYPES
+from app.core.config import API_PREFIX
 from app.services.stack_service import get_stack_service
 
 
@@ -40,7 +43,7 @@ class TestStackEndpoints:
 
     def test_get_empty_stack(self):
         """GET /stack should return empty stack initially."""
-        response = client.get("/stack")
+        response = client.get(f"{API_PREFIX}/stack")
         assert response.status_code == 200
         data = response.json()
         assert data["stack"] == []
@@ -48,7 +51,7 @@ class TestStackEndpoints:
 
     def test_push_single_value(self):
         """POST /stack should add a value to the stack."""
-        response = client.post("/stack", json={"value": 42})
+        response = client.post(f"{API_PREFIX}/stack", json={"value": 42})
         assert response.status_code == 201
         data = response.json()
         assert data["stack"] == [42.0]
@@ -56,9 +59,9 @@ class TestStackEndpoints:
 
     def test_push_multiple_values(self):
         """Pushing multiple values should work."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 20})
-        response = client.post("/stack", json={"value": 30})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 20})
+        response = client.post(f"{API_PREFIX}/stack", json={"value": 30})
 
         assert response.status_code == 201
         data = response.json()
@@ -67,34 +70,38 @@ class TestStackEndpoints:
 
     def test_push_float_value(self):
         """Pushing float values should work."""
-        response = client.post("/stack", json={"value": 3.14159})
+        response = client.post(f"{API_PREFIX}/stack", json={"value": 3.14159})
         assert response.status_code == 201
         data = response.json()
         assert data["stack"] == [3.14159]
 
     def test_push_negative_value(self):
         """Pushing negative values should work."""
-        response = client.post("/stack", json={"value": -17.5})
+        response = client.post(f"{API_PREFIX}/stack", json={"value": -17.5})
         assert response.status_code == 201
         data = response.json()
         assert data["stack"] == [-17.5]
 
     def test_push_invalid_value_type(self):
-        """Pushing non-numeric value should fail validation."""
-        response = client.post("/stack", json={"value": "not_a_number"})
+        """Pushing a non-numeric value should fail."""
+        # Strings are accepted by the schema (exact modes keep their digits) and
+        # rejected by the session's numeric mode
+        response = client.post(f"{API_PREFIX}/stack", json={"value": "not_a_number"})
+        assert response.status_code == 400
+        response = client.post(f"{API_PREFIX}/stack", json={"value": [1]})
         assert response.status_code == 422
 
     def test_push_missing_value(self):
         """Pushing without value should fail validation."""
-        response = client.post("/stack", json={})
+        response = client.post(f"{API_PREFIX}/stack", json={})
         assert response.status_code == 422
 
     def test_get_stack_after_pushes(self):
         """GET /stack should reflect pushed values."""
-        client.post("/stack", json={"value": 5})
-        client.post("/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
 
-        response = client.get("/stack")
+        response = client.get(f"{API_PREFIX}/stack")
         assert response.status_code == 200
         data = response.json()
         assert data["stack"] == [5.0, 10.0]
@@ -102,22 +109,22 @@ class TestStackEndpoints:
 
     def test_clear_stack(self):
         """DELETE /stack should clear all values."""
-        client.post("/stack", json={"value": 1})
-        client.post("/stack", json={"value": 2})
+        client.post(f"{API_PREFIX}/stack", json={"value": 1})
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
 
-        response = client.delete("/stack")
+        response = client.delete(f"{API_PREFIX}/stack")
         assert response.status_code == 200
         data = response.json()
         assert "message" in data
 
-        response = client.get("/stack")
+        response = client.get(f"{API_PREFIX}/stack")
         data = response.json()
         assert data["stack"] == []
         assert data["size"] == 0
 
     def test_clear_empty_stack(self):
         """Clearing an empty stack should work."""
-        response = client.delete("/stack")
+        response = client.delete(f"{API_PREFIX}/stack")
         assert response.status_code == 200
 
 
@@ -126,10 +133,10 @@ class TestAdditionOperation:
 
     def test_add_two_values(self):
         """POST /op/add should add two values."""
-        client.post("/stack", json={"value": 5})
-        client.post("/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
 
-        response = client.post("/op/add")
+        response = client.post(f"{API_PREFIX}/op/add")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == 8.0
@@ -137,25 +144,25 @@ class TestAdditionOperation:
 
     def test_add_with_one_value_fails(self):
         """Adding with only one value should fail."""
-        client.post("/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
 
-        response = client.post("/op/add")
+        response = client.post(f"{API_PREFIX}/op/add")
         assert response.status_code == 400
         data = response.json()
         assert "operands" in data["detail"].lower()
 
     def test_add_with_empty_stack_fails(self):
         """Adding with empty stack should fail."""
-        response = client.post("/op/add")
+        response = client.post(f"{API_PREFIX}/op/add")
         assert response.status_code == 400
 
     def test_add_leaves_result_on_stack(self):
         """After addition, result should be on stack."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 20})
-        client.post("/op/add")
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 20})
+        client.post(f"{API_PREFIX}/op/add")
 
-        response = client.get("/stack")
+        response = client.get(f"{API_PREFIX}/stack")
         data = response.json()
         assert data["stack"] == [30.0]
 
@@ -165,10 +172,10 @@ class TestSubtractionOperation:
 
     def test_subtract_two_values(self):
         """POST /op/sub should subtract correctly."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
 
-        response = client.post("/op/sub")
+        response = client.post(f"{API_PREFIX}/op/sub")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == 7.0
@@ -176,19 +183,19 @@ class TestSubtractionOperation:
 
     def test_subtract_resulting_in_negative(self):
         """Subtraction can result in negative."""
-        client.post("/stack", json={"value": 3})
-        client.post("/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
 
-        response = client.post("/op/sub")
+        response = client.post(f"{API_PREFIX}/op/sub")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == -7.0
 
     def test_subtract_with_insufficient_operands_fails(self):
         """Subtracting with < 2 values should fail."""
-        client.post("/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
 
-        response = client.post("/op/sub")
+        response = client.post(f"{API_PREFIX}/op/sub")
         assert response.status_code == 400
 
 
@@ -197,10 +204,10 @@ class TestMultiplicationOperation:
 
     def test_multiply_two_values(self):
         """POST /op/mul should multiply correctly."""
-        client.post("/stack", json={"value": 5})
-        client.post("/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
 
-        response = client.post("/op/mul")
+        response = client.post(f"{API_PREFIX}/op/mul")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == 15.0
@@ -208,17 +215,17 @@ class TestMultiplicationOperation:
 
     def test_multiply_by_zero(self):
         """Multiplying by zero should work."""
-        client.post("/stack", json={"value": 42})
-        client.post("/stack", json={"value": 0})
+        client.post(f"{API_PREFIX}/stack", json={"value": 42})
+        client.post(f"{API_PREFIX}/stack", json={"value": 0})
 
-        response = client.post("/op/mul")
+        response = client.post(f"{API_PREFIX}/op/mul")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == 0.0
 
     def test_multiply_with_insufficient_operands_fails(self):
         """Multiplying with < 2 values should fail."""
-        response = client.post("/op/mul")
+        response = client.post(f"{API_PREFIX}/op/mul")
         assert response.status_code == 400
 
 
@@ -227,10 +234,10 @@ class TestDivisionOperation:
 
     def test_divide_two_values(self):
         """POST /op/div should divide correctly."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 2})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
 
-        response = client.post("/op/div")
+        response = client.post(f"{API_PREFIX}/op/div")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == 5.0
@@ -238,29 +245,29 @@ class TestDivisionOperation:
 
     def test_divide_resulting_in_float(self):
         """Division can result in float."""
-        client.post("/stack", json={"value": 7})
-        client.post("/stack", json={"value": 2})
+        client.post(f"{API_PREFIX}/stack", json={"value": 7})
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
 
-        response = client.post("/op/div")
+        response = client.post(f"{API_PREFIX}/op/div")
         assert response.status_code == 200
         data = response.json()
         assert data["result"] == 3.5
 
     def test_divide_by_zero_fails(self):
         """Dividing by zero should return 400 error."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 0})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 0})
 
-        response = client.post("/op/div")
+        response = client.post(f"{API_PREFIX}/op/div")
         assert response.status_code == 400
         data = response.json()
         assert "zero" in data["detail"].lower()
 
     def test_divide_with_insufficient_operands_fails(self):
         """Dividing with < 2 values should fail."""
-        client.post("/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
 
-        response = client.post("/op/div")
+        response = client.post(f"{API_PREFIX}/op/div")
         assert response.status_code == 400
 
 
@@ -269,11 +276,11 @@ class TestComplexScenarios:
 
     def test_rpn_expression_5_3_plus_2_mul(self):
         """Test RPN: 5 3 + 2 * = 16."""
-        client.post("/stack", json={"value": 5})
-        client.post("/stack", json={"value": 3})
-        client.post("/op/add")
-        client.post("/stack", json={"value": 2})
-        response = client.post("/op/mul")
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/op/add")
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
+        response = client.post(f"{API_PREFIX}/op/mul")
 
         assert response.status_code == 200
         data = response.json()
@@ -281,42 +288,42 @@ class TestComplexScenarios:
 
     def test_multiple_operations_sequence(self):
         """Test a sequence of multiple operations."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 5})
-        client.post("/op/add")
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/op/add")
 
-        client.post("/stack", json={"value": 3})
-        client.post("/op/sub")
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/op/sub")
 
-        client.post("/stack", json={"value": 2})
-        client.post("/op/mul")
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
+        client.post(f"{API_PREFIX}/op/mul")
 
-        response = client.get("/stack")
+        response = client.get(f"{API_PREFIX}/stack")
         data = response.json()
         assert data["stack"] == [24.0]
 
     def test_clear_and_restart(self):
         """Test clearing stack and starting over."""
-        client.post("/stack", json={"value": 1})
-        client.post("/stack", json={"value": 2})
-        client.delete("/stack")
+        client.post(f"{API_PREFIX}/stack", json={"value": 1})
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
+        client.delete(f"{API_PREFIX}/stack")
 
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 5})
-        response = client.post("/op/add")
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        response = client.post(f"{API_PREFIX}/op/add")
 
         data = response.json()
         assert data["result"] == 15.0
 
     def test_error_recovery(self):
         """Test that errors don't corrupt the stack."""
-        client.post("/stack", json={"value": 10})
-        client.post("/stack", json={"value": 0})
+        client.post(f"{API_PREFIX}/stack", json={"value": 10})
+        client.post(f"{API_PREFIX}/stack", json={"value": 0})
 
-        response = client.post("/op/div")
+        response = client.post(f"{API_PREFIX}/op/div")
         assert response.status_code == 400
 
-        response = client.get("/stack")
+        response = client.get(f"{API_PREFIX}/stack")
         data = response.json()
         assert data["stack"] == [10.0, 0.0]
 
@@ -333,3 +340,456 @@ class TestComplexScenarios:
         response = client.get("/docs")
         assert response.status_code == 200
         assert "text/html" in response.headers["content-type"]
+
+
+class TestBulkPush:
+    """Test pushing many values in one request."""
+
+    def test_json_csv_and_binary(self):
+        """Each supported body format appends its values in order."""
+        response = client.post(f"{API_PREFIX}/stack/bulk", json=[1, 2.5, 3])
+        assert response.status_code == 201
+        assert response.json()["stack"] == [1.0, 2.5, 3.0]
+        response = client.post(
+            f"{API_PREFIX}/stack/bulk",
+            content=b"4,5\n6",
+            headers={"Content-Type": "text/csv"},
+        )
+        assert response.json()["size"] == 6
+        response = client.post(
+            f"{API_PREFIX}/stack/bulk?delta=true",
+            content=struct.pack("<2d", 7.0, 8.0),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert response.json()["pushed"] == [7.0, 8.0]
+
+    def test_bulk_push_is_one_undo(self):
+        """A bulk push is undone as a whole."""
+        client.post(f"{API_PREFIX}/stack/bulk", json=list(range(1000)))
+        assert client.post(f"{API_PREFIX}/undo").json()["stack"] == []
+
+    def test_errors(self):
+        """Bad values are a 400 that pushes nothing; unknown formats a 415."""
+        assert client.post(f"{API_PREFIX}/stack/bulk", json=[1, "x"]).status_code == 400
+        assert client.post(f"{API_PREFIX}/stack/bulk", json=[1, "3"]).status_code == 400
+        assert client.post(f"{API_PREFIX}/stack/bulk", json=[True]).status_code == 400
+        assert client.post(f"{API_PREFIX}/stack/bulk", json=[10**400]).status_code == 400
+        assert client.post(f"{API_PREFIX}/stack/bulk", json={"value": 1}).status_code == 400
+        response = client.post(
+            f"{API_PREFIX}/stack/bulk",
+            content=b"\x00" * 9,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert response.status_code == 400
+        response = client.post(
+            f"{API_PREFIX}/stack/bulk", content=b"1", headers={"Content-Type": "image/png"}
+        )
+        assert response.status_code == 415
+        assert client.get(f"{API_PREFIX}/stack").json()["stack"] == []
+
+    def test_oversized_bodies_are_refused(self, monkeypatch):
+        """Bodies over the byte cap are a 413 before they are parsed."""
+        monkeypatch.setattr("app.api.routes.BULK_PUSH_MAX_VALUES", 4)
+        monkeypatch.setattr("app.api.routes.BULK_PUSH_MAX_BYTES", 16)
+        response = client.post(f"{API_PREFIX}/stack/bulk", json=[1.0] * 8)
+        assert response.status_code == 413
+        response = client.post(
+            f"{API_PREFIX}/stack/bulk",
+            content=struct.pack("<5d", *range(5)),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert response.status_code == 413
+        chunks = iter([b"1,2,", b"3,4,5,6,7,8,9"])
+        response = client.post(
+            f"{API_PREFIX}/stack/bulk", content=chunks, headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == 413
+        assert client.post(f"{API_PREFIX}/stack/bulk", json=[1, 2, 3, 4]).status_code == 201
+        assert client.post(f"{API_PREFIX}/stack/bulk", json=[1] * 5).status_code == 413
+        assert client.get(f"{API_PREFIX}/stack").json()["size"] == 4
+
+
+class TestResponseEncoding:
+    """Test stack response content negotiation."""
+
+    def test_json_is_default(self):
+        """Without an Accept header, or with a wildcard, responses are JSON."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 1.5})
+        for accept in (None, "*/*", "text/html, application/*;q=0.5"):
+            headers = {"Accept": accept} if accept else {}
+            response = client.get(f"{API_PREFIX}/stack", headers=headers)
+            assert response.headers["content-type"] == "application/json"
+            assert response.json() == {"stack": [1.5], "size": 1, "revision": 1}
+
+    def test_packed_float64(self):
+        """application/x-float64 returns the values as the body, the rest as headers."""
+        headers = {"Accept": "application/x-float64"}
+        response = client.post(f"{API_PREFIX}/stack", json={"value": 2.5}, headers=headers)
+        assert response.status_code == 201
+        assert struct.unpack("<d", response.content) == (2.5,)
+        client.post(f"{API_PREFIX}/stack", json={"value": 4})
+        response = client.post(f"{API_PREFIX}/op/mul?delta=true", headers=headers)
+        assert struct.unpack("<d", response.content) == (10.0,)
+        assert response.headers["x-stack-popped"] == "2"
+        assert response.headers["x-stack-revision"] == "3"
+
+    def test_packed_float64_needs_float_mode(self):
+        """Exact modes cannot be packed; the request is refused before it runs."""
+        client.put(f"{API_PREFIX}/session/numeric", json={"mode": "fraction"})
+        response = client.post(
+            f"{API_PREFIX}/stack", json={"value": 1}, headers={"Accept": "application/x-float64"}
+        )
+        assert response.status_code == 406
+        assert client.get(f"{API_PREFIX}/stack").json()["size"] == 0
+
+    def test_msgpack(self):
+        """application/msgpack carries the same payload as JSON."""
+        msgpack = pytest.importorskip("msgpack")
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
+        response = client.get(f"{API_PREFIX}/stack", headers={"Accept": "application/msgpack"})
+        assert msgpack.unpackb(response.content) == {"stack": [3.0], "size": 1, "revision": 1}
+
+    def test_large_stacks(self):
+        """Stacks encoded from the float64 buffer match the values pushed."""
+        values = [i / 7 for i in range(1000)]
+        client.post(f"{API_PREFIX}/stack/bulk", json=values)
+        assert client.get(f"{API_PREFIX}/stack").json()["stack"] == values
+        response = client.get(f"{API_PREFIX}/stack", headers={"Accept": "application/x-float64"})
+        assert list(struct.unpack("<1000d", response.content)) == values
+        if "application/msgpack" in MEDIA_TYPES:
+            import msgpack
+
+            response = client.get(f"{API_PREFIX}/stack", headers={"Accept": "application/msgpack"})
+            assert msgpack.unpackb(response.content)["stack"] == values
+        # The view is released: the stack can still change
+        assert client.post(f"{API_PREFIX}/stack", json={"value": 1}).json()["size"] == 1001
+
+    def test_unsupported_accept(self):
+        """Unsupported text types fall back to JSON; only binary formats are a 406."""
+        for accept in ("text/html", "text/plain", "image/png, text/html;q=0.1"):
+            response = client.get(f"{API_PREFIX}/stack", headers={"Accept": accept})
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/json"
+        for accept in ("application/cbor", "image/png, application/x-protobuf"):
+            response = client.get(f"{API_PREFIX}/stack", headers={"Accept": accept})
+            assert response.status_code == 406
+
+
+class TestEvalEndpoint:
+    """Test batch program evaluation."""
+
+    def test_eval_string_program(self):
+        """POST /eval should run a whole program in one request."""
+        response = client.post(f"{API_PREFIX}/eval", json={"program": "5 3 + 2 *"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["stack"] == [16.0]
+        assert data["size"] == 1
+        assert data["trace"] is None
+
+    def test_eval_token_list_with_trace(self):
+        """Token lists are accepted and the trace lists each step."""
+        response = client.post(
+            f"{API_PREFIX}/eval", json={"program": [4, "dup", "mul"], "trace": True}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["stack"] == [16.0]
+        assert [step["stack"] for step in data["trace"]] == [[4.0], [4.0, 4.0], [16.0]]
+
+    def test_eval_response_encoding(self):
+        """/eval negotiates its encoding like the stack endpoints."""
+        headers = {"Accept": "application/x-float64"}
+        response = client.post(f"{API_PREFIX}/eval", json={"program": "1 2 3"}, headers=headers)
+        assert struct.unpack("<3d", response.content) == (1.0, 2.0, 3.0)
+        assert response.headers["x-stack-size"] == "3"
+        response = client.post(
+            f"{API_PREFIX}/eval", json={"program": "1", "trace": True}, headers=headers
+        )
+        assert response.status_code == 406
+        assert client.get(f"{API_PREFIX}/stack").json()["size"] == 3
+        if "application/msgpack" in MEDIA_TYPES:
+            import msgpack
+
+            response = client.post(
+                f"{API_PREFIX}/eval",
+                json={"program": "+"},
+                headers={"Accept": "application/msgpack"},
+            )
+            assert msgpack.unpackb(response.content) == {
+                "stack": [1.0, 5.0], "size": 2, "trace": None
+            }
+
+    def test_eval_error_rolls_back(self):
+        """A failing program should return 400 and leave the stack unchanged."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 1})
+        response = client.post(f"{API_PREFIX}/eval", json={"program": "2 + 0 /"})
+        assert response.status_code == 400
+        assert "zero" in response.json()["detail"].lower()
+
+        response = client.get(f"{API_PREFIX}/stack")
+        assert response.json()["stack"] == [1.0]
+
+    def test_push_non_finite_is_rejected(self):
+        """NaN, infinities and overflowing literals are a 400 that pushes nothing."""
+        bodies = ['{"value": NaN}', '{"value": Infinity}', '{"value": "nan"}', '{"value": "1e400"}']
+        for body in bodies:
+            response = client.post(
+                f"{API_PREFIX}/stack",
+                content=body,
+                headers={"Content-Type": "application/json"},
+            )
+            assert response.status_code == 400
+            assert "not a finite number" in response.json()["detail"]
+        response = client.get(f"{API_PREFIX}/stack")
+        assert response.json() == {"stack": [], "size": 0, "revision": 0}
+
+    def test_eval_non_finite_is_rejected(self):
+        """Overflow and non-finite literals are a 400 that changes nothing."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 1})
+        for program in ("1e308 10 *", "1e400 1 +", "inf", "nan 1 +"):
+            response = client.post(f"{API_PREFIX}/eval", json={"program": program})
+            assert response.status_code == 400
+        response = client.get(f"{API_PREFIX}/stack")
+        assert response.json() == {"stack": [1.0], "size": 1, "revision": 1}
+        response = client.post(f"{API_PREFIX}/eval", json={"program": "1 +"})
+        assert response.json()["stack"] == [2.0]
+
+    def test_eval_stream_non_finite_is_rejected(self):
+        """Streamed programs fail like /eval, with the same message, and roll back."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 1})
+        for program in ("nan inf 1e400", "1e308 1e308 +", "1e308 10 *", "2 1e400 +"):
+            streamed = client.post(f"{API_PREFIX}/eval/stream", content=program.encode())
+            whole = client.post(f"{API_PREFIX}/eval", json={"program": program})
+            assert streamed.status_code == whole.status_code == 400
+            assert streamed.json()["detail"] == whole.json()["detail"]
+        response = client.get(f"{API_PREFIX}/stack")
+        assert response.json() == {"stack": [1.0], "size": 1, "revision": 1}
+
+    def test_eval_exact_literals(self):
+        """Literals are parsed by the session's numeric mode, so "1/3" is a fraction."""
+        assert client.post(f"{API_PREFIX}/eval", json={"program": "1/3"}).status_code == 400
+        client.put(f"{API_PREFIX}/session/numeric", json={"mode": "fraction"})
+        response = client.post(f"{API_PREFIX}/eval", json={"program": "1/3 1/6 +"})
+        assert response.status_code == 200
+        assert response.json()["stack"] == ["1/2"]
+        assert client.post(f"{API_PREFIX}/eval", json={"program": "1/0"}).status_code == 400
+
+    def test_eval_cache_stats(self):
+        """Repeated programs should hit the compiled program cache."""
+        before = client.get(f"{API_PREFIX}/eval/cache").json()
+        client.post(f"{API_PREFIX}/eval", json={"program": "7 6 * 42 -"})
+        client.post(f"{API_PREFIX}/eval", json={"program": "7 6 * 42 -"})
+        after = client.get(f"{API_PREFIX}/eval/cache").json()
+        assert after["hits"] >= before["hits"] + 1
+
+
+class TestVectorEvalEndpoint:
+    """Test columnar evaluation."""
+
+    def test_eval_vector(self):
+        """POST /eval/vector should evaluate every row and report failures."""
+        pytest.importorskip("numpy")
+        response = client.post(
+            f"{API_PREFIX}/eval/vector",
+            json={"program": "/ 1 +", "columns": [[4.0, 1.0, 9.0], [2.0, 0.0, 3.0]]},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["stack"] == [[3.0, None, 4.0]]
+        assert data["rows"] == 3
+        assert data["division_by_zero"] == [1]
+        assert data["invalid_operation"] == []
+
+
+class TestHistoryEndpoints:
+    """Test undo, redo and time travel."""
+
+    def test_undo_redo(self):
+        """POST /undo and /redo should walk the history."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
+        client.post(f"{API_PREFIX}/stack", json={"value": 5})
+        client.post(f"{API_PREFIX}/op/mul")
+
+        response = client.post(f"{API_PREFIX}/undo")
+        assert response.status_code == 200
+        assert response.json()["stack"] == [2.0, 5.0]
+
+        response = client.post(f"{API_PREFIX}/redo")
+        assert response.json()["stack"] == [10.0]
+
+    def test_undo_without_history_fails(self):
+        """Undo on a fresh stack should return 400."""
+        response = client.post(f"{API_PREFIX}/undo")
+        assert response.status_code == 400
+
+    def test_list_and_restore(self):
+        """GET /history lists versions and restore jumps to one."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 1})
+        client.post(f"{API_PREFIX}/eval", json={"program": "2 3 + +"})
+
+        data = client.get(f"{API_PREFIX}/history").json()
+        assert data["version"] == 2
+        assert [item["operation"] for item in data["items"]] == ["init", "push(1.0)", "eval"]
+
+        response = client.post(f"{API_PREFIX}/history/1/restore")
+        assert response.status_code == 200
+        assert response.json()["stack"] == [1.0]
+
+    def test_restore_unknown_version(self):
+        """Restoring a missing version should return 404."""
+        response = client.post(f"{API_PREFIX}/history/42/restore")
+        assert response.status_code == 404
+
+
+class TestSessionEndpoints:
+    """Test session management endpoints."""
+
+    def test_delete_session(self):
+        """DELETE /session should drop a named session."""
+        client.post(f"{API_PREFIX}/stack", params={"session_id": "to-delete"}, json={"value": 1})
+        response = client.delete(f"{API_PREFIX}/session", params={"session_id": "to-delete"})
+        assert response.status_code == 200
+        response = client.delete(f"{API_PREFIX}/session", params={"session_id": "to-delete"})
+        assert response.status_code == 404
+
+    def test_session_stats(self):
+        """GET /sessions/stats should report live sessions and memory."""
+        response = client.get(f"{API_PREFIX}/sessions/stats")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["backend"] == "memory"
+        assert data["live_sessions"] >= 1
+        assert data["bytes"] > 0
+
+
+class TestDeltaResponses:
+    """Test opt-in delta responses."""
+
+    def test_push_and_op_deltas(self):
+        """Deltas list only the popped count and the pushed values."""
+        base = client.get(f"{API_PREFIX}/stack").json()["revision"]
+        response = client.post(f"{API_PREFIX}/stack?delta=true", json={"value": 6})
+        assert response.status_code == 201
+        assert response.json() == {"revision": base + 1, "popped": 0, "pushed": [6.0], "size": 1}
+
+        client.post(f"{API_PREFIX}/stack", json={"value": 7})
+        response = client.post(f"{API_PREFIX}/op/mul", headers={"X-Stack-Response": "delta"})
+        assert response.json() == {"revision": base + 3, "popped": 2, "pushed": [42.0], "size": 1}
+
+    def test_undo_delta(self):
+        """Undo reports the values it brought back."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 2})
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
+        client.post(f"{API_PREFIX}/op/add")
+        data = client.post(f"{API_PREFIX}/undo?delta=true").json()
+        assert (data["popped"], data["pushed"], data["size"]) == (1, [2.0, 3.0], 2)
+
+    def test_applying_deltas_matches_full_stack(self):
+        """A client applying deltas stays in sync with GET /stack."""
+        state = client.get(f"{API_PREFIX}/stack").json()
+        stack, revision = state["stack"], state["revision"]
+        requests = [
+            ("/stack", {"value": 9}),
+            ("/stack", {"value": 4}),
+            ("/op/swap", None),
+            ("/op/dup", None),
+            ("/op/div", None),
+            ("/history/1/restore", None),
+        ]
+        for path, body in requests:
+            data = client.post(f"{API_PREFIX}{path}?delta=true", json=body).json()
+            assert data["revision"] == revision + 1
+            del stack[len(stack) - data["popped"]:]
+            stack.extend(data["pushed"])
+            revision = data["revision"]
+        assert client.get(f"{API_PREFIX}/stack").json()["stack"] == stack
+
+
+class TestOperatorEndpoints:
+    """Test the generic operator route."""
+
+    def test_aliases_and_new_operators(self):
+        """POST /op/{name} accepts any operator name or alias."""
+        for value in (1, 2, 3):
+            client.post(f"{API_PREFIX}/stack", json={"value": value})
+        assert client.post(f"{API_PREFIX}/op/rot").json()["stack"] == [2.0, 3.0, 1.0]
+        client.post(f"{API_PREFIX}/stack", json={"value": 3})
+        assert client.post(f"{API_PREFIX}/op/sum").json()["stack"] == [6.0]
+        assert client.post(f"{API_PREFIX}/op/NEG").json()["stack"] == [-6.0]
+
+    def test_result_is_the_new_top(self):
+        """Operator responses add the top of the stack, null once it is empty."""
+        client.post(f"{API_PREFIX}/stack", json={"value": 9})
+        response = client.post(f"{API_PREFIX}/op/sqrt").json()
+        assert response == {"stack": [3.0], "size": 1, "revision": 2, "result": 3.0}
+        assert client.post(f"{API_PREFIX}/op/drop").json()["result"] is None
+
+    def test_errors(self):
+        """Unknown operators are 404; operator errors are 400."""
+        assert client.post(f"{API_PREFIX}/op/frobnicate").status_code == 404
+        response = client.post(f"{API_PREFIX}/op/mean")
+        assert response.status_code == 400
+
+    def test_reduce(self):
+        """POST /stack/reduce folds the top count values or the whole stack."""
+        for value in (2, 4, 4, 5):
+            client.post(f"{API_PREFIX}/stack", json={"value": value})
+        response = client.post(f"{API_PREFIX}/stack/reduce", json={"op": "sum", "count": 2})
+        assert response.json()["stack"] == [2.0, 4.0, 9.0]
+        response = client.post(f"{API_PREFIX}/stack/reduce?delta=true", json={"op": "product"})
+        assert response.json()["popped"] == 3
+        assert response.json()["pushed"] == [72.0]
+        response = client.post(f"{API_PREFIX}/stack/reduce", json={"op": "stddev"})
+        assert response.status_code == 400
+        response = client.post(f"{API_PREFIX}/stack/reduce", json={"op": "dup"})
+        assert response.status_code == 422
+
+    def test_list_operators(self):
+        """GET /ops describes every operator."""
+        ops = {op["name"]: op for op in client.get(f"{API_PREFIX}/ops").json()}
+        assert ops["power"]["aliases"] == ["^", "pow"]
+        assert ops["pick"]["variadic"] is True
+        assert ops["rot"]["operands"] == 3
+
+
+class TestWebSocket:
+    """Test the streaming WebSocket endpoint."""
+
+    def test_stream_operations(self):
+        """Operations on one socket should return deltas in order."""
+        with client.websocket_connect(f"{API_PREFIX}/ws") as ws:
+            ws.send_json({"op": "push", "value": 3, "id": 1})
+            first = ws.receive_json()
+            assert first["pushed"] == [3.0]
+            assert first["id"] == 1
+
+            ws.send_json({"op": "push", "value": 4})
+            ws.receive_json()
+            ws.send_json({"op": "mul"})
+            assert ws.receive_json()["pushed"] == [12.0]
+
+            ws.send_json({"program": "dup +"})
+            assert ws.receive_json()["pushed"] == [24.0]
+
+            ws.send_json({"op": "undo"})
+            assert ws.receive_json()["pushed"] == [12.0]
+
+            ws.send_json({"op": "sync"})
+            assert ws.receive_json()["stack"] == [12.0]
+
+        assert client.get(f"{API_PREFIX}/stack").json()["stack"] == [12.0]
+
+    def test_errors_keep_connection_open(self):
+        """Errors are reported on the socket without closing it."""
+        with client.websocket_connect(f"{API_PREFIX}/ws") as ws:
+            ws.send_json({"op": "add"})
+            assert "operands" in ws.receive_json()["error"]
+            ws.send_json({"op": "nope"})
+            assert "Unknown operation" in ws.receive_json()["error"]
+            ws.send_text("not json")
+            assert "error" in ws.receive_json()
+            ws.send_text('{"op": "push", "value": 1%s}' % ("0" * 400))
+            assert "error" in ws.receive_json()
+            ws.send_json({"op": "push", "value": 1})
+            assert ws.receive_json()["size"] == 1
@@ -0,0 +1,62 @@
+"""
+Unit tests for the benchmark harness.
+"""
+import json
+from benchmarks import bench_domain  # noqa: F401 - registers the benchmarks
+from benchmarks.__main__ import main
+from benchmarks.harness import BENCHMARKS, compare, latency_summary, run, time_loop
+
+
+def _report(**ns_per_op):
+    return {"results": {name: {"ns_per_op": value} for name, value in ns_per_op.items()}}
+
+
+class TestHarness:
+    """Test timing helpers and report comparison."""
+
+    def test_time_loop_reports_per_operation(self):
+        """Figures should be per operation, not per call."""
+        result = time_loop(lambda: sum(range(100)), inner=100, repeat=3)
+        assert result["ns_per_op"] > 0
+        assert result["min_ns"] <= result["ns_per_op"]
+        assert result["ops_per_sec"] > 0
+
+    def test_latency_summary_percentiles(self):
+        """Percentiles should be taken from the sorted samples."""
+        result = latency_summary(list(range(1, 101)), elapsed_ns=1e9)
+        assert result["p50_ns"] == 51
+        assert result["p99_ns"] == 100
+        assert result["ops_per_sec"] == 100
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        """Only slowdowns above the threshold should be reported."""
+        baseline = _report(a=100, b=100, c=100)
+        current = _report(a=109, b=150, c=50, d=1000)
+        regressions = compare(baseline, current, threshold=0.10)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("b:")
+
+    def test_run_selects_by_substring(self):
+        """run() should execute only matching benchmarks."""
+        report = run(["calculator.swap[depth=10]"], scale=0.001)
+        assert list(report["results"]) == ["calculator.swap[depth=10]"]
+        assert "python" in report["meta"]
+
+
+class TestCommandLine:
+    """Test the python -m benchmarks entry point."""
+
+    def test_baseline_regression_exit_status(self, tmp_path, capsys):
+        """A run slower than its baseline should exit with status 1."""
+        name = "calculator.swap[depth=10]"
+        assert name in BENCHMARKS
+        output = tmp_path / "results.json"
+        assert main(["run", "-k", name, "--quick", "-o", str(output)]) == 0
+        report = json.loads(output.read_text())
+
+        fast = tmp_path / "fast.json"
+        fast.write_text(json.dumps(_report(**{name: 1e-3})))
+        assert main(["compare", str(fast), str(output)]) == 1
+        assert main(["compare", str(output), str(output)]) == 0
+        assert name in report["results"]
+        assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,131 @@
+"""
+Unit tests for the RPN program compiler and its LRU cache.
+"""
+import pytest
+from fractions import Fraction
+from app.domain.compiler import CompiledProgram, ProgramCache, compile_program
+from app.domain.numeric import get_backend
+from app.domain.rpn_calculator import RPNCalculator, create_calculator
+from app.core.exceptions import (
+    InsufficientOperandsError,
+    DivisionByZeroError,
+    EmptyStackError,
+    InvalidOperationError,
+    InvalidTokenError,
+)
+
+
+class TestCompiledProgram:
+    """Test compilation and execution of programs."""
+
+    def test_literals_are_parsed_once(self):
+        """Numeric tokens should be pre-parsed to float arguments."""
+        program = compile_program("1 2.5 +")
+        assert [arg for _, arg in program.code[:2]] == [1.0, 2.5]
+        assert len(program) == 3
+
+    def test_run_matches_calculator(self):
+        """Compiled execution should give the same stack as the methods."""
+        program = compile_program("15 7 1 + 1 + / 3 - 2 ^ sqrt dup swap drop")
+        stack = []
+        program.run(stack)
+        calc = RPNCalculator()
+        for token in program.tokens:
+            calc.execute(token)
+        assert stack == calc.stack
+
+    def test_required_depth(self):
+        """The static depth check should report how many inputs a program needs."""
+        assert compile_program("1 2 +").required == 0
+        assert compile_program("+").required == 2
+        assert compile_program("3 * +").required == 2
+        assert compile_program("dup *").required == 1
+
+    def test_insufficient_operands_checked_before_run(self):
+        """Under-supplied programs should fail before touching the stack."""
+        program = compile_program("2 * 5 + +")
+        stack = [1.0]
+        with pytest.raises(InsufficientOperandsError, match="only 1 available.*token 4"):
+            program.run(stack)
+        assert stack == [1.0]
+
+    def test_drop_on_empty_stack(self):
+        """Dropping from an empty stack keeps the EmptyStackError semantics."""
+        with pytest.raises(EmptyStackError, match="token 0"):
+            compile_program("drop").run([])
+
+    def test_runtime_errors(self):
+        """Value-dependent errors are still raised at run time."""
+        with pytest.raises(DivisionByZeroError):
+            compile_program("1 0 /").run([])
+        with pytest.raises(InvalidOperationError):
+            compile_program("-4 sqrt").run([])
+        with pytest.raises(InvalidOperationError):
+            compile_program("10 1000 ^").run([])
+
+    def test_unknown_token_fails_at_compile_time(self):
+        """Unknown tokens should be rejected by the compiler."""
+        with pytest.raises(InvalidTokenError, match="token 1"):
+            compile_program("1 nope")
+
+    def test_non_finite_literals_fail_in_float_mode(self):
+        """inf, nan and literals overflowing a float are not float numbers."""
+        for program in ("inf", "1 nan", "1e400", [1, 10**400]):
+            compiled = compile_program(program)
+            with pytest.raises(InvalidTokenError, match="finite"):
+                RPNCalculator().run(compiled)
+
+    def test_literals_are_parsed_by_the_backend(self):
+        """Literals only some backends accept should be checked when run."""
+        program = compile_program("1/3 1e400 +")
+        with pytest.raises(InvalidTokenError, match="token 0"):
+            RPNCalculator().run(program)
+        calc = create_calculator(get_backend("fraction"))
+        calc.run(program)
+        assert calc.stack == [Fraction(1, 3) + 10**400]
+
+    def test_calculator_run_is_atomic(self):
+        """RPNCalculator.run should roll back on error."""
+        calc = RPNCalculator()
+        calc.push(3)
+        with pytest.raises(DivisionByZeroError):
+            calc.run(compile_program("2 * 0 /"))
+        assert calc.stack == [3.0]
+
+
+class TestProgramCache:
+    """Test the LRU program cache."""
+
+    def test_hits_and_misses(self):
+        """Repeated programs should be served from the cache."""
+        cache = ProgramCache(maxsize=4)
+        first = cache.get("1 2 +")
+        second = cache.get("1 2 +")
+        assert first is second
+        assert isinstance(first, CompiledProgram)
+        assert cache.stats() == {"size": 1, "maxsize": 4, "hits": 1, "misses": 1}
+
+    def test_token_lists_are_keyed_by_token(self):
+        """Token lists are keyed by their tokens, not by their joined text."""
+        cache = ProgramCache()
+        assert cache.get(["1", "2", "+"]) is cache.get(("1", "2", "+"))
+        assert cache.get("1 2 add").tokens == ["1", "2", "add"]
+        with pytest.raises(InvalidTokenError):
+            cache.get(["1 2", "add"])
+
+    def test_lru_eviction(self):
+        """The least recently used program should be evicted first."""
+        cache = ProgramCache(maxsize=2)
+        a = cache.get("1")
+        cache.get("2")
+        cache.get("1")
+        cache.get("3")
+        assert cache.get("1") is a
+        assert cache.stats()["size"] == 2
+        assert cache.stats()["misses"] == 3
+
+    def test_zero_size_disables_caching(self):
+        """A zero-sized cache compiles every time."""
+        cache = ProgramCache(maxsize=0)
+        assert cache.get("1") is not cache.get("1")
+        assert cache.stats()["size"] == 0
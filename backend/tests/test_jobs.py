@@ -0,0 +1,175 @@
+"""
+Unit tests for batch jobs evaluated in a process pool, their API and CLI.
+"""
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import API_PREFIX
+from app.main import app
+from app.services.jobs import JobQueueFullError, JobRunner, get_job_runner, main, run_tasks
+
+TASKS = [("1 2 +", []), ("+ 2 *", [5, 6]), ("1 0 /", []), ("3 sqrt", [])]
+
+
+@pytest.fixture(scope="module")
+def runner():
+    """A two-worker pool shared by the tests of this module."""
+    runner = JobRunner(workers=2, keep=3)
+    app.dependency_overrides[get_job_runner] = lambda: runner
+    yield runner
+    app.dependency_overrides.pop(get_job_runner, None)
+    runner.shutdown()
+
+
+def _wait(job, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not job.done:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+
+
+class TestRunTasks:
+    """Test the work done by one worker chunk."""
+
+    def test_results_in_order(self):
+        """Each task runs on its own stack; errors are reported per task."""
+        results = run_tasks(TASKS)
+        assert results[0] == ([3.0], None)
+        assert results[1] == ([22.0], None)
+        assert results[2][0] is None
+        assert "divide by zero" in results[2][1]
+        assert results[3][0] == [pytest.approx(3 ** 0.5)]
+
+    def test_numeric_mode(self):
+        """Tasks are evaluated and exported in the requested mode."""
+        assert run_tasks([("1 3 /", [])], "fraction") == [(["1/3"], None)]
+        assert run_tasks([("1", ["x"])], "integer")[0][0] is None
+
+
+class TestJobRunner:
+    """Test jobs running in worker processes."""
+
+    def test_chunks_keep_task_order(self, runner):
+        """Results land in task order whatever the chunking."""
+        tasks = [(f"{i} 2 *", []) for i in range(50)]
+        job = runner.submit(tasks, chunk_size=7)
+        ordered = [result for _, chunk in job.chunks() for result in chunk]
+        assert ordered == [([2.0 * i], None) for i in range(50)]
+        _wait(job)
+        assert job.status()["completed"] == 50
+        assert job.snapshot()["results"][49] == {"stack": [98.0]}
+
+    def test_completed_chunks(self, runner):
+        """completed_chunks yields every chunk once, in any order."""
+        job = runner.submit(TASKS, chunk_size=1)
+
+        async def collect():
+            return [item async for item in job.completed_chunks()]
+
+        chunks = asyncio.run(collect())
+        assert sorted(start for start, _ in chunks) == [0, 1, 2, 3]
+        _wait(job)
+        assert job.status()["failed"] == 1
+
+    def test_default_chunk_size(self):
+        """Tasks are split into a few chunks per worker, bounded in size."""
+        runner = JobRunner(workers=8)
+        assert runner.chunk_size(10) == 1
+        assert runner.chunk_size(3_200) == 100
+        assert runner.chunk_size(10_000_000) == 1_000
+
+    def test_unknown_mode(self, runner):
+        """Invalid numeric modes are rejected before anything is submitted."""
+        with pytest.raises(ValueError):
+            runner.submit(TASKS, "complex")
+
+    def test_finished_jobs_are_pruned(self, runner):
+        """Only the most recent jobs are kept once finished."""
+        jobs = [runner.submit(TASKS) for _ in range(5)]
+        for job in jobs:
+            _wait(job)
+        runner.submit(TASKS)
+        assert runner.get(jobs[0].id) is None
+        assert runner.get(jobs[-1].id) is not None
+
+
+    def test_pending_jobs_are_capped(self, monkeypatch):
+        """Jobs beyond max_pending are refused (503 from the API) until one finishes."""
+        runner = JobRunner(workers=1, max_pending=1)
+        monkeypatch.setitem(app.dependency_overrides, get_job_runner, lambda: runner)
+        try:
+            job = runner.submit(TASKS)  # the fresh pool is still starting
+            with pytest.raises(JobQueueFullError):
+                runner.submit(TASKS)
+            client = TestClient(app)
+            response = client.post(f"{API_PREFIX}/jobs", json={"tasks": [{"program": "1"}]})
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "1"
+            _wait(job)
+            assert runner.submit(TASKS) is not None
+        finally:
+            runner.shutdown()
+
+
+class TestJobEndpoints:
+    """Test the /jobs API."""
+
+    def test_submit_poll_and_results(self, runner):
+        """POST /jobs returns 202 and an id to poll for ordered results."""
+        client = TestClient(app)
+        body = {"tasks": [{"program": p, "stack": s} for p, s in TASKS], "chunk_size": 2}
+        response = client.post(f"{API_PREFIX}/jobs", json=body)
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        _wait(runner.get(job_id))
+        status = client.get(f"{API_PREFIX}/jobs/{job_id}").json()
+        assert status == {"id": job_id, "status": "done", "total": 4, "completed": 4, "failed": 1}
+        results = client.get(f"{API_PREFIX}/jobs/{job_id}/results").json()["results"]
+        assert results[1] == {"stack": [22.0]}
+        assert "error" in results[2]
+
+    def test_stream(self, runner):
+        """GET /jobs/{id}/stream sends one line per task as chunks complete."""
+        client = TestClient(app)
+        body = {
+            "tasks": [{"program": p, "stack": s} for p, s in TASKS],
+            "numeric": {"mode": "fraction"},
+        }
+        job_id = client.post(f"{API_PREFIX}/jobs", json=body).json()["id"]
+        response = client.get(f"{API_PREFIX}/jobs/{job_id}/stream")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+        assert {"index": 0, "stack": ["3"]} in lines
+
+    def test_unknown_and_cancelled_jobs(self, runner):
+        """Unknown ids are 404; a cancelled job is forgotten."""
+        client = TestClient(app)
+        assert client.get(f"{API_PREFIX}/jobs/nope").status_code == 404
+        job_id = client.post(f"{API_PREFIX}/jobs", json={"tasks": [{"program": "1"}]}).json()["id"]
+        assert client.delete(f"{API_PREFIX}/jobs/{job_id}").status_code == 200
+        assert client.get(f"{API_PREFIX}/jobs/{job_id}").status_code == 404
+        assert client.post(f"{API_PREFIX}/jobs", json={"tasks": []}).status_code == 422
+
+
+class TestCommandLine:
+    """Test python -m app.services.jobs run."""
+
+    def test_run(self, tmp_path, capsys):
+        """Results are written as JSON lines in task order; failures set the exit status."""
+        tasks = tmp_path / "tasks.jsonl"
+        tasks.write_text('"1 2 +"\n\n{"program": "+", "stack": [1, 2]}\n{"program": "1 0 /"}\n')
+        output = tmp_path / "results.jsonl"
+        assert main(["run", str(tasks), "-o", str(output), "--workers", "1"]) == 1
+        lines = [json.loads(line) for line in output.read_text().splitlines()]
+        assert lines[:2] == [{"index": 0, "stack": [3.0]}, {"index": 1, "stack": [3.0]}]
+        assert "error" in lines[2]
+        assert "3 tasks, 1 failed" in capsys.readouterr().err
+
+    def test_bad_input(self, tmp_path, capsys):
+        """Malformed task files exit with status 2."""
+        tasks = tmp_path / "tasks.jsonl"
+        tasks.write_text("{not json\n")
+        assert main(["run", str(tasks)]) == 2
+        assert "line 1" in capsys.readouterr().err
@@ -0,0 +1,378 @@
+"""
+Unit tests for the session journal and the journal-backed session store.
+"""
+import asyncio
+import os
+import pytest
+import stat
+import threading
+import time
+from app.services.journal import (
+    KIND_EXACT,
+    KIND_OP,
+    KIND_RESTORE,
+    KIND_UNDO,
+    SHARDS,
+    JournalSessionStore,
+    SessionJournal,
+    encode_record,
+    iter_records,
+)
+from app.services.stack_service import StackService
+
+
+def _store(path, **kwargs):
+    return JournalSessionStore(StackService, str(path), **kwargs)
+
+
+def _mutate(store, session_id, operation, value=None):
+    service = store.load(session_id)
+    service.perform(operation, value)
+    store.save(service)
+    return service
+
+
+class TestRecords:
+    """Test the binary record format."""
+
+    def test_round_trip(self):
+        """Records should decode to what was encoded, 8-byte aligned."""
+        data = b"".join(
+            [
+                encode_record(KIND_OP, "push(2.5)", 1, 0, [2.5]),
+                encode_record(KIND_OP, "add", 2, 2, [4.0]),
+                encode_record(KIND_OP, "custom_op", 3, 1, [1.0, 2.0]),
+                encode_record(KIND_UNDO, "undo", 4),
+                encode_record(KIND_RESTORE, "restore(1)", 5, 1),
+            ]
+        )
+        records = [record for record, _ in iter_records(data)]
+        assert [r.operation for r in records] == ["push(2.5)", "add", "custom_op", "", ""]
+        assert records[1].arg == 2 and records[1].values == (4.0,)
+        assert records[2].values == (1.0, 2.0)
+        assert [r.sequence for r in records] == [1, 2, 3, 4, 5]
+        assert records[4].kind == KIND_RESTORE and records[4].arg == 1
+        assert len(data) % 8 == 0
+
+    def test_exact_values_round_trip_as_text(self):
+        """Exact-mode records should keep their formatted values, 8-byte aligned."""
+        data = b"".join(
+            [
+                encode_record(KIND_EXACT, "push(1/3)", 1, 0, ["1/3"]),
+                encode_record(KIND_EXACT, "add", 2, 2, ["12345678901234567890.5", "-2"]),
+                encode_record(KIND_EXACT, "drop", 3, 1, []),
+            ]
+        )
+        records = [record for record, _ in iter_records(data)]
+        assert [r.operation for r in records] == ["push(1/3)", "add", "drop"]
+        assert records[0].values == ("1/3",)
+        assert records[1].values == ("12345678901234567890.5", "-2")
+        assert records[2].values == ()
+        assert len(data) % 8 == 0
+
+    def test_stops_at_torn_or_corrupt_record(self):
+        """Decoding should stop at the first incomplete or damaged record."""
+        first = encode_record(KIND_OP, "add", 1, 2, [3.0])
+        second = bytearray(encode_record(KIND_OP, "add", 2, 2, [4.0]))
+        assert len(list(iter_records(first + bytes(second[:-3])))) == 1
+        second[-1] ^= 0xFF
+        assert len(list(iter_records(first + bytes(second)))) == 1
+
+
+class TestJournalSessionStore:
+    """Test durability, replay and compaction."""
+
+    def test_sessions_survive_restart(self, tmp_path):
+        """A new store over the same directory should replay every session."""
+        store = _store(tmp_path)
+        for value in (3, 4):
+            _mutate(store, "a", "push", float(value))
+        _mutate(store, "a", "multiply")
+        _mutate(store, "b", "push", 1.0)
+        store.close()
+
+        restored = _store(tmp_path)
+        state = restored.load("a").get_state()
+        assert state["stack"] == [12.0]
+        assert state["operation_count"] == 3
+        assert state["last_operation"] == "multiply"
+        assert restored.load("b").calculator.stack == [1.0]
+
+    def test_history_survives_restart(self, tmp_path):
+        """Undo, redo and restore should be journaled and replayable."""
+        store = _store(tmp_path)
+        for value in (1, 2, 3):
+            _mutate(store, "s", "push", float(value))
+        _mutate(store, "s", "undo")
+        _mutate(store, "s", "redo")
+        _mutate(store, "s", "undo")
+        service = store.load("s")
+        service.jump(1)
+        store.save(service)
+
+        restored = _store(tmp_path).load("s")
+        assert restored.calculator.stack == [1.0]
+        assert restored.get_state()["version"] == 1
+        restored.perform("redo")
+        assert restored.calculator.stack == [1.0, 2.0]
+        restored.perform("redo")
+        assert restored.calculator.stack == [1.0, 2.0, 3.0]
+
+    def test_log_holds_one_record_per_operation(self, tmp_path):
+        """Single-step saves should append records, not rewrite snapshots."""
+        store = _store(tmp_path)
+        for value in range(5):
+            _mutate(store, "s", "push", float(value))
+        _, log = store.journal.paths("s")
+        records = [record for record, _ in iter_records(log.read_bytes())]
+        assert [r.sequence for r in records] == [2, 3, 4, 5]
+
+    def test_exact_sessions_are_journaled(self, tmp_path):
+        """Exact-mode operations should append records and replay exactly."""
+        store = _store(tmp_path)
+        service = store.load("s")
+        service.set_numeric("fraction")
+        store.save(service)
+        for operation, value in (("push", "1/3"), ("push", "1/6"), ("add", None)):
+            _mutate(store, "s", operation, value)
+        _, log = store.journal.paths("s")
+        records = [record for record, _ in iter_records(log.read_bytes())]
+        assert [r.kind for r in records] == [KIND_EXACT] * 3
+        restored = _store(tmp_path).load("s")
+        assert restored.values() == ["1/2"]
+        restored.perform("undo")
+        assert restored.values() == ["1/3", "1/6"]
+
+    def test_unsaved_changes_are_snapshotted(self, tmp_path):
+        """Several changes between saves should be persisted as a snapshot."""
+        store = _store(tmp_path)
+        service = store.load("s")
+        for value in (1.0, 2.0, 3.0):
+            service.perform("push", value)
+        store.save(service)
+        assert _store(tmp_path).load("s").calculator.stack == [1.0, 2.0, 3.0]
+
+    def test_compaction_truncates_the_log(self, tmp_path):
+        """Every compact_every records the log should be folded into the snapshot."""
+        store = _store(tmp_path, compact_every=3)
+        for value in range(8):
+            _mutate(store, "s", "push", float(value))
+        _, log = store.journal.paths("s")
+        assert len(list(iter_records(log.read_bytes()))) <= 3
+        assert _store(tmp_path).load("s").calculator.stack == [float(v) for v in range(8)]
+
+    def test_torn_tail_is_discarded(self, tmp_path):
+        """A partially written record should be dropped on replay."""
+        store = _store(tmp_path)
+        for value in (1.0, 2.0, 3.0):
+            _mutate(store, "s", "push", value)
+        _, log = store.journal.paths("s")
+        os.truncate(log, log.stat().st_size - 5)
+        restored = _store(tmp_path)
+        assert restored.load("s").calculator.stack == [1.0, 2.0]
+        _mutate(restored, "s", "push", 9.0)
+        assert _store(tmp_path).load("s").calculator.stack == [1.0, 2.0, 9.0]
+
+    def test_delete_and_expiry_remove_files(self, tmp_path):
+        """Ended sessions should not come back after a restart."""
+        now = [0.0]
+        store = _store(tmp_path, ttl=10, clock=lambda: now[0])
+        _mutate(store, "gone", "push", 1.0)
+        _mutate(store, "old", "push", 1.0)
+        assert store.delete("gone") is True
+        now[0] = 20.0
+        assert store.sweep() == 1
+        assert not store.journal.exists("gone")
+        assert not store.journal.exists("old")
+
+    def test_evicted_sessions_are_reloaded_from_disk(self, tmp_path):
+        """Eviction should drop the session from memory only."""
+        store = _store(tmp_path, max_sessions=1)
+        _mutate(store, "a", "push", 1.0)
+        _mutate(store, "b", "push", 2.0)
+        assert store.stats()["evictions"] == 1
+        assert store.load("a").calculator.stack == [1.0]
+
+
+class TestLazyRestore:
+    """Test paging sessions in and out of memory."""
+
+    def test_startup_reads_nothing(self, tmp_path):
+        """Sessions should be faulted in on first access only."""
+        store = _store(tmp_path)
+        for session_id in ("a", "b", "c"):
+            _mutate(store, session_id, "push", 1.0)
+        restored = _store(tmp_path)
+        assert len(restored) == 0
+        restored.load("b")
+        assert len(restored) == 1
+        assert restored.stats()["faults"] == 1
+        restored.load("b")
+        assert restored.stats()["faults"] == 1
+
+    def test_cold_sessions_are_spilled(self, tmp_path):
+        """Evicted sessions should be compacted into their snapshot."""
+        store = _store(tmp_path, max_sessions=1)
+        for value in (1.0, 2.0, 3.0):
+            _mutate(store, "cold", "push", value)
+        _mutate(store, "hot", "push", 9.0)
+        assert store.stats()["spills"] == 1
+        _, log = store.journal.paths("cold")
+        assert log.stat().st_size == 0
+        service = store.load("cold")
+        assert service.calculator.stack == [1.0, 2.0, 3.0]
+        service.perform("undo")
+        assert service.calculator.stack == [1.0, 2.0]
+
+    def test_async_load_of_resident_session(self, tmp_path):
+        """Resident sessions should be served from memory."""
+        store = _store(tmp_path)
+        service = _mutate(store, "s", "push", 1.0)
+        assert asyncio.run(store.aload("s")) is service
+        assert asyncio.run(store.aload("other")).calculator.stack == []
+
+    def test_async_load_does_not_block_the_loop(self, tmp_path):
+        """Waiting for the store lock held by another thread should not stall the loop."""
+        store = _store(tmp_path)
+        _mutate(store, "s", "push", 1.0)
+        held = threading.Event()
+
+        def hold():
+            with store._lock:
+                held.set()
+                time.sleep(0.3)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait()
+
+        async def main():
+            load = asyncio.ensure_future(store.aload("s"))
+            start = time.monotonic()
+            await asyncio.sleep(0.01)
+            assert time.monotonic() - start < 0.2
+            return await load
+
+        assert asyncio.run(main()).calculator.stack == [1.0]
+        thread.join()
+
+    def test_dormant_sessions_expire_on_disk(self, tmp_path):
+        """Sweeps should delete old sessions that are not resident."""
+        writer = _store(tmp_path)
+        _mutate(writer, "dormant", "push", 1.0)
+        _mutate(writer, "fresh", "push", 1.0)
+        for path in writer.journal.paths("dormant"):
+            if path.exists():
+                os.utime(path, (0, 0))
+        store = _store(tmp_path, ttl=60)
+        for _ in range(SHARDS):
+            store.sweep()
+        assert not store.journal.exists("dormant")
+        assert store.journal.exists("fresh")
+        assert store.stats()["expirations"] == 1
+
+    def test_sweep_keeps_sessions_faulted_in_meanwhile(self, tmp_path):
+        """A dormant session loaded after the shard scan should not be deleted."""
+        writer = _store(tmp_path)
+        _mutate(writer, "dormant", "push", 1.0)
+        for path in writer.journal.paths("dormant"):
+            if path.exists():
+                os.utime(path, (0, 0))
+        store = _store(tmp_path, ttl=60)
+        scan = store.journal.dormant
+
+        def dormant(shard, before):
+            for session_id in scan(shard, before):
+                store.load(session_id)  # a request faults it in after the scan
+                yield session_id
+
+        store.journal.dormant = dormant
+        for _ in range(SHARDS):
+            store.sweep()
+        assert store.journal.exists("dormant")
+        assert store.stats()["expirations"] == 0
+        assert _store(tmp_path).load("dormant").calculator.stack == [1.0]
+
+
+class TestFsyncPolicies:
+    """Test when the journal syncs to disk."""
+
+    def test_always_syncs_every_record(self, tmp_path):
+        """The "always" policy should fsync each append."""
+        journal = SessionJournal(str(tmp_path), fsync="always")
+        journal.write_snapshot("s", {})
+        before = journal.syncs
+        for sequence in range(3):
+            journal.append("s", encode_record(KIND_OP, "add", sequence, 2, [1.0]))
+        assert journal.syncs == before + 3
+
+    def test_batch_groups_commits(self, tmp_path):
+        """The "batch" policy should sync once per batch of records."""
+        journal = SessionJournal(str(tmp_path), fsync="batch", batch_size=4)
+        journal.write_snapshot("s", {})
+        for sequence in range(6):
+            journal.append("s", encode_record(KIND_OP, "add", sequence, 2, [1.0]))
+        assert journal.syncs == 1
+        assert journal.flush() == 1
+
+    def test_interval_syncs_when_due(self, tmp_path):
+        """The "interval" policy should sync once the interval has elapsed."""
+        now = [0.0]
+        journal = SessionJournal(
+            str(tmp_path), fsync="interval", interval=1.0, clock=lambda: now[0]
+        )
+        journal.write_snapshot("s", {})
+        journal.append("s", encode_record(KIND_OP, "add", 1, 2, [1.0]))
+        assert journal.syncs == 0
+        now[0] = 1.5
+        journal.append("s", encode_record(KIND_OP, "add", 2, 2, [1.0]))
+        assert journal.syncs == 1
+
+    def test_store_syncs_outside_its_lock(self, tmp_path):
+        """Saves should fsync after releasing the store lock."""
+        store = _store(tmp_path, fsync="always")
+        flush = store.journal.flush
+        locked = []
+
+        def probe():
+            acquired = store._lock.acquire(blocking=False)
+            locked.append(not acquired)
+            if acquired:
+                store._lock.release()
+
+        def checked_flush():
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            return flush()
+
+        store.journal.flush = checked_flush
+        _mutate(store, "s", "push", 1.0)
+        _mutate(store, "s", "push", 2.0)
+        assert locked == [False, False]
+
+    def test_compaction_syncs_rename_before_truncating(self, tmp_path, monkeypatch):
+        """The snapshot's directory entry should reach disk before its log is emptied."""
+        journal = SessionJournal(str(tmp_path))
+        journal.write_snapshot("s", {})
+        journal.append("s", encode_record(KIND_OP, "add", 1, 2, [1.0]))
+        events = []
+        fsync, truncate = os.fsync, os.truncate
+
+        def recording_fsync(fd):
+            events.append("fsync dir" if stat.S_ISDIR(os.fstat(fd).st_mode) else "fsync file")
+            fsync(fd)
+
+        def recording_truncate(path, length):
+            events.append("truncate")
+            truncate(path, length)
+
+        monkeypatch.setattr(os, "fsync", recording_fsync)
+        monkeypatch.setattr(os, "truncate", recording_truncate)
+        journal.write_snapshot("s", {})
+        assert events == ["fsync file", "fsync dir", "truncate"]
+
+    def test_unknown_policy(self, tmp_path):
+        """Invalid policies should be rejected."""
+        with pytest.raises(ValueError):
+            SessionJournal(str(tmp_path), fsync="sometimes")
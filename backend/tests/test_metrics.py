@@ -0,0 +1,106 @@
+"""
+Unit tests for the Prometheus metrics aggregation.
+"""
+import shutil
+from fastapi.testclient import TestClient
+from app.core.exceptions import DivisionByZeroError, InsufficientOperandsError
+from app.core.config import API_PREFIX
+from app.main import app
+from app.services.metrics import Metrics, get_metrics
+
+
+def _sample(text, line_start):
+    """Value of the first exposition line starting with ``line_start``."""
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_start} not found")
+
+
+class TestMetrics:
+    """Test in-process recording and rendering."""
+
+    def test_latency_histogram_is_cumulative(self):
+        """Buckets should count observations up to their bound."""
+        metrics = Metrics(["op_add"])
+        metrics.observe_request("op_add", 0.0001, failed=False)
+        metrics.observe_request("op_add", 0.02, failed=True)
+        text = metrics.render()
+        assert _sample(text, 'rpn_request_duration_seconds_bucket{route="op_add",le="0.0005"}') == 1
+        assert _sample(text, 'rpn_request_duration_seconds_bucket{route="op_add",le="0.025"}') == 2
+        assert _sample(text, 'rpn_request_duration_seconds_bucket{route="op_add",le="+Inf"}') == 2
+        assert _sample(text, 'rpn_request_duration_seconds_count{route="op_add"}') == 2
+        assert _sample(text, 'rpn_request_failures_total{route="op_add"}') == 1
+
+    def test_unknown_routes_and_errors_fall_back_to_other(self):
+        """Names outside the layout should be counted under "other"."""
+        metrics = Metrics(["op_add"])
+        metrics.observe_request("nope", 0.1, failed=True)
+        metrics.observe_request(None, 0.1, failed=True)
+        metrics.count_error(KeyError("x"))
+        text = metrics.render()
+        assert _sample(text, 'rpn_request_duration_seconds_count{route="other"}') == 2
+        assert _sample(text, 'rpn_errors_total{type="other"}') == 1
+
+    def test_error_and_depth_counters(self):
+        """Errors are counted per type and depths per bucket."""
+        metrics = Metrics([])
+        metrics.count_error(DivisionByZeroError("x"))
+        metrics.count_error(InsufficientOperandsError("x"))
+        metrics.count_error(InsufficientOperandsError("x"))
+        metrics.observe_depth(0)
+        metrics.observe_depth(3)
+        text = metrics.render({"rpn_live_sessions": 4})
+        assert _sample(text, 'rpn_errors_total{type="InsufficientOperandsError"}') == 2
+        assert _sample(text, 'rpn_errors_total{type="DivisionByZeroError"}') == 1
+        assert _sample(text, 'rpn_stack_depth_bucket{le="0"}') == 1
+        assert _sample(text, 'rpn_stack_depth_bucket{le="4"}') == 2
+        assert _sample(text, "rpn_stack_depth_sum") == 3
+        assert _sample(text, "rpn_live_sessions") == 4
+
+
+class TestMultiprocessMetrics:
+    """Test the file-backed mode used by multi-worker deployments."""
+
+    def test_worker_files_are_summed(self, tmp_path):
+        """Scrapes should add up the files of every worker."""
+        metrics = Metrics(["op_add"], directory=str(tmp_path))
+        metrics.observe_request("op_add", 0.001, failed=False)
+        (worker,) = tmp_path.glob("rpn-metrics-*.db")
+        shutil.copy(worker, tmp_path / "rpn-metrics-999999.db")
+        metrics.observe_request("op_add", 0.001, failed=False)
+        text = metrics.render()
+        assert _sample(text, 'rpn_request_duration_seconds_count{route="op_add"}') == 3
+
+    def test_files_with_another_layout_are_ignored(self, tmp_path):
+        """Workers running a different route table should not be mixed in."""
+        other = Metrics(["op_sub"], directory=str(tmp_path / "a"))
+        other.observe_request("op_sub", 0.001, failed=False)
+        (worker,) = (tmp_path / "a").glob("rpn-metrics-*.db")
+        metrics = Metrics(["op_add"], directory=str(tmp_path / "b"))
+        shutil.copy(worker, tmp_path / "b" / "rpn-metrics-999999.db")
+        text = metrics.render()
+        assert _sample(text, 'rpn_request_duration_seconds_count{route="other"}') == 0
+
+
+class TestMetricsEndpoint:
+    """Test the /metrics endpoint wiring."""
+
+    def test_requests_are_recorded(self):
+        """Requests should be timed per route and errors counted per type."""
+        client = TestClient(app)
+        before = get_metrics().render()
+        count = 'rpn_request_duration_seconds_count{route="op_divide"}'
+        errors = 'rpn_errors_total{type="DivisionByZeroError"}'
+        session = {"session_id": "metrics"}
+        client.post(f"{API_PREFIX}/stack", json={"value": 1}, params=session)
+        client.post(f"{API_PREFIX}/stack", json={"value": 0}, params=session)
+        assert client.post(f"{API_PREFIX}/op/div", params=session).status_code == 400
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert _sample(response.text, count) == _sample(before, count) + 1
+        assert _sample(response.text, errors) == _sample(before, errors) + 1
+        assert "rpn_live_sessions" in response.text
+        client.delete(f"{API_PREFIX}/session", params=session)
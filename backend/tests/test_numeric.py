@@ -0,0 +1,260 @@
+"""
+Unit tests for the numeric backends (decimal, fraction and integer modes).
+"""
+import json
+from decimal import Decimal
+from fractions import Fraction
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import API_PREFIX
+from app.core.exceptions import (
+    DivisionByZeroError,
+    InsufficientOperandsError,
+    InvalidOperationError,
+    InvalidTokenError,
+)
+from app.domain.compiler import compile_program
+from app.domain.numeric import FLOAT, MAX_BITS, get_backend
+from app.domain.rpn_calculator import NumericCalculator, RPNCalculator, create_calculator
+from app.main import app
+from app.services.journal import JournalSessionStore
+from app.services.stack_service import StackService
+
+
+def _calculator(mode, precision=None):
+    return create_calculator(get_backend(mode, precision))
+
+
+class TestBackends:
+    """Test parsing and formatting of each backend."""
+
+    def test_float_is_default(self):
+        """The float backend keeps the array-backed calculator."""
+        assert get_backend() is FLOAT
+        assert type(create_calculator()) is RPNCalculator
+
+    def test_decimal_parses_float_repr(self):
+        """Floats enter the decimal backend by their shortest repr."""
+        numeric = get_backend("decimal")
+        assert numeric.parse(0.1) == Decimal("0.1")
+        assert numeric.export([Decimal("0.1")]) == ["0.1"]
+
+    def test_decimal_precision(self):
+        """Decimal values are rounded to the backend's precision."""
+        calc = _calculator("decimal", 5)
+        calc.push(1)
+        calc.push(3)
+        calc.divide()
+        assert calc.stack == [Decimal("0.33333")]
+
+    def test_fraction_parses_ratios(self):
+        """Fraction mode accepts "p/q" strings and decimal literals."""
+        numeric = get_backend("fraction")
+        assert numeric.parse("1/3") == Fraction(1, 3)
+        assert numeric.parse("0.25") == Fraction(1, 4)
+        assert numeric.parse(0.1) == Fraction(1, 10)
+
+    def test_integer_rejects_non_integers(self):
+        """Integer mode only accepts integral values."""
+        numeric = get_backend("integer")
+        assert numeric.parse(3.0) == 3
+        assert numeric.parse("1e3") == 1000
+        with pytest.raises(InvalidTokenError):
+            numeric.parse(2.5)
+
+    @pytest.mark.parametrize("mode", ["decimal", "fraction", "integer"])
+    def test_rejects_invalid_literals(self, mode):
+        """Non-numbers, infinities and huge exponents are rejected on parse."""
+        numeric = get_backend(mode)
+        for value in ("abc", float("inf"), "1e100000"):
+            with pytest.raises(InvalidTokenError):
+                numeric.parse(value)
+
+    def test_unknown_mode(self):
+        """Unknown modes and out-of-range precisions raise ValueError."""
+        with pytest.raises(ValueError):
+            get_backend("complex")
+        with pytest.raises(ValueError):
+            get_backend("decimal", 0)
+
+
+class TestNumericCalculator:
+    """Test calculator operations in the exact modes."""
+
+    def test_decimal_is_exact(self):
+        """0.1 + 0.2 is exactly 0.3 in decimal mode."""
+        calc = _calculator("decimal")
+        calc.push(0.1)
+        calc.push(0.2)
+        assert calc.add() == Decimal("0.3")
+
+    def test_fraction_arithmetic(self):
+        """Fraction mode keeps exact ratios."""
+        calc = _calculator("fraction")
+        calc.push(1)
+        calc.push(3)
+        calc.divide()
+        calc.push(3)
+        assert calc.multiply() == 1
+
+    def test_integer_arithmetic(self):
+        """Integer mode has unbounded ints, floor division and integer sqrt."""
+        calc = _calculator("integer")
+        calc.push(2)
+        calc.push(100)
+        assert calc.power() == 2 ** 100
+        calc.load([7, 2])
+        assert calc.divide() == 3
+        calc.push(17)
+        assert calc.sqrt() == 4
+
+    def test_fraction_sqrt_must_be_exact(self):
+        """Fraction sqrt works on rational squares only."""
+        calc = _calculator("fraction")
+        calc.push("4/9")
+        assert calc.sqrt() == Fraction(2, 3)
+        calc.push(2)
+        with pytest.raises(InvalidOperationError):
+            calc.sqrt()
+        assert calc.stack[-1] == 2
+
+    @pytest.mark.parametrize("mode", ["decimal", "fraction", "integer"])
+    def test_errors_leave_stack_unchanged(self, mode):
+        """Failed operations leave the stack as it was."""
+        calc = _calculator(mode)
+        calc.push(1)
+        calc.push(0)
+        with pytest.raises(DivisionByZeroError):
+            calc.divide()
+        calc.push(-1)
+        with pytest.raises(InvalidOperationError):
+            calc.sqrt()
+        assert calc.size() == 3
+        with pytest.raises(InsufficientOperandsError):
+            _calculator(mode).add()
+
+    @pytest.mark.parametrize("mode", ["fraction", "integer"])
+    def test_results_are_bounded(self, mode):
+        """Powers and products past MAX_BITS raise instead of growing without bound."""
+        calc = _calculator(mode)
+        calc.push(2)
+        calc.push(MAX_BITS * 10)
+        with pytest.raises(InvalidOperationError):
+            calc.power()
+        assert calc.size() == 2
+
+    def test_extend_parses_every_value(self):
+        """Bulk pushes parse with the backend and push nothing on error."""
+        calc = _calculator("fraction")
+        assert calc.extend(["1/3", 0.5, 2]) == 3
+        assert calc.stack == [Fraction(1, 3), Fraction(1, 2), 2]
+        with pytest.raises(InvalidTokenError):
+            calc.extend([1, "x"])
+        assert calc.size() == 3
+
+    def test_compiled_program(self):
+        """Compiled programs run with the backend's handlers and literals."""
+        program = compile_program("0.1 0.2 + 3 *")
+        calc = _calculator("fraction")
+        calc.run(program)
+        assert calc.stack == [Fraction(9, 10)]
+        float_calc = RPNCalculator()
+        float_calc.run(program)
+        assert float_calc.stack[0] == pytest.approx(0.9)
+
+    def test_execute_tokens(self):
+        """execute parses literals with the backend."""
+        calc = _calculator("decimal")
+        for token in ["0.1", "0.2", "+"]:
+            calc.execute(token)
+        assert calc.stack == [Decimal("0.3")]
+        assert isinstance(calc, NumericCalculator)
+
+
+class TestServiceNumericMode:
+    """Test switching and persisting a session's numeric mode."""
+
+    def test_set_numeric_converts_stack(self):
+        """Switching mode converts the stack and restarts history."""
+        service = StackService("s")
+        service.perform("push", 0.5)
+        service.set_numeric("fraction")
+        assert service.values() == ["1/2"]
+        assert service.last_delta()["pushed"] == ["1/2"]
+        assert service.get_state()["history_size"] == 0
+        with pytest.raises(InvalidTokenError):
+            service.set_numeric("integer")
+        assert service.numeric.name == "fraction"
+
+    def test_state_round_trip(self):
+        """to_state/from_state keep the mode and exact values through JSON."""
+        service = StackService("s")
+        service.set_numeric("decimal", 40)
+        service.perform("push", "1")
+        service.perform("push", "3")
+        service.perform("divide")
+        state = json.loads(json.dumps(service.to_state()))
+        restored = StackService.from_state("s", state)
+        assert restored.numeric.key == "decimal:40"
+        assert restored.values() == service.values()
+        restored.perform("undo")
+        assert restored.values() == ["1", "3"]
+
+    def test_journal_snapshots_exact_sessions(self, tmp_path):
+        """The journal store restores sessions in exact modes."""
+        store = JournalSessionStore(StackService, str(tmp_path))
+        service = store.load("s")
+        service.set_numeric("integer")
+        store.save(service)
+        for operation, value in [("push", 2), ("push", 70), ("power", None)]:
+            service.perform(operation, value)
+            store.save(service)
+        store.close()
+        restored = JournalSessionStore(StackService, str(tmp_path)).load("s")
+        assert restored.values() == [str(2 ** 70)]
+
+    def test_reset_returns_to_float(self):
+        """reset() goes back to float mode."""
+        service = StackService("s")
+        service.set_numeric("fraction")
+        service.reset()
+        assert service.numeric is FLOAT
+
+
+class TestNumericEndpoints:
+    """Test the numeric mode API."""
+
+    client = TestClient(app)
+    params = {"session_id": "numeric"}
+
+    def teardown_method(self):
+        self.client.delete(f"{API_PREFIX}/session", params=self.params)
+
+    def test_switch_and_compute(self):
+        """PUT /session/numeric switches mode; values come back as strings."""
+        response = self.client.put(
+            f"{API_PREFIX}/session/numeric", json={"mode": "fraction"}, params=self.params
+        )
+        assert response.status_code == 200
+        self.client.post(f"{API_PREFIX}/stack", json={"value": "1/3"}, params=self.params)
+        self.client.post(f"{API_PREFIX}/stack", json={"value": 0.5}, params=self.params)
+        response = self.client.post(f"{API_PREFIX}/op/add", params=self.params)
+        assert response.json()["stack"] == ["5/6"]
+        response = self.client.get(f"{API_PREFIX}/session/numeric", params=self.params)
+        assert response.json() == {"mode": "fraction", "precision": None}
+
+    def test_decimal_precision_validation(self):
+        """Out-of-range precisions are rejected."""
+        response = self.client.put(
+            f"{API_PREFIX}/session/numeric",
+            json={"mode": "decimal", "precision": 0},
+            params=self.params,
+        )
+        assert response.status_code == 422
+
+    def test_invalid_push(self):
+        """Unparseable values are a 400, not a server error."""
+        response = self.client.post(
+            f"{API_PREFIX}/stack", json={"value": "abc"}, params=self.params
+        )
+        assert response.status_code == 400
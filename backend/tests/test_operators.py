@@ -0,0 +1,213 @@
+"""
+Unit tests for the operator registry and the extended operator set.
+"""
+import math
+import statistics
+from decimal import Decimal
+from fractions import Fraction
+import pytest
+from app.core.exceptions import (
+    DivisionByZeroError,
+    EmptyStackError,
+    InsufficientOperandsError,
+    InvalidOperationError,
+)
+from app.domain.compiler import compile_program
+from app.domain.numeric import MAX_BITS, get_backend
+from app.domain.operators import NUMPY_MIN_VALUES, OPERATIONS, OPERATORS, resolve
+from app.domain.rpn_calculator import RPNCalculator, create_calculator
+from app.services.stack_service import StackService
+
+
+def _run(program, values=()):
+    calc = RPNCalculator()
+    calc.load(values)
+    calc.evaluate(program)
+    return calc.stack
+
+
+class TestRegistry:
+    """Test operator lookup."""
+
+    def test_aliases_resolve_to_canonical_names(self):
+        """Aliases and symbols map to one operator, case-insensitively."""
+        assert resolve("+") is OPERATORS["add"]
+        assert resolve("POW") is OPERATORS["power"]
+        assert resolve("log10") is OPERATORS["log"]
+        assert resolve("nope") is None
+
+    def test_every_alias_is_unique(self):
+        """No alias is claimed by two operators."""
+        aliases = [alias for op in OPERATORS.values() for alias in (op.name, *op.aliases)]
+        assert len(aliases) == len(set(aliases)) == len(OPERATIONS)
+
+    def test_every_backend_has_every_operator(self):
+        """Each numeric backend has a handler for each registered operator."""
+        for mode in ("float", "decimal", "fraction", "integer"):
+            assert set(get_backend(mode).handlers) == set(OPERATORS)
+
+
+class TestOperators:
+    """Test the float implementations."""
+
+    def test_math_functions(self):
+        """Trigonometric, exponential and logarithmic operators."""
+        assert _run("0 sin 0 cos 1 exp 100 log") == [0.0, 1.0, math.e, 2.0]
+        assert _run("1 atan 4 *")[0] == pytest.approx(math.pi)
+
+    def test_domain_errors(self):
+        """Out-of-domain inputs raise and leave the stack unchanged."""
+        calc = RPNCalculator()
+        for program in ("0 ln", "2 asin", "1000 exp"):
+            with pytest.raises(InvalidOperationError):
+                calc.evaluate(program)
+        assert calc.stack == []
+
+    def test_mod_abs_neg_min_max(self):
+        """Arithmetic helpers; mod takes the sign of the divisor."""
+        assert _run("-7 3 mod 5 neg abs 2 9 min 2 9 max") == [2.0, 5.0, 2.0, 9.0]
+        with pytest.raises(DivisionByZeroError):
+            _run("1 0 %")
+
+    def test_stack_operators(self):
+        """over, rot, pick and roll rearrange like their Forth namesakes."""
+        assert _run("over", [1, 2]) == [1.0, 2.0, 1.0]
+        assert _run("rot", [1, 2, 3]) == [2.0, 3.0, 1.0]
+        assert _run("2 pick", [1, 2, 3]) == [1.0, 2.0, 3.0, 1.0]
+        assert _run("2 roll", [1, 2, 3]) == [2.0, 3.0, 1.0]
+        assert _run("0 roll", [1, 2]) == [1.0, 2.0]
+
+    def test_sum_and_mean_of_n(self):
+        """sum and mean fold the n values below the count."""
+        assert _run("3 sum", [9, 1, 2, 3]) == [9.0, 6.0]
+        assert _run("0 sum") == [0.0]
+        assert _run("4 mean", [1, 2, 3, 4]) == [2.5]
+
+    def test_variadic_errors(self):
+        """Bad counts and short stacks raise and leave the stack unchanged."""
+        calc = RPNCalculator()
+        calc.load([1.0, 2.0])
+        for program in ("5 sum", "-1 pick", "1.5 roll", "0 mean"):
+            with pytest.raises((InsufficientOperandsError, InvalidOperationError)):
+                calc.evaluate(program)
+        assert calc.stack == [1.0, 2.0]
+
+    def test_calculator_apply(self):
+        """apply dispatches any operator and checks fixed arities."""
+        calc = RPNCalculator()
+        with pytest.raises(EmptyStackError):
+            calc.apply("drop")
+        calc.load([1, 2, 3])
+        with pytest.raises(InsufficientOperandsError):
+            calc.apply("sum")
+        assert calc.operands("rot") == 3
+        calc.apply("rot")
+        assert calc.stack == [2.0, 3.0, 1.0]
+
+
+class TestReductions:
+    """Test folding many values in one step."""
+
+    def test_product_stddev_and_depth(self):
+        """product and stddev take a count; depth pushes the stack size."""
+        assert _run("4 product", [1, 2, 3, 4]) == [24.0]
+        assert _run("4 stddev", [2, 4, 4, 5])[0] == pytest.approx(statistics.stdev([2, 4, 4, 5]))
+        assert _run("depth sum", [1, 2, 3]) == [6.0]
+        assert _run("0 product") == [1.0]
+
+    def test_sum_is_compensated(self):
+        """Float sums are correctly rounded however many values are folded."""
+        calc = RPNCalculator()
+        calc.load([0.1] * 1000 + [1e16, 1.0, -1e16])
+        assert calc.reduce("sum") == math.fsum([0.1] * 1000 + [1e16, 1.0, -1e16])
+
+    def test_reduce_whole_stack_or_top(self):
+        """reduce folds the top count values, or the whole stack by default."""
+        calc = RPNCalculator()
+        calc.load([10, 1, 2, 3])
+        assert calc.reduce("mean", 3) == 2.0
+        assert calc.reduce("sum") == 12.0
+        assert calc.stack == [12.0]
+
+    def test_reduce_errors_leave_stack_unchanged(self):
+        """Too few values, bad counts and unknown reductions raise."""
+        calc = RPNCalculator()
+        calc.load([1.0])
+        for name, count in (("stddev", None), ("sum", 2), ("sum", -1), ("dup", None)):
+            with pytest.raises((InsufficientOperandsError, InvalidOperationError)):
+                calc.reduce(name, count)
+        assert calc.stack == [1.0]
+
+    def test_large_reductions(self):
+        """Reductions past NUMPY_MIN_VALUES agree with the pure Python ones."""
+        values = [1.0 + (i % 7) / 100 for i in range(NUMPY_MIN_VALUES)]
+        calc = RPNCalculator()
+        calc.load(values)
+        assert calc.reduce("stddev") == pytest.approx(statistics.stdev(values))
+        calc.load(values[:1000])
+        assert calc.reduce("product") == pytest.approx(math.prod(values[:1000]))
+
+    def test_exact_backends(self):
+        """Exact reductions stay exact; irrational results are rejected."""
+        calc = create_calculator(get_backend("fraction"))
+        calc.load(["1/2", "1/3", "1/6"])
+        assert calc.reduce("product") == Fraction(1, 36)
+        calc.load([1, 3, 5])
+        assert calc.reduce("stddev") == 2
+        calc.load([1, 2])
+        with pytest.raises(InvalidOperationError):
+            calc.reduce("stddev")
+        decimal = create_calculator(get_backend("decimal", 10))
+        decimal.load(["0.1"] * 10)
+        assert decimal.reduce("sum") == Decimal("1.0")
+        integer = create_calculator(get_backend("integer"))
+        integer.load([2] * (MAX_BITS + 1))
+        with pytest.raises(InvalidOperationError):
+            integer.reduce("product")
+        assert integer.size() == MAX_BITS + 1
+
+    def test_service_reduce_is_one_change(self):
+        """A service reduction is logged as one undoable change."""
+        service = StackService("reduce")
+        for value in (1, 2, 3, 4):
+            service.perform("push", value)
+        service.reduce("product", 3)
+        assert service.values() == [1.0, 24.0]
+        assert service.last_delta() == {"revision": 5, "popped": 3, "pushed": [24.0], "size": 2}
+        service.perform("undo")
+        assert service.values() == [1.0, 2.0, 3.0, 4.0]
+
+
+class TestDynamicPrograms:
+    """Test compiling programs whose depth is only known at run time."""
+
+    def test_static_check_stops_at_variadic_operator(self):
+        """Operators after a variadic one are checked as they run."""
+        program = compile_program("1 2 2 sum + drop")
+        assert program.dynamic
+        assert program.required == 0
+        calc = RPNCalculator()
+        with pytest.raises(InsufficientOperandsError, match="token 4"):
+            calc.run(program)
+        assert calc.stack == []
+
+    def test_service_logs_whole_stack(self):
+        """An eval with variadic operators can be undone exactly."""
+        service = StackService("ops")
+        for value in (1, 2, 3):
+            service.perform("push", value)
+        service.evaluate(compile_program("3 sum 2 *"))
+        assert service.values() == [12.0]
+        service.perform("undo")
+        assert service.values() == [1.0, 2.0, 3.0]
+
+    def test_exact_backends(self):
+        """Exact backends support the exact operators and reject the others."""
+        calc = create_calculator(get_backend("fraction"))
+        calc.evaluate("1 3 / 1 6 / 2 sum -7 2 %")
+        assert calc.numeric.export(calc.stack) == ["1/2", "1"]
+        with pytest.raises(InvalidOperationError, match="not available"):
+            calc.evaluate("sin")
+        decimal = create_calculator(get_backend("decimal", 10))
+        decimal.evaluate("100 log 5 neg abs")
+        assert decimal.numeric.export(decimal.stack) == ["2", "5"]
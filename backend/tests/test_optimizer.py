@@ -0,0 +1,109 @@
+"""
+Unit tests for the program optimizer.
+"""
+import random
+from fractions import Fraction
+import pytest
+from app.core.exceptions import DivisionByZeroError, RPNCalculatorError
+from app.domain.compiler import compile_program
+from app.domain.numeric import FLOAT, get_backend
+from app.domain.rpn_calculator import RPNCalculator
+
+_TOKENS = (
+    "1 2 3 0 -1 0.5 dup swap over drop rot + - * / sqrt ^ neg depth % max".split()
+)
+
+
+def _optimized(source, numeric=FLOAT):
+    """The optimized code as operator names and literals."""
+    code, _ = compile_program(source).optimized_for(numeric)
+    names = {handler: name for name, handler in numeric.handlers.items()}
+    listing = []
+    for handler, arg in code:
+        if handler in names:
+            listing.append(names[handler])
+        elif isinstance(arg, tuple):  # checked at run time
+            listing.append(arg[1].name)
+        else:
+            listing.append(arg)
+    return listing
+
+
+def _outcome(program, stack, numeric):
+    stack = list(stack)
+    try:
+        program.run(stack, numeric=numeric)
+    except RPNCalculatorError as e:
+        return stack, type(e), str(e)
+    return stack, None, None
+
+
+class TestOptimizer:
+    """Test constant folding and reuse of computed values."""
+
+    def test_constant_folding(self):
+        """Operators applied to literals only are evaluated once."""
+        assert _optimized("2 3 +") == [5.0]
+        assert _optimized("3 dup * 1 +") == [10.0]
+        assert _optimized("1 2 + 3 * 4 - 2 / sqrt drop") == []
+        assert _optimized("2 * 3 4 +") == [2.0, "multiply", 7.0]
+
+    def test_exact_backends_fold_exactly(self):
+        """Folding uses the backend's own values and operators."""
+        assert _optimized("1 3 /", get_backend("fraction")) == [Fraction(1, 3)]
+        assert _optimized("7 2 /", get_backend("integer")) == [3]
+
+    def test_failing_operators_are_kept(self):
+        """An operator that fails is left to fail at run time, from its own token."""
+        assert _optimized("1 0 / 2 3 +") == [1.0, 0.0, "divide", 5.0]
+        program = compile_program("2 3 + 1 0 /")
+        for _ in range(2):
+            with pytest.raises(DivisionByZeroError, match="token 5: '/'"):
+                program.run([])
+
+    def test_recomputed_values_are_reused(self):
+        """A value computed again while still on the stack is copied instead."""
+        assert _optimized("dup 2 * 1 + over 2 * 1 + *") == [
+            "dup", 2.0, "multiply", 1.0, "add", "dup", "multiply",
+        ]
+        assert _optimized("dup sqrt over sqrt +") == ["dup", "sqrt", "dup", "add"]
+
+    def test_cancelling_shuffles_are_removed(self):
+        """swap swap and dup drop do nothing."""
+        assert _optimized("swap swap dup drop +") == ["add"]
+        assert _optimized("dup swap swap drop") == []
+
+    def test_run_time_depth_is_respected(self):
+        """Shuffles past a variadic operator and depth are left alone."""
+        assert _optimized("2 sum swap swap") == [2.0, "sum", "swap", "swap"]
+        assert _optimized("depth depth +") == ["depth", "depth", "add"]
+
+    def test_runs_after_the_first_are_optimized(self):
+        """The first run and traced runs execute the program as written."""
+        program = compile_program("dup 2 3 + *")
+        calc = RPNCalculator()
+        calc.push(2)
+        assert len(calc.run(program, trace=True)) == 5
+        calc.run(program)
+        calc.run(program)
+        assert calc.stack == [2.0, 10.0, 50.0, 250.0]
+        assert len(program.optimized_for(FLOAT)[0]) == 3
+        assert compile_program("2 3 +", optimize=False).run([], trace=True) == [
+            [2.0], [2.0, 3.0], [5.0],
+        ]
+
+    @pytest.mark.parametrize("mode", ["float", "fraction", "integer"])
+    def test_random_programs_behave_the_same(self, mode):
+        """Optimized code leaves the same stack, or raises the same error from the same state."""
+        numeric = get_backend(mode)
+        rng = random.Random(24)
+        inputs = numeric.convert([2, 3, 5])
+        for _ in range(500):
+            tokens = [rng.choice(_TOKENS) for _ in range(rng.randint(1, 16))]
+            if mode == "integer":
+                tokens = [token for token in tokens if token != "0.5"]
+            source = " ".join(tokens)
+            program = compile_program(source)
+            expected = _outcome(compile_program(source, optimize=False), inputs, numeric)
+            program.optimized_for(numeric)
+            assert _outcome(program, inputs, numeric) == expected, source
@@ -0,0 +1,47 @@
+"""
+Unit tests for the persistent (structurally shared) stack.
+"""
+from array import array
+from app.domain.persistent_stack import PersistentStack
+
+
+class TestPersistentStack:
+    """Test immutable stack versions."""
+
+    def test_from_values_and_to_list(self):
+        """Values round-trip bottom first."""
+        stack = PersistentStack.from_values([1.0, 2.0, 3.0])
+        assert len(stack) == 3
+        assert stack.to_list() == [1.0, 2.0, 3.0]
+        assert list(stack) == [3.0, 2.0, 1.0]
+
+    def test_replace_top_leaves_original_untouched(self):
+        """Deriving a version never mutates the previous one."""
+        base = PersistentStack.from_values([1.0, 2.0, 3.0])
+        derived = base.replace_top(2, [5.0])
+        assert derived.to_list() == [1.0, 5.0]
+        assert base.to_list() == [1.0, 2.0, 3.0]
+
+    def test_top(self):
+        """Top returns the requested values bottom first."""
+        stack = PersistentStack.from_values([1.0, 2.0, 3.0])
+        assert stack.top(2) == (2.0, 3.0)
+        assert stack.top(0) == ()
+        assert stack.top(10) == (1.0, 2.0, 3.0)
+
+    def test_replace_everything(self):
+        """Replacing more values than the stack holds empties it first."""
+        stack = PersistentStack.from_values([1.0, 2.0])
+        assert stack.replace_top(5, [7.0]).to_list() == [7.0]
+        assert len(stack.replace_top(2, [])) == 0
+
+    def test_segments_are_shared(self):
+        """Each change adds one segment; dropping part of a segment shares it."""
+        values = array("d", [1.0, 2.0, 3.0])
+        stack = PersistentStack.from_values(values).replace_top(0, [4.0])
+        assert stack.nodes == 2
+        derived = stack.replace_top(2, [5.0, 6.0])
+        assert derived.to_list() == [1.0, 2.0, 5.0, 6.0]
+        assert derived.top(3) == (2.0, 5.0, 6.0)
+        assert derived._node[2][0] is values
+        assert stack.to_list() == [1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,151 @@
+"""
+Unit tests for request profiling and the admin profile endpoints.
+"""
+import marshal
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import admin, routes
+from app.core.config import API_PREFIX
+from app.services.profiling import (
+    ProfileStore,
+    ProfilingMiddleware,
+    get_profile_store,
+    phase,
+    server_timing,
+)
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def profiled_client(monkeypatch):
+    """App with profiling enabled for the "secret" token."""
+    monkeypatch.setattr(admin, "PROFILE_TOKEN", "secret")
+    store = get_profile_store()
+    store.clear()
+    app = FastAPI()
+    app.include_router(routes.router, prefix=API_PREFIX)
+    app.include_router(admin.router, prefix=f"{API_PREFIX}/admin")
+    app.add_middleware(ProfilingMiddleware, store=store, token="secret")
+    yield TestClient(app)
+    store.clear()
+
+
+class TestPhases:
+    """Test phase timing helpers."""
+
+    def test_phase_is_inert_outside_profiled_requests(self):
+        """Without an active profile, phases should record nothing."""
+        with phase("op") as p:
+            pass
+        assert p.phases is None
+
+    def test_server_timing_header(self):
+        """Durations should be reported in milliseconds."""
+        assert server_timing({"op": 0.0015}, 0.002) == "op;dur=1.500, total;dur=2.000"
+
+
+class TestProfileStore:
+    """Test the bounded profile store."""
+
+    def test_oldest_profiles_are_dropped(self):
+        """Only the most recent profiles should be kept, newest first."""
+        store = ProfileStore(maxsize=2)
+        for i in range(3):
+            store.add(str(i), {"path": "/"}, None)
+        assert [info["id"] for info in store.list()] == ["2", "1"]
+        assert store.get("0") is None
+
+
+class TestProfilingMiddleware:
+    """Test opt-in profiling end to end."""
+
+    def test_unprofiled_requests_have_no_timing(self, profiled_client):
+        """Requests without the token should pass through untouched."""
+        response = profiled_client.get(f"{API_PREFIX}/stack")
+        assert "server-timing" not in response.headers
+        assert get_profile_store().list() == []
+
+    def test_wrong_token_is_ignored(self, profiled_client):
+        """Only the configured token should trigger profiling."""
+        response = profiled_client.get(f"{API_PREFIX}/stack", headers={"X-Profile": "nope"})
+        assert "server-timing" not in response.headers
+
+    def test_profiled_request_is_stored(self, profiled_client):
+        """A profiled request should expose its phases and a downloadable profile."""
+        response = profiled_client.post(
+            f"{API_PREFIX}/stack",
+            json={"value": 1},
+            params={"session_id": "profiled"},
+            headers={"X-Profile": "secret"},
+        )
+        assert response.status_code == 201
+        timing = response.headers["server-timing"]
+        for name in ("session_load", "op", "response", "session_save", "total"):
+            assert f"{name};dur=" in timing
+        profile_id = response.headers["x-profile-id"]
+
+        listing = profiled_client.get(f"{API_PREFIX}/admin/profiles", headers=ADMIN).json()
+        assert listing[0]["id"] == profile_id
+        assert listing[0]["status"] == 201
+        assert listing[0]["profiled"] is True
+
+        download = profiled_client.get(
+            f"{API_PREFIX}/admin/profiles/{profile_id}", headers=ADMIN
+        )
+        assert download.headers["content-type"] == "application/octet-stream"
+        assert isinstance(marshal.loads(download.content), dict)
+
+        text = profiled_client.get(
+            f"{API_PREFIX}/admin/profiles/{profile_id}", params={"format": "text"}, headers=ADMIN
+        )
+        assert "function calls" in text.text
+        params = {"format": "text", "sort": "time"}
+        text = profiled_client.get(
+            f"{API_PREFIX}/admin/profiles/{profile_id}", params=params, headers=ADMIN
+        )
+        assert "Ordered by: internal time" in text.text
+        params["sort"] = "bogus"
+        response = profiled_client.get(
+            f"{API_PREFIX}/admin/profiles/{profile_id}", params=params, headers=ADMIN
+        )
+        assert response.status_code == 422
+        profiled_client.delete(f"{API_PREFIX}/session", params={"session_id": "profiled"})
+
+    def test_sampling(self):
+        """Sampled requests should be profiled without the header."""
+        store = ProfileStore()
+        app = FastAPI()
+
+        @app.get("/ping")
+        def ping():
+            return {}
+
+        app.add_middleware(ProfilingMiddleware, store=store, sample_rate=0.5, random_fn=lambda: 0.1)
+        assert "server-timing" in TestClient(app).get("/ping").headers
+        assert len(store.list()) == 1
+
+
+class TestAdminAuth:
+    """Test admin endpoint protection."""
+
+    def test_requires_token(self, profiled_client):
+        """Missing or wrong admin tokens should be rejected."""
+        assert profiled_client.get(f"{API_PREFIX}/admin/profiles").status_code == 403
+        response = profiled_client.get(
+            f"{API_PREFIX}/admin/profiles", headers={"X-Admin-Token": "nope"}
+        )
+        assert response.status_code == 403
+
+    def test_disabled_without_configured_token(self, monkeypatch):
+        """With no token configured the admin endpoints should not exist."""
+        monkeypatch.setattr(admin, "PROFILE_TOKEN", "")
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/admin")
+        assert TestClient(app).get("/admin/profiles", headers=ADMIN).status_code == 404
+
+    def test_unknown_profile(self, profiled_client):
+        """Unknown profile ids should return 404."""
+        response = profiled_client.get(f"{API_PREFIX}/admin/profiles/nope", headers=ADMIN)
+        assert response.status_code == 404
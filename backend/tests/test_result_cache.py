@@ -0,0 +1,175 @@
+"""
+Unit tests for the memoized evaluation results and their use by /eval.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import API_PREFIX
+from app.core.exceptions import DivisionByZeroError
+from app.domain.compiler import compile_program
+from app.domain.numeric import FLOAT, get_backend
+from app.main import app
+from app.services.result_cache import ResultCache, current_result_cache
+from app.services.stack_service import StackService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _key(source, inputs, numeric=FLOAT, depth=0):
+    return ResultCache.key(compile_program(source), numeric, inputs, depth)
+
+
+class TestResultCache:
+    """Test keys, bounds and expiry."""
+
+    def test_keys(self):
+        """Programs are keyed by canonical text, inputs by their exact values."""
+        assert _key("2 3 +", []) == _key("2  3 add", [])
+        assert _key("+", [1.0, 2.0]) != _key("+", [2.0, 1.0])
+        assert _key("/", [1.0, 0.0]) != _key("/", [1.0, -0.0])
+        assert _key("+", [1.0, 2.0]) != _key("+", [1.0, 2.0], get_backend("fraction"))
+        decimal = get_backend("decimal")
+        assert _key("dup", decimal.convert(["1.0"]), decimal) != _key(
+            "dup", decimal.convert(["1"]), decimal
+        )
+
+    def test_depth_is_keyed_only_when_read(self):
+        """The stack size is part of the key of programs using depth only."""
+        assert _key("1 +", [1.0], depth=1) == _key("1 +", [1.0], depth=5)
+        assert _key("depth +", [1.0], depth=1) != _key("depth +", [1.0], depth=5)
+
+    def test_lru_and_hit_ratio(self):
+        """The least recently used entry is evicted first; lookups are counted."""
+        cache = ResultCache(maxsize=2)
+        cache.put(_key("1", []), (1.0,))
+        cache.put(_key("2", []), (2.0,))
+        assert cache.get(_key("1", [])) == (1.0,)
+        cache.put(_key("3", []), (3.0,))
+        assert cache.get(_key("2", [])) is None
+        stats = cache.stats()
+        assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1, 1)
+        assert stats["hit_ratio"] == 0.5
+
+    def test_ttl(self):
+        """Entries expire ttl seconds after they were stored."""
+        clock = FakeClock()
+        cache = ResultCache(ttl=10, clock=clock)
+        cache.put(_key("1", []), (1.0,))
+        clock.now = 10
+        assert cache.get(_key("1", [])) == (1.0,)
+        clock.now = 10.5
+        assert cache.get(_key("1", [])) is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.stats()["bytes"] == 0
+
+    def test_memory_bound(self):
+        """Memory is bounded; an entry too large for its share is not stored."""
+        cache = ResultCache(max_bytes=16_000)
+        for i in range(100):
+            cache.put(_key(str(i), []), (float(i),))
+        stats = cache.stats()
+        assert stats["bytes"] <= 16_000
+        assert stats["evictions"] > 0
+        cache.put(_key("sum", [1.0] * 500), (500.0,))
+        assert cache.get(_key("sum", [1.0] * 500)) is None
+
+    def test_disabled(self):
+        """A zero-sized cache stores nothing."""
+        cache = ResultCache(maxsize=0)
+        cache.put(_key("1", []), (1.0,))
+        assert cache.stats()["size"] == 0
+
+
+class TestMemoizedEvaluation:
+    """Test StackService.evaluate with a result cache."""
+
+    def test_hit_applies_the_same_change(self):
+        """A cached result gives the same stack and history as running the program."""
+        cache = ResultCache()
+        program = compile_program("dup * swap 2 * +")
+        service = StackService("memo")
+        service.push_many([9, 3, 4])
+        service.evaluate(program, results=cache)
+        assert service.values() == [9.0, 22.0]
+        service.perform("undo")
+        service.evaluate(program, results=cache)
+        assert service.values() == [9.0, 22.0]
+        assert cache.stats()["hits"] == 1
+        assert service.history()[-1]["operation"] == "eval"
+        service.perform("undo")
+        assert service.values() == [9.0, 3.0, 4.0]
+
+    def test_only_the_values_read_are_keyed(self):
+        """Values below the ones a program reads do not affect its key."""
+        cache = ResultCache()
+        program = compile_program("+")
+        first, second = StackService("a"), StackService("b")
+        first.push_many([1, 2, 3])
+        second.push_many([7, 2, 3])
+        first.evaluate(program, results=cache)
+        second.evaluate(program, results=cache)
+        assert second.values() == [7.0, 5.0]
+        assert cache.stats()["hits"] == 1
+
+    def test_variadic_programs_read_the_whole_stack(self):
+        """Past a variadic operator the whole stack is the input."""
+        cache = ResultCache()
+        program = compile_program("2 sum")
+        first, second = StackService("a"), StackService("b")
+        first.push_many([1, 2, 3])
+        second.push_many([7, 2, 3])
+        first.evaluate(program, results=cache)
+        second.evaluate(program, results=cache)
+        assert (first.values(), second.values()) == ([1.0, 5.0], [7.0, 5.0])
+        assert cache.stats()["hits"] == 0
+
+    def test_errors_and_traces_are_not_cached(self):
+        """Failures always run (and raise); traced runs bypass the cache."""
+        cache = ResultCache()
+        service = StackService("memo")
+        for _ in range(2):
+            with pytest.raises(DivisionByZeroError):
+                service.evaluate(compile_program("1 0 /"), results=cache)
+        assert cache.stats()["size"] == 0
+        steps = service.evaluate(compile_program("1 2 +"), trace=True, results=cache)
+        assert len(steps) == 3
+        assert cache.stats()["hits"] + cache.stats()["misses"] == 2
+
+    def test_exact_modes(self):
+        """Results are cached per numeric mode, in the mode's own values."""
+        cache = ResultCache()
+        program = compile_program("1 3 /")
+        service = StackService("memo", get_backend("fraction"))
+        service.evaluate(program, results=cache)
+        service.evaluate(program, results=cache)
+        assert service.values() == ["1/3", "1/3"]
+        assert cache.stats()["hits"] == 1
+
+
+class TestResultCacheEndpoints:
+    """Test the cache behind POST /eval."""
+
+    def test_eval_uses_the_cache(self):
+        """Repeated evaluations hit the result cache; stats are reported."""
+        cache = ResultCache()
+        app.dependency_overrides[current_result_cache] = lambda: cache
+        client = TestClient(app)
+        params = {"session_id": "memo"}
+        try:
+            for _ in range(3):
+                response = client.post(
+                    f"{API_PREFIX}/eval", json={"program": "6 7 *"}, params=params
+                )
+                assert response.status_code == 200
+            assert response.json()["stack"] == [42.0, 42.0, 42.0]
+            stats = client.get(f"{API_PREFIX}/eval/cache").json()["results"]
+            assert (stats["hits"], stats["misses"]) == (2, 1)
+            assert "rpn_result_cache_hit_ratio" in client.get("/metrics").text
+        finally:
+            app.dependency_overrides.pop(current_result_cache, None)
+            client.delete(f"{API_PREFIX}/session", params=params)
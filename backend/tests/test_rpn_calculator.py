@@ -3,12 +3,14 @@ Unit tests for RPN Calculator domain logic.
 
 These tests validate the core business logic independently of the web framework.
 """
+import struct
 import pytest
 from app.domain.rpn_calculator import RPNCalculator
 from app.core.exceptions import (
     InsufficientOperandsError,
     DivisionByZeroError,
     EmptyStackError,
+    InvalidTokenError,
 )
 
 
@@ -50,6 +52,14 @@ class TestRPNCalculatorBasics:
         calc.push(-17.5)
         assert calc.stack == [-17.5]
 
+    def test_push_rejects_non_finite_values(self):
+        """NaN and infinities (including overflowing literals) are not pushed."""
+        calc = RPNCalculator()
+        for value in (float("nan"), float("inf"), "-inf", "nan", "1e400"):
+            with pytest.raises(InvalidTokenError, match="not a finite number"):
+                calc.push(value)
+        assert calc.stack == []
+
     def test_pop_returns_and_removes_top_value(self):
         """Pop should return and remove the top value."""
         calc = RPNCalculator()
@@ -315,3 +325,100 @@ class TestRPNComplexScenarios:
         stack_copy.append(999)
         assert calc.stack == [1.0, 2.0]
         assert 999 not in calc.stack
+
+
+class TestRPNEvaluate:
+    """Test whole-program evaluation."""
+
+    def test_evaluate_string_program(self):
+        """A program string should be evaluated token by token."""
+        calc = RPNCalculator()
+        calc.evaluate("5 3 + 2 *")
+        assert calc.stack == [16.0]
+
+    def test_evaluate_token_list(self):
+        """A token list may mix numbers and operator names."""
+        calc = RPNCalculator()
+        calc.evaluate([2, 3, "pow", "dup", "add"])
+        assert calc.stack == [16.0]
+
+    def test_evaluate_uses_existing_stack(self):
+        """Programs operate on top of the current stack."""
+        calc = RPNCalculator()
+        calc.push(10)
+        calc.evaluate("4 sub")
+        assert calc.stack == [6.0]
+
+    def test_evaluate_trace(self):
+        """Trace should contain the stack after each token."""
+        calc = RPNCalculator()
+        steps = calc.evaluate("1 2 swap", trace=True)
+        assert steps == [[1.0], [1.0, 2.0], [2.0, 1.0]]
+
+    def test_evaluate_rolls_back_on_error(self):
+        """A failing program should leave the stack untouched."""
+        calc = RPNCalculator()
+        calc.push(7)
+        with pytest.raises(DivisionByZeroError, match="token 3"):
+            calc.evaluate("1 + 0 /")
+        assert calc.stack == [7.0]
+
+    def test_evaluate_unknown_token(self):
+        """Unknown tokens should raise InvalidTokenError."""
+        calc = RPNCalculator()
+        with pytest.raises(InvalidTokenError, match="foo"):
+            calc.evaluate("1 foo")
+        assert calc.stack == []
+
+
+class TestRPNStackStorage:
+    """Test the array-backed stack storage."""
+
+    def test_view_is_read_only_and_zero_copy(self):
+        """The view should expose the stack without copying it."""
+        calc = RPNCalculator()
+        calc.push(1)
+        calc.push(2.5)
+        with calc.view() as values:
+            assert values.readonly
+            assert values.format == "d"
+            assert values.tolist() == [1.0, 2.5]
+        calc.push(3)
+        assert calc.stack == [1.0, 2.5, 3.0]
+
+    def test_load_replaces_stack(self):
+        """Load should replace the whole stack."""
+        calc = RPNCalculator()
+        calc.push(9)
+        calc.load([1, 2, 3])
+        assert calc.stack == [1.0, 2.0, 3.0]
+
+    def test_memory_is_unboxed(self):
+        """Each value should cost about 8 bytes."""
+        calc = RPNCalculator()
+        for value in range(10_000):
+            calc.push(value)
+        assert calc.memory_bytes() < 10_000 * 12
+
+    def test_extend_pushes_many(self):
+        """extend appends numbers and numeric strings in order."""
+        calc = RPNCalculator()
+        calc.push(9)
+        assert calc.extend([1, "2.5", 3.0]) == 3
+        assert calc.stack == [9.0, 1.0, 2.5, 3.0]
+
+    def test_extend_is_all_or_nothing(self):
+        """An invalid or non-finite value pushes nothing."""
+        calc = RPNCalculator()
+        for values in ([1, "x"], [1, float("nan")], [[1]], [1, 10**400]):
+            with pytest.raises(InvalidTokenError):
+                calc.extend(values)
+        assert calc.stack == []
+
+    def test_extend_bytes(self):
+        """Packed little-endian float64 values are appended as is."""
+        calc = RPNCalculator()
+        assert calc.extend_bytes(struct.pack("<3d", 1.0, -2.5, 1e300)) == 3
+        assert calc.stack == [1.0, -2.5, 1e300]
+        with pytest.raises(InvalidTokenError):
+            calc.extend_bytes(b"\x00" * 7)
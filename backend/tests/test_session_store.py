@@ -0,0 +1,441 @@
+"""
+Unit tests for the pluggable session stores.
+"""
+import asyncio
+import fnmatch
+import pytest
+import threading
+import time
+from app.services.session_store import (
+    InMemorySessionStore,
+    ManagerSessionStore,
+    RedisSessionStore,
+    SessionLeaseLostError,
+    SessionLeases,
+    SessionSweeper,
+    create_session_store,
+    start_session_manager,
+)
+from app.services.stack_service import (
+    StackService,
+    async_stack_session,
+    get_session_locks,
+    get_session_store,
+    set_session_store,
+    stack_session,
+)
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for a Redis client."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.sets = 0  # session writes (leases are not counted)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False, px=None):
+        with self._lock:
+            if nx:
+                deadline = self.expiry.get(key)
+                if key in self.data and (deadline is None or deadline > time.monotonic()):
+                    return None
+                self.data[key] = value
+                self.expiry[key] = time.monotonic() + px / 1000
+                return True
+            self.sets += 1
+            self.data[key] = value
+            self.expiry[key] = ex
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self.data.pop(key, None) is not None else 0
+
+    def eval(self, script, numkeys, key, token, *args):
+        # The lease scripts: renew (with a ttl in ms) or delete the key if it holds the token
+        with self._lock:
+            if self.data.get(key) != token:
+                return 0
+            if args:
+                if self.expiry[key] <= time.monotonic():
+                    return 0
+                self.expiry[key] = time.monotonic() + int(args[0]) / 1000
+                return 1
+            del self.data[key]
+            return 1
+
+    def scan_iter(self, match="*"):
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+
+
+@pytest.fixture
+def swap_store():
+    """Install a session store for the duration of a test."""
+    original = get_session_store()
+    yield set_session_store
+    set_session_store(original)
+
+
+class TestSessionState:
+    """Test session serialization."""
+
+    def test_round_trip_keeps_stack_and_history(self):
+        """A restored session should undo and redo like the original."""
+        service = StackService("state")
+        service.push(4)
+        service.push(5)
+        service.multiply()
+        service.undo()
+
+        restored = StackService.from_state("state", service.to_state())
+        assert restored.get_state() == service.get_state()
+        assert restored.redo()["stack"] == [20.0]
+        assert restored.undo()["stack"] == [4.0, 5.0]
+        assert restored.undo()["stack"] == [4.0]
+
+
+class TestInMemorySessionStore:
+    """Test the process-local backend."""
+
+    def test_load_returns_live_instance(self):
+        """The same session id maps to the same object."""
+        store = InMemorySessionStore(StackService)
+        assert store.load("a") is store.load("a")
+        assert len(store) == 1
+        assert store.delete("a")
+        assert not store.delete("a")
+
+    def test_lru_eviction_by_count(self):
+        """The least recently used session is evicted first."""
+        store = InMemorySessionStore(StackService, max_sessions=2)
+        a = store.load("a")
+        store.load("b")
+        assert store.load("a") is a
+        store.load("c")
+        assert store.load("a") is a
+        assert store.stats()["evictions"] == 1
+        assert len(store) == 2
+
+    def test_eviction_by_bytes(self):
+        """Growing a session past the memory budget evicts older sessions."""
+        store = InMemorySessionStore(StackService, max_bytes=20_000)
+        store.load("idle")
+        busy = store.load("busy")
+        for value in range(200):
+            busy.push(value)
+        store.save(busy)
+        stats = store.stats()
+        assert stats["live_sessions"] == 1
+        assert stats["evictions"] == 1
+        assert stats["bytes"] == busy.memory_bytes()
+
+    def test_held_session_is_not_evicted(self):
+        """A session evicted or expired while a request holds it must keep its changes."""
+        now = [0.0]
+        store = InMemorySessionStore(StackService, max_sessions=1, ttl=10, clock=lambda: now[0])
+        with store.lock("held"):
+            service = store.load("held")
+            store.load("a")
+            store.load("b")  # over the count bound: evicts "a", not "held"
+            now[0] = 20.0
+            assert store.sweep() == 1  # "b"
+            service.push(7)
+            store.save(service)
+        assert store.stats()["evictions"] == 1
+        assert len(store) == 1
+        assert store.load("held").get_state()["stack"] == [7.0]
+
+    def test_bytes_follow_deletes(self):
+        """Deleting sessions releases their accounted bytes."""
+        store = InMemorySessionStore(StackService)
+        store.load("a")
+        assert store.stats()["bytes"] > 0
+        store.delete("a")
+        assert store.stats()["bytes"] == 0
+
+    def test_idle_sessions_expire(self):
+        """Sessions idle past the TTL are dropped on access and by sweep."""
+        now = [0.0]
+        store = InMemorySessionStore(StackService, ttl=10, clock=lambda: now[0])
+        first = store.load("a")
+        store.load("b")
+        now[0] = 5.0
+        store.load("b")
+        now[0] = 12.0
+        assert store.sweep() == 1
+        assert len(store) == 1
+        now[0] = 30.0
+        second = store.load("b")
+        assert store.stats()["expirations"] == 2
+        assert store.load("a") is not first
+        assert second.get_state()["stack"] == []
+
+
+class TestRedisSessionStore:
+    """Test the Redis-protocol backend against a fake client."""
+
+    def test_save_and_load(self):
+        """Sessions should round-trip through the client."""
+        client = FakeRedis()
+        store = RedisSessionStore(StackService, client, ttl=60)
+        service = store.load("r1")
+        service.push(3)
+        store.save(service)
+
+        assert client.expiry["rpn:session:r1"] == 60
+        assert store.load("r1").get_state()["stack"] == [3.0]
+        assert len(store) == 1
+        assert store.delete("r1")
+        assert store.load("r1").get_state()["stack"] == []
+
+
+class TestManagerSessionStore:
+    """Test the multiprocessing manager backend."""
+
+    def test_stores_share_sessions(self):
+        """Two stores on the same manager (two workers) see the same session."""
+        manager, sessions, leases = start_session_manager()
+        try:
+            worker_a = ManagerSessionStore(StackService, sessions, leases)
+            worker_b = ManagerSessionStore(StackService, sessions, leases)
+            service = worker_a.load("m1")
+            service.push(8)
+            worker_a.save(service)
+
+            other = worker_b.load("m1")
+            assert other.get_state()["stack"] == [8.0]
+            other.sqrt()
+            worker_b.save(other)
+            assert worker_a.load("m1").get_state()["stack"] == [pytest.approx(8 ** 0.5)]
+            assert len(worker_a) == 1
+        finally:
+            manager.shutdown()
+
+    def test_concurrent_updates_are_not_lost(self):
+        """Workers pushing to one session under its lease should keep every push."""
+        manager, sessions, leases = start_session_manager()
+        try:
+            _push_concurrently(
+                [ManagerSessionStore(StackService, sessions, leases) for _ in range(2)]
+            )
+        finally:
+            manager.shutdown()
+
+    def test_authkey_is_required(self):
+        """The manager backend should refuse to start without a shared secret."""
+        with pytest.raises(ValueError, match="SESSION_MANAGER_AUTHKEY"):
+            create_session_store("manager", StackService, manager_address="127.0.0.1:1")
+
+
+def _push_concurrently(stores, pushes=20):
+    """Push from one thread per store (one per worker) and check no push was lost."""
+
+    def worker(store):
+        for _ in range(pushes):
+            with store.lock("shared"):
+                service = store.load("shared")
+                service.push(1)
+                time.sleep(0.001)  # widen the read-modify-write window
+                store.save(service)
+
+    threads = [threading.Thread(target=worker, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stores[0].load("shared").get_state()["stack"]) == pushes * len(stores)
+
+
+class TestSessionLeases:
+    """Test the cross-process session leases."""
+
+    def test_lease_excludes_other_tokens_until_released(self):
+        """A held lease should be refused to other tokens and freed by its holder only."""
+        leases = SessionLeases()
+        assert leases.acquire("s", "a", 30)
+        assert not leases.acquire("s", "b", 30)
+        assert not leases.release("s", "b")
+        assert leases.release("s", "a")
+        assert leases.acquire("s", "b", 30)
+
+    def test_expired_lease_can_be_taken(self):
+        """A lease left by a dead worker should expire after its ttl."""
+        now = [0.0]
+        leases = SessionLeases(clock=lambda: now[0])
+        assert leases.acquire("s", "a", 30)
+        now[0] = 31.0
+        assert leases.acquire("s", "b", 30)
+        assert not leases.release("s", "a")
+
+    def test_redis_concurrent_updates_are_not_lost(self):
+        """Redis stores sharing a client should serialize updates through the lease."""
+        client = FakeRedis()
+        _push_concurrently([RedisSessionStore(StackService, client) for _ in range(2)])
+        assert not client.scan_iter("rpn:lease:*")
+
+    def test_lease_is_renewed_past_its_ttl(self):
+        """A request holding the lease longer than lock_ttl should keep it and save."""
+        leases = SessionLeases()
+        store = ManagerSessionStore(StackService, {}, leases, lock_ttl=0.1)
+        with store.lock("s"):
+            service = store.load("s")
+            service.push(1)
+            for _ in range(4):
+                time.sleep(0.1)
+                assert not leases.acquire("s", "intruder", 0.1)
+            store.save(service)
+        assert leases.acquire("s", "intruder", 0.1)
+        assert store.load("s").get_state()["stack"] == [1.0]
+
+    def test_async_lease_is_renewed_past_its_ttl(self):
+        """The async lease should be renewed by its heartbeat task while held."""
+        client = FakeRedis()
+        store = RedisSessionStore(StackService, client, lock_ttl=0.1)
+        other = RedisSessionStore(StackService, client, lock_ttl=0.1)
+
+        async def main():
+            async with store.alock("s"):
+                service = await store.aload("s")
+                service.push(1)
+                for _ in range(4):
+                    await asyncio.sleep(0.1)
+                    assert not other._acquire("s", "intruder")
+                await store.asave(service)
+
+        asyncio.run(main())
+        assert client.sets == 1
+        assert not client.scan_iter("rpn:lease:*")
+
+    def test_save_fails_once_lease_is_lost(self):
+        """A request whose lease was taken over should not overwrite the session."""
+        client = FakeRedis()
+        store = RedisSessionStore(StackService, client)
+        with store.lock("s"):
+            service = store.load("s")
+            service.push(1)
+            client.delete("rpn:lease:s")  # expired and taken by another worker
+            assert client.set("rpn:lease:s", "other", nx=True, px=30000)
+            with pytest.raises(SessionLeaseLostError):
+                store.save(service)
+        assert client.sets == 0
+        assert client.get("rpn:lease:s") == "other"
+
+
+class TestStackSessionDependency:
+    """Test the request-scoped read-modify-write."""
+
+    def test_saves_only_when_modified(self, swap_store):
+        """Read-only requests should not write back."""
+        client = FakeRedis()
+        swap_store(RedisSessionStore(StackService, client))
+
+        scope = stack_session("dep")
+        next(scope)
+        with pytest.raises(StopIteration):
+            next(scope)
+        assert client.sets == 0
+
+        scope = stack_session("dep")
+        next(scope).push(1)
+        with pytest.raises(StopIteration):
+            next(scope)
+        assert client.sets == 1
+        assert get_session_store().load("dep").get_state()["stack"] == [1.0]
+
+
+class TestSessionSweeper:
+    """Test the background sweeper thread."""
+
+    def test_sweeps_periodically(self):
+        """The sweeper should call sweep until stopped."""
+        calls = []
+
+        class Store:
+            def sweep(self):
+                calls.append(1)
+                return 0
+
+        sweeper = SessionSweeper(Store, interval=0.01)
+        sweeper.start()
+        deadline = time.monotonic() + 2
+        while len(calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sweeper.stop()
+        assert len(calls) >= 2
+
+
+class SlowStore(InMemorySessionStore):
+    """In-memory store whose async access yields to the event loop."""
+
+    def __init__(self):
+        super().__init__(StackService)
+        self.events = []
+
+    async def aload(self, session_id):
+        await asyncio.sleep(0)
+        return self.load(session_id)
+
+    async def asave(self, service):
+        await asyncio.sleep(0)
+        self.save(service)
+
+
+class TestAsyncStackSession:
+    """Test the async dependency and its per-session locks."""
+
+    @staticmethod
+    async def _request(store, session_id, name):
+        scope = async_stack_session(session_id)
+        service = await scope.__anext__()
+        store.events.append(("enter", name))
+        await asyncio.sleep(0)
+        service.push(1)
+        store.events.append(("exit", name))
+        with pytest.raises(StopAsyncIteration):
+            await scope.__anext__()
+
+    def test_same_session_is_serialized(self, swap_store):
+        """Requests on one session should not interleave."""
+        store = SlowStore()
+        swap_store(store)
+
+        async def main():
+            await asyncio.gather(*(self._request(store, "s", i) for i in range(3)))
+
+        asyncio.run(main())
+        for i in range(0, 6, 2):
+            assert store.events[i][0] == "enter"
+            assert store.events[i + 1] == ("exit", store.events[i][1])
+        assert store.load("s").get_state()["stack"] == [1.0, 1.0, 1.0]
+        assert len(get_session_locks()) == 0
+
+    def test_different_sessions_run_concurrently(self, swap_store):
+        """Requests on different sessions should not wait for each other."""
+        store = SlowStore()
+        swap_store(store)
+
+        async def main():
+            await asyncio.gather(self._request(store, "a", "a"), self._request(store, "b", "b"))
+
+        asyncio.run(main())
+        assert [kind for kind, _ in store.events] == ["enter", "enter", "exit", "exit"]
+
+    def test_blocking_backend_runs_in_thread(self, swap_store):
+        """Serializing stores should round-trip through the async methods."""
+        client = FakeRedis()
+        store = RedisSessionStore(StackService, client)
+
+        async def main():
+            service = await store.aload("r")
+            service.push(2)
+            await store.asave(service)
+            return await store.adelete("r")
+
+        assert asyncio.run(main()) is True
+        assert client.sets == 1
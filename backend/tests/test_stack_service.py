@@ -0,0 +1,135 @@
+"""
+Unit tests for the stack service and its undo/redo history.
+"""
+import pytest
+from app.services.stack_service import StackHistory, StackService
+from app.core.exceptions import DivisionByZeroError
+
+
+class TestStackHistory:
+    """Test the operation-log based history."""
+
+    def test_undo_restores_previous_stack(self):
+        """Undo should revert exactly the last operation."""
+        service = StackService("history-undo")
+        service.push(2)
+        service.push(3)
+        service.add()
+        state = service.undo()
+        assert state["stack"] == [2.0, 3.0]
+        state = service.undo()
+        assert state["stack"] == [2.0]
+
+    def test_redo_reapplies_undone_operation(self):
+        """Redo should replay the delta that was undone."""
+        service = StackService("history-redo")
+        service.push(9)
+        service.sqrt()
+        service.undo()
+        state = service.redo()
+        assert state["stack"] == [3.0]
+        assert state["redo_size"] == 0
+
+    def test_new_operation_clears_redo(self):
+        """A new mutation after undo discards the redo log."""
+        service = StackService("history-branch")
+        service.push(1)
+        service.undo()
+        service.push(2)
+        with pytest.raises(ValueError, match="redo"):
+            service.redo()
+
+    def test_undo_clear(self):
+        """Undoing clear should bring back the whole stack."""
+        service = StackService("history-clear")
+        for value in (1, 2, 3):
+            service.push(value)
+        service.clear()
+        assert service.undo()["stack"] == [1.0, 2.0, 3.0]
+
+    def test_failed_operation_is_not_logged(self):
+        """Operations that raise should not be recorded."""
+        service = StackService("history-error")
+        service.push(1)
+        service.push(0)
+        with pytest.raises(DivisionByZeroError):
+            service.divide()
+        assert service.get_state()["history_size"] == 2
+        assert service.undo()["stack"] == [1.0]
+
+    def test_undo_without_history(self):
+        """Undo on a fresh session should fail."""
+        with pytest.raises(ValueError, match="undo"):
+            StackService("history-empty").undo()
+
+    def test_versions_share_structure(self):
+        """Each version only stores the values its operation pushed."""
+        service = StackService("history-sharing")
+        for value in range(100):
+            service.push(value)
+        service.add()
+        entries = dict(service._history.entries())
+        latest, previous = entries[101], entries[100]
+        assert (latest.consumed, latest.produced) == (2, 1)
+        assert latest.stack.top(1) == (197.0,)
+        assert latest.stack._node[2] is previous.stack._node[2][2]
+
+    def test_history_stores_segments(self):
+        """A bulk push is one float64 segment; single pushes are compacted over time."""
+        service = StackService("history-memory")
+        service.push_many(range(100_000))
+        assert service._history.memory_bytes() < 100_000 * 9
+        service = StackService("history-compaction")
+        for value in range(1000):
+            service.perform("push", value)
+        entries = service._history.entries()
+        assert entries[0][1].stack.nodes <= 65
+        assert entries[-1][1].stack.to_list() == [float(v) for v in range(1000)]
+        service.jump(entries[0][0])
+        assert service.values() == [float(v) for v in range(900)]
+
+    def test_restore_any_version(self):
+        """Restore should jump to a version and keep later ones for redo."""
+        service = StackService("history-restore")
+        service.push(1)
+        service.push(2)
+        service.add()
+        state = service.restore(1)
+        assert state["stack"] == [1.0]
+        assert state["version"] == 1
+        assert service.redo()["stack"] == [1.0, 2.0]
+        assert service.restore(3)["stack"] == [3.0]
+
+    def test_restore_unknown_version(self):
+        """Restoring a version outside the window should fail."""
+        service = StackService("history-restore-missing")
+        with pytest.raises(ValueError, match="not available"):
+            service.restore(5)
+
+    def test_history_listing(self):
+        """History lists every retained version and marks the current one."""
+        service = StackService("history-listing")
+        service.push(4)
+        service.sqrt()
+        service.undo()
+        items = service.history()
+        assert [item["operation"] for item in items] == ["init", "push(4)", "sqrt"]
+        assert [item["current"] for item in items] == [False, True, False]
+
+    def test_evaluate_is_one_entry(self):
+        """A whole program is undone in one step."""
+        from app.domain.compiler import compile_program
+
+        service = StackService("history-eval")
+        service.push(3)
+        service.evaluate(compile_program("dup * 1 +"))
+        assert service.get_state()["stack"] == [10.0]
+        assert service.undo()["stack"] == [3.0]
+
+    def test_history_is_bounded(self):
+        """Only the most recent operations are kept."""
+        history = StackHistory(max_history=3)
+        for value in range(5):
+            history.record(f"push({value})", 0, (float(value),))
+        assert history.size == 3
+        assert [version for version, _ in history.entries()] == [2, 3, 4, 5]
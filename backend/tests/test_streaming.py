@@ -0,0 +1,143 @@
+"""
+Unit tests for streaming evaluation, its service/API integration and the CLI.
+"""
+from array import array
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import API_PREFIX
+from app.core.exceptions import (
+    DivisionByZeroError,
+    InsufficientOperandsError,
+    InvalidTokenError,
+)
+from app.domain.numeric import get_backend
+from app.domain.rpn_calculator import RPNCalculator, create_calculator, main
+from app.domain.streaming import MAX_TOKEN_LENGTH, StreamEvaluator, read_chunks
+from app.main import app
+from app.services.stack_service import StackService
+
+
+def _stream(chunks, numeric=None):
+    calc = RPNCalculator() if numeric is None else create_calculator(numeric)
+    calc.streaming().run(chunks)
+    return calc.stack
+
+
+class TestStreamEvaluator:
+    """Test feeding programs in chunks."""
+
+    def test_tokens_split_across_chunks(self):
+        """A token cut by a chunk boundary runs once it is complete."""
+        assert _stream(["1", "2 3", "4 +", " 1", "0 *"]) == [460.0]
+        assert _stream([b"2 3 p", b"ow\n"]) == [8.0]
+
+    def test_multibyte_characters_split_across_chunks(self):
+        """UTF-8 sequences cut by a chunk boundary are decoded whole."""
+        data = "1\u00a02 +".encode()  # a no-break space: two bytes, and whitespace
+        assert _stream([data[:2], data[2:]]) == [3.0]
+        with pytest.raises(InvalidTokenError, match="'é'"):
+            _stream([b"1 \xc3", b"\xa9"])
+
+    def test_matches_compiled_evaluation(self):
+        """Streaming and compiled evaluation agree, variadic operators included."""
+        program = "1 2 + 3 * 4 5 6 3 sum depth mean 7 8 1 pick rot swap drop 7 %"
+        calc = RPNCalculator()
+        calc.evaluate(program)
+        assert _stream([program]) == calc.stack
+
+    def test_errors_report_the_token(self):
+        """Errors carry the index of the failing token; earlier tokens stay applied."""
+        stack = array("d")
+        evaluator = StreamEvaluator(stack)
+        with pytest.raises(InsufficientOperandsError, match="token 3: '\\+'"):
+            evaluator.run(["1 dup", " + +"])
+        assert list(stack) == [2.0]
+        with pytest.raises(DivisionByZeroError, match="token 2"):
+            _stream(["1 0 /"])
+        with pytest.raises(InvalidTokenError, match="Unknown token"):
+            _stream(["1 frobnicate"])
+
+    def test_exact_backend(self):
+        """Literals are parsed by the calculator's backend."""
+        assert _stream(["1 3 / 1 6 / +"], get_backend("fraction")) == [0.5]
+        with pytest.raises(InvalidTokenError, match="not an integer"):
+            _stream(["2.5"], get_backend("integer"))
+
+    def test_token_length_is_bounded(self):
+        """Input without whitespace is not buffered forever."""
+        with pytest.raises(InvalidTokenError, match="longer than"):
+            _stream(["1" * (MAX_TOKEN_LENGTH + 1)])
+
+    def test_read_chunks(self, tmp_path):
+        """Files are read in chunks through a memory map; empty files are fine."""
+        path = tmp_path / "program.rpn"
+        path.write_text("1 2 +\n" * 100)
+        assert len(list(read_chunks(str(path), 64))) == 10
+        assert _stream(read_chunks(str(path), 7)) == [3.0] * 100
+        empty = tmp_path / "empty.rpn"
+        empty.write_bytes(b"")
+        assert _stream(read_chunks(str(empty))) == []
+
+
+class TestStreamingService:
+    """Test streaming evaluation through the service and the API."""
+
+    def test_service_stream_is_atomic(self):
+        """A failed stream restores the stack; a good one is one undo step."""
+        service = StackService("stream")
+        service.perform("push", 5)
+        with pytest.raises(DivisionByZeroError):
+            with service.streaming() as evaluator:
+                evaluator.feed("1 2 + 0 /")
+        assert service.values() == [5.0]
+        with service.streaming() as evaluator:
+            evaluator.feed("2 *")
+            evaluator.feed(" 1")
+        assert service.values() == [10.0, 1.0]
+        service.perform("undo")
+        assert service.values() == [5.0]
+
+    def test_stream_endpoint(self):
+        """POST /eval/stream runs a chunked body and returns the stack."""
+        client = TestClient(app)
+        params = {"session_id": "stream"}
+
+        def body():
+            yield b"1 2 "
+            yield b"+ 4 *"
+
+        response = client.post(f"{API_PREFIX}/eval/stream", content=body(), params=params)
+        assert response.json()["stack"] == [12.0]
+        response = client.post(f"{API_PREFIX}/eval/stream", content=b"+", params=params)
+        assert response.status_code == 400
+        assert client.get(f"{API_PREFIX}/stack", params=params).json()["stack"] == [12.0]
+        client.delete(f"{API_PREFIX}/session", params=params)
+
+
+class TestCommandLine:
+    """Test python -m app.domain.rpn_calculator run."""
+
+    def test_run_file(self, tmp_path, capsys):
+        """The final stack is printed one value per line."""
+        path = tmp_path / "program.rpn"
+        path.write_text("1 2 +\n10 20 30 3 mean")
+        assert main(["run", str(path)]) == 0
+        assert capsys.readouterr().out == "3.0\n20.0\n"
+
+    def test_run_exact_mode(self, tmp_path, capsys):
+        """--numeric selects the backend."""
+        path = tmp_path / "program.rpn"
+        path.write_text("1 3 /")
+        assert main(["run", "--numeric", "fraction", str(path)]) == 0
+        assert capsys.readouterr().out == "1/3\n"
+
+    def test_errors_exit_non_zero(self, tmp_path, capsys):
+        """Evaluation errors and missing files are reported on stderr."""
+        path = tmp_path / "program.rpn"
+        path.write_text("1 0 /")
+        assert main(["run", str(path)]) == 1
+        assert "Cannot divide by zero" in capsys.readouterr().err
+        assert main(["run", str(tmp_path / "missing.rpn")]) == 1
+        path.write_text("1e308 1e308 +")
+        assert main(["run", str(path)]) == 1
+        assert "not a finite number" in capsys.readouterr().err
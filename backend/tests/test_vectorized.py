@@ -0,0 +1,62 @@
+"""
+Unit tests for vectorized (NumPy) program evaluation.
+"""
+import math
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.domain.vectorized import evaluate_vectorized
+from app.domain.rpn_calculator import RPNCalculator
+from app.core.exceptions import InsufficientOperandsError, InvalidOperationError
+
+
+class TestVectorizedEvaluation:
+    """Test evaluating one program over many rows."""
+
+    def test_matches_scalar_calculator(self):
+        """Every row should match the scalar calculator."""
+        program = "dup * swap 2 ^ + sqrt 3 / 1 swap - dup drop 4 +"
+        xs = [1.0, 2.5, -3.0, 10.0]
+        ys = [4.0, 0.5, 7.0, -2.0]
+        result = evaluate_vectorized(program, [xs, ys])
+        for row, (x, y) in enumerate(zip(xs, ys)):
+            calc = RPNCalculator()
+            calc.push(x)
+            calc.push(y)
+            calc.evaluate(program)
+            assert [column[row] for column in result.columns()] == pytest.approx(calc.stack)
+
+    def test_literal_only_program(self):
+        """Programs without inputs evaluate to a single row."""
+        result = evaluate_vectorized("2 3 +", [])
+        assert result.rows == 1
+        assert result.columns() == [[5.0]]
+
+    def test_division_by_zero_is_masked(self):
+        """Rows dividing by zero are reported instead of aborting the batch."""
+        result = evaluate_vectorized("/", [[1.0, 2.0, 3.0], [1.0, 0.0, 2.0]])
+        assert result.division_by_zero.tolist() == [False, True, False]
+        assert result.columns() == [[1.0, None, 1.5]]
+
+    def test_invalid_operations_are_masked(self):
+        """Negative sqrt and non-finite powers are flagged per row."""
+        result = evaluate_vectorized("sqrt 400 ^", [[4.0, -1.0, 100.0]])
+        assert result.invalid_operation.tolist() == [False, True, True]
+        assert result.columns()[0][0] == math.pow(2.0, 400)
+
+    def test_first_error_wins(self):
+        """A row keeps the first error it hits."""
+        result = evaluate_vectorized("/ sqrt", [[1.0, -1.0], [0.0, 1.0]])
+        assert result.division_by_zero.tolist() == [True, False]
+        assert result.invalid_operation.tolist() == [False, True]
+
+    def test_insufficient_operands(self):
+        """Structural errors still fail the whole batch."""
+        with pytest.raises(InsufficientOperandsError):
+            evaluate_vectorized("+", [[1.0, 2.0]])
+
+    def test_mismatched_columns(self):
+        """Columns of different lengths are rejected."""
+        with pytest.raises(InvalidOperationError):
+            evaluate_vectorized("+", [[1.0, 2.0], [1.0]])